@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Adds many new studies to the phylesystem with one call to
+POST v1/studies/ingest (one push per shard), and waits for the result.
+
+Each NexSON file is sent as a new study. Files named for a phylografter
+study ID (e.g. "pg_123.json" or "123.json") keep that ID, unless --mint-ids
+is given; other studies get a new ID.
+
+    bin/bulk_ingest.py https://api.opentreeoflife.org/phylesystem token.txt studies/*.json
+
+The GitHub login of the token must be listed in the API's
+bulk_ingest_logins setting.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import requests
+
+def iter_nexson_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fn in sorted(files):
+                    if fn.endswith('.json'):
+                        yield os.path.join(root, fn)
+        else:
+            yield path
+
+def study_id_for_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.startswith('pg_') or name.isdigit():
+        return name
+    return None
+
+def iter_ndjson(paths, mint_ids):
+    "Yields one line of NDJSON for each file (read one at a time)"
+    for path in paths:
+        with open(path) as inp:
+            nexson = json.load(inp)
+        study_id = None if mint_ids else study_id_for_path(path)
+        if study_id is None:
+            doc = nexson
+        else:
+            doc = {'id': study_id, 'nexson': nexson}
+        yield json.dumps(doc, separators=(',', ':')) + '\n'
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk ingest of NexSON studies')
+    parser.add_argument('api_url', help='base URL of the phylesystem API, e.g. https://api.opentreeoflife.org/phylesystem')
+    parser.add_argument('token_file', help='file holding a GitHub OAuth token')
+    parser.add_argument('paths', nargs='+', help='NexSON files, or directories of them')
+    parser.add_argument('--mint-ids', action='store_true', default=False,
+                        help='give every study a new ID, even if its file is named for one')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help='seconds between checks of the status of the ingest')
+    args = parser.parse_args()
+    auth_token = open(args.token_file).readline().strip()
+    paths = list(iter_nexson_paths(args.paths))
+    # the body is sent from a file, so that it has a Content-Length (the API
+    #   refuses bodies over its size limit, and chunked ones have no length)
+    body = tempfile.TemporaryFile()
+    for line in iter_ndjson(paths, args.mint_ids):
+        body.write(line)
+    body.seek(0)
+    print 'Sending {} studies...'.format(len(paths))
+    url = '{}/v1/studies/ingest'.format(args.api_url.rstrip('/'))
+    r = requests.post(url,
+                      params={'auth_token': auth_token},
+                      data=body,
+                      headers={'Content-Type': 'application/x-ndjson'})
+    body.close()
+    if r.status_code != 202:
+        print 'Bulk ingest failed (status {s}):\n{t}'.format(s=r.status_code, t=r.text.encode('utf-8'))
+        sys.exit(1)
+    status_url = r.json()['status_url']
+    print 'Waiting for {}'.format(status_url)
+    while True:
+        job = requests.get(status_url).json()
+        if job['status'] in ('done', 'failed', 'cancelled'):
+            break
+        time.sleep(args.poll_interval)
+    if job['status'] == 'cancelled':
+        print 'Bulk ingest was cancelled'
+        sys.exit(1)
+    if job['status'] == 'failed':
+        print 'Bulk ingest failed:\n{}'.format(json.dumps(job['error'], indent=2))
+        sys.exit(1)
+    result = job['result']
+    num_failed = 0
+    for outcome in result['studies']:
+        if 'error' in outcome:
+            num_failed += 1
+            print '{p} (line {l}): {e}'.format(p=paths[outcome['line'] - 1], l=outcome['line'], e=outcome['error'])
+    for commit in result['commits']:
+        print '{s}: {n} studies in commit {c}'.format(s=commit['shard'], n=len(commit['study_ids']), c=commit['sha'])
+    print '{a} studies added, {f} failed'.format(a=len(result['studies']) - num_failed, f=num_failed)
+    if num_failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
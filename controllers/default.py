@@ -16,14 +16,20 @@ from peyotl.collections_store import OWNER_ID_PATTERN, \
 from peyotl.collections_store.validation import validate_collection
 from peyotl.amendments import AMENDMENT_ID_PATTERN
 from peyotl.amendments.validation import validate_amendment
+from peyotl.nexson_validation._validation_base import NexsonAnnotationAdder
 from peyotl.nexson_syntax import get_empty_nexson, \
                                  extract_supporting_file_messages, \
                                  PhyloSchema, \
                                  read_as_json, \
                                  BY_ID_HONEY_BADGERFISH
-from peyotl.external import import_nexson_from_treebase
 from github import Github, BadCredentialsException
 import api_utils
+from fanout import Fanout
+import json_stream
+import nexson_projection
+import jobs
+import json_patch
+import deferred_merge
 from gluon.tools import fetch
 from urllib import urlencode, quote_plus
 from gluon.html import web2pyHTMLParser
@@ -74,6 +80,16 @@ ot_markdown_tags = list(set( bleach.sanitizer.ALLOWED_TAGS + allowed_curation_co
 ot_cleaner = Cleaner(tags=ot_markdown_tags)
 
 def _markdown_to_html(markdown_src='', open_links_in_new_window=False):
+    # the same comments and descriptions are rendered over and over, so cache the results
+    cache = api_utils.get_markdown_cache(request)
+    key = api_utils.markdown_cache_key(markdown_src, open_links_in_new_window)
+    html = cache.get(key)
+    if html is None:
+        html = _render_markdown_to_html(markdown_src, open_links_in_new_window)
+        cache.put(key, html)
+    return html
+
+def _render_markdown_to_html(markdown_src='', open_links_in_new_window=False):
     html = XML(markdown(markdown_src, extras={'link-patterns':None}, link_patterns=[(link_regex, link_replace)]).encode('utf-8'), sanitize=False).flatten()
     # scrub HTML output with bleach
     html = ot_cleaner.clean(html)
@@ -87,11 +103,58 @@ def render_markdown(src):
     # Convert POSTed Markdown to HTML (e.g., for previews in web UI)
     return _markdown_to_html( src, open_links_in_new_window=True )
 
+def _stream_json(obj):
+    """Returns an iterator over the JSON (or JSONP, if a callback was requested)
+    serialization of a dict or list `obj`, which web2py writes to the client
+    chunk by chunk instead of rendering the whole document into one string.
+    Other values are returned unchanged."""
+    if not isinstance(obj, (dict, list)):
+        return obj
+    cb_func_name = request.vars.get('jsoncallback') or request.vars.get('callback')
+    if cb_func_name:
+        response.headers['Content-Type'] = 'application/jsonp'
+        return json_stream.iter_jsonp(cb_func_name, obj)
+    response.headers['Content-Type'] = 'application/json'
+    return json_stream.iter_json(obj)
+
 def _raise_HTTP_from_msg(msg):
     raise HTTP(400, json.dumps({"error": 1, "description": msg}))
 
 
 
+def _run_as_job(fn):
+    """Calls `fn` (which may raise HTTP like a request handler) in a
+    background job, reporting an HTTP error as the job's error"""
+    try:
+        return fn()
+    except HTTP as x:
+        try:
+            details = json.loads(x.body)
+        except (TypeError, ValueError):
+            details = str(x.body)
+        raise jobs.JobError(x.status, details)
+
+def jobs_status(*args, **kwargs):
+    """Handle an incoming URL targeting /v1/jobs/{job ID}, which returns the
+    status of a background job (e.g. a PUT with async=true), or cancels it
+    (DELETE, by the curator who started it)
+    """
+    response.view = 'generic.json'
+    if request.env.request_method not in ('GET', 'DELETE'):
+        raise HTTP(405, json.dumps({"error": 1, "description": "jobs only support GET and DELETE"}))
+    if len(request.args) < 2:
+        raise HTTP(400, json.dumps({"error": 1, "description": 'job ID expected after "jobs/"'}))
+    registry = api_utils.get_job_registry(request)
+    job = registry.get(request.args[1])
+    if job is None:
+        raise HTTP(404, json.dumps({"error": 1, "description": 'job "{}" not found'.format(request.args[1])}))
+    if request.env.request_method == 'DELETE':
+        auth_info = api_utils.authenticate(**kwargs)
+        if job.get('login') != auth_info['login']:
+            raise HTTP(403, json.dumps({"error": 1, "description": 'Only the curator who started a job can cancel it'}))
+        job = registry.cancel(job['id'])
+    return json.dumps(job)
+
 def check_not_read_only():
     if api_utils.READ_ONLY_MODE:
         raise HTTP(403, json.dumps({"error": 1, "description": "phylesystem-api running in read-only mode"}))
@@ -317,11 +380,233 @@ def exclude_tree_from_synth(study_id=None, tree_id=None, **kwargs):
     return trees_in_synth(kwargs)
 
 
-def study_list():
+# arguments of study_list that select a page of studies from the study index
+_STUDY_LIST_ARGS = ('limit', 'offset', 'shard', 'curator', 'year', 'has_doi', 'include_summary')
+def study_list(*valist, **kwargs):
+    """Without arguments, returns a JSON array of every study ID.
+    With any of the paging, filtering or summary arguments (`limit`,
+    `offset`, `shard`, `curator`, `year`, `has_doi`, `include_summary`),
+    returns a page of the matching studies, served from the study index.
+    """
+    response.view = 'generic.json'
+    if not kwargs:
+        # called as /study_list rather than through v1
+        kwargs = dict(request.vars)
+    if not any(kwargs.get(a) is not None for a in _STUDY_LIST_ARGS):
+        phylesystem = api_utils.get_phylesystem(request)
+        studies = phylesystem.get_study_ids()
+        return json.dumps(studies)
+    limit, offset = api_utils.read_paging(kwargs)
+    year = kwargs.get('year')
+    if year is not None:
+        try:
+            year = int(year)
+        except ValueError:
+            raise HTTP(400, json.dumps({"error": 1, "description": '"year" must be an integer'}))
+    has_doi = kwargs.get('has_doi')
+    if has_doi is not None:
+        has_doi = api_utils.read_bool_arg(kwargs, 'has_doi', None)
+    include_summary = api_utils.read_bool_arg(kwargs, 'include_summary', False)
+    index = api_utils.get_study_index(request)
+    if not index.ready:
+        response.headers['Retry-After'] = '60'
+        raise HTTP(503, json.dumps({"error": 1, "description": "The study index is being built. Try again later."}),
+                   **(response.headers))
+    matches = index.find_studies(shard=kwargs.get('shard'),
+                                 curator=kwargs.get('curator'),
+                                 year=year,
+                                 has_doi=has_doi)
+    end = len(matches) if limit is None else offset + limit
+    page = matches[offset:end]
+    if include_summary:
+        history_index = api_utils.get_history_index(request, 'nexson')[0]
+        studies = [_study_list_entry(study_id, summary, history_index) for study_id, summary in page]
+    else:
+        studies = [study_id for study_id, summary in page]
+    return json.dumps({'studies': studies,
+                       'total': len(matches),
+                       'offset': offset,
+                       'next_offset': end if end < len(matches) else None})
+
+def _study_list_entry(study_id, summary, history_index):
+    "The compact description of a study in study_list, with its last commit on master"
+    entry = {'id': study_id,
+             'shard': summary.get('shard'),
+             'doi': summary.get('doi'),
+             'year': summary.get('year'),
+             'curators': summary.get('curators', []),
+             'num_trees': summary.get('num_trees'),
+             'num_otus': summary.get('num_otus'),
+             'last_commit': None}
+    history = history_index.history(study_id, limit=1)
+    if history:
+        c = history[0]
+        entry['last_commit'] = {'sha': c['id'],
+                                'date': c['date_ISO_8601'],
+                                'author_name': c['author_name'],
+                                'message_subject': c['message_subject']}
+    return entry
+
+def studies(*args, **kwargs):
+    """Handle an incoming URL targeting /v1/studies/
+    This includes:
+        POST /v1/studies/batch
+        POST /v1/studies/ingest
+    """
+    if request.env.request_method == 'OPTIONS':
+        "A simple method for approving CORS preflight request"
+        if request.env.http_access_control_request_method:
+             response.headers['Access-Control-Allow-Methods'] = request.env.http_access_control_request_method
+        if request.env.http_access_control_request_headers:
+             response.headers['Access-Control-Allow-Headers'] = request.env.http_access_control_request_headers
+        raise HTTP(200, T("OPTIONS!"), **(response.headers))
+    assert request.args[0].lower() == 'studies'
+    if len(request.args) < 2:
+        raise HTTP(404, T('No method specified! Try studies/batch'))
+    api_call = request.args[1]   # ignore anything later in the URL
+    if api_call == 'batch':
+        if request.env.request_method != 'POST':
+            raise HTTP(405, json.dumps({"error": 1, "description": "studies/batch requires a POST"}))
+        return _studies_batch(kwargs)
+    if api_call == 'ingest':
+        if request.env.request_method != 'POST':
+            raise HTTP(405, json.dumps({"error": 1, "description": "studies/ingest requires a POST"}))
+        return _studies_ingest(kwargs)
+    raise HTTP(404, T('No such method as studies/{}'.format(api_call)))
+
+def _studies_ingest(kwargs):
+    """Adds many new studies (NDJSON, one NexSON document or {"id", "nexson"}
+    per line) as a background job, with one push per shard. Only the
+    GitHub logins in the bulk_ingest_logins setting may do this.
+    """
     response.view = 'generic.json'
+    check_not_read_only()
+    auth_info = api_utils.authenticate(**kwargs)
+    allowed_logins = api_utils.read_settings(request, 'bulk_ingest')[0]
+    if auth_info['login'] not in allowed_logins:
+        raise HTTP(403, json.dumps({"error": 1,
+                                    "description": 'Bulk ingests are limited to the logins in the "bulk_ingest_logins" setting'}))
+    staging_dir = api_utils.spool_bulk_ingest(request, request.body)
+    # the job runs after this request has been answered
+    job_request = api_utils.detach_request(request)
+    auth_token = kwargs.get('auth_token')
+    def __ingest():
+        outcomes, commits = api_utils.run_bulk_ingest(job_request, staging_dir, auth_info)
+        # one push for each shard that was written
+        for commit in commits:
+            __deferred_push_to_gh_call(job_request, commit['study_ids'][0], doc_type='nexson', auth_token=auth_token)
+        return {'studies': outcomes,
+                'commits': commits}
+    registry = api_utils.get_job_registry(request)
+    job = registry.create('bulk_ingest', login=auth_info['login'])
+    api_utils.get_write_job_pool(request).submit(registry.run, job['id'], _run_as_job, __ingest)
+    status_url = api_utils.compose_job_status_url(request, job['id'])
+    response.status = 202
+    response.headers['Location'] = status_url
+    return json.dumps({'error': 0,
+                       'job_id': job['id'],
+                       'status': job['status'],
+                       'status_url': status_url})
+
+def _studies_batch(kwargs):
+    """Streams one JSON object per line (NDJSON) for each requested study (or
+    tree of a study), in the order requested. The studies are read
+    concurrently; a failure is reported in that item's line, as "error".
+    """
+    try:
+        body = kwargs.get('studies')
+        if body is None:
+            body = request.body.read()
+        if not isinstance(body, (dict, list)):
+            body = json.loads(body)
+        if isinstance(body, dict):
+            body = body['studies']
+        items = []
+        for item in body:
+            if not isinstance(item, dict):
+                item = {'id': item}
+            if not item.get('id'):
+                raise ValueError('study without an "id"')
+            items.append(item)
+    except Exception as x:
+        raise HTTP(400, json.dumps({"error": 1,
+                                    "description": 'Expecting a JSON list of study IDs or of objects with "id" and optional "tree" and "format" properties ({})'.format(x)}))
+    max_workers, max_studies = api_utils.read_settings(request, 'batch')
+    if len(items) > max_studies:
+        raise HTTP(400, json.dumps({"error": 1,
+                                    "description": 'At most {} studies can be fetched in one batch'.format(max_studies)}))
     phylesystem = api_utils.get_phylesystem(request)
-    studies = phylesystem.get_study_ids()
-    return json.dumps(studies)
+    pool = api_utils.get_batch_pool(request)
+    def __iter_lines():
+        # keep a bounded number of reads ahead of the line being written
+        pending = []
+        for item in items:
+            pending.append((item, pool.submit(_fetch_study_for_batch, phylesystem, item)))
+            if len(pending) > max_workers:
+                for chunk in __item_lines(*pending.pop(0)):
+                    yield chunk
+        for item, task in pending:
+            for chunk in __item_lines(item, task):
+                yield chunk
+    def __item_lines(item, task):
+        try:
+            result = task.result()
+        except HTTP as x:
+            result = {'id': item['id'], 'error': x.body, 'status': x.status}
+        except Exception as x:
+            result = {'id': item['id'], 'error': str(x)}
+        for chunk in json_stream.iter_json(result):
+            yield chunk
+        yield '\n'
+    response.headers['Content-Type'] = 'application/x-ndjson'
+    return __iter_lines()
+
+def _fetch_study_for_batch(phylesystem, item):
+    "Returns the response object of one item of a studies/batch request"
+    study_id = item['id']
+    tree_id = item.get('tree')
+    repo_nexml2json = phylesystem.repo_nexml2json
+    content = 'tree' if tree_id else 'study'
+    options = dict(item)
+    options.setdefault('output_nexml2json', repo_nexml2json)
+    try:
+        schema = PhyloSchema(schema=item.get('format'),
+                             content=content,
+                             content_id=tree_id,
+                             repo_nexml2json=repo_nexml2json,
+                             output_nexml2json=options['output_nexml2json'])
+    except ValueError as x:
+        raise HTTP(400, str(x))
+    native = (content == 'study') and schema.format_str == 'nexson' and schema.version == repo_nexml2json
+    # Whole studies converted by a GET carry the validation annotation, which
+    #   is not added here, so only trees share the conversion cache.
+    cacheable = (content == 'tree')
+    conversion_cache = api_utils.get_conversion_cache(request)
+    try:
+        known_head_sha, blob_sha = api_utils.get_doc_blob_sha(phylesystem, study_id)
+    except:
+        known_head_sha, blob_sha = None, None
+    if blob_sha and cacheable:
+        data = conversion_cache.get(api_utils.conversion_cache_key(blob_sha, schema, content, tree_id, options))
+        if data is not None:
+            return {'id': study_id, 'tree': tree_id, 'sha': known_head_sha, 'data': data}
+    try:
+        study_nexson, head_sha, wip_map = phylesystem.return_study(study_id, return_WIP_map=True)
+    except:
+        raise HTTP(404, 'Study #%s GET failure' % study_id)
+    if native:
+        data = study_nexson
+    else:
+        if cacheable and head_sha != known_head_sha:
+            # master moved before the study was read
+            blob_sha = phylesystem.get_blob_sha_for_study_id(study_id, head_sha)
+        src_schema = PhyloSchema('nexson', version=repo_nexml2json)
+        data = schema.convert(study_nexson, serialize=not schema.is_json(), src_schema=src_schema)
+        if not data:
+            raise HTTP(404, 'tree "{t}" not found in study "{s}"'.format(t=tree_id, s=study_id))
+        if blob_sha and cacheable:
+            conversion_cache.put(api_utils.conversion_cache_key(blob_sha, schema, content, tree_id, options), data)
+    return {'id': study_id, 'tree': tree_id, 'sha': head_sha, 'data': data}
 
 def phylesystem_config():
     response.view = 'generic.json'
@@ -483,7 +768,7 @@ def collections(*args, **kwargs):
         collection_list = []
         for id, props in docstore.iter_doc_objs():
             # reckon and add 'lastModified' property, based on commit history?
-            latest_commit = docstore.get_version_history_for_doc_id(id)[0]
+            latest_commit = (api_utils.get_version_history(request, docstore, id, 'collection', limit=1) or [{}])[0]
             props.update({
                 'id': id,
                 'lastModified': {
@@ -649,6 +934,20 @@ def collection(*args, **kwargs):
         # _LOG.debug('parent_sha = {}'.format(parent_sha))
         # return the correct nexson of study_id, using the specified view
         collections = api_utils.get_tree_collection_store(request)
+        # answer conditional GETs before reading the collection
+        try:
+            known_head_sha, blob_sha = api_utils.get_doc_blob_sha(collections, collection_id, parent_sha)
+        except:
+            known_head_sha, blob_sha = None, None
+        jsonp_callback = kwargs.get('jsoncallback', None) or kwargs.get('callback', None)
+        history_limit, history_offset = api_utils.read_history_paging(kwargs)
+        include_comment_html = api_utils.read_bool_arg(kwargs, 'include_comment_html', True)
+        def __etag(blob_sha, head_sha):
+            # the response also holds the head SHA and the WIP branches (branch2sha)
+            return api_utils.compose_etag('collection', blob_sha, jsonp_callback, history_limit, history_offset, include_comment_html,
+                                          head_sha, api_utils.get_wip_branch_shas(collections, collection_id))
+        if blob_sha:
+            api_utils.raise_if_not_modified(request, response, __etag(blob_sha, known_head_sha))
         try:
             r = collections.return_doc(collection_id, commit_sha=parent_sha, return_WIP_map=True)
         except:
@@ -656,13 +955,22 @@ def collection(*args, **kwargs):
             raise HTTP(404, json.dumps({"error": 1, "description": "Collection '{}' GET failure".format(collection_id)}))
         try:
             collection_json, head_sha, wip_map = r
+            if head_sha != known_head_sha:
+                # master moved before the collection was read
+                try:
+                    known_head_sha, blob_sha = api_utils.get_doc_blob_sha(collections, collection_id, head_sha)
+                    response.headers['ETag'] = __etag(blob_sha, known_head_sha)
+                except:
+                    response.headers.pop('ETag', None)
             ## if returning_full_study:  # TODO: offer bare vs. full output (w/ history, etc)
-            version_history = collections.get_version_history_for_doc_id(collection_id)
-            try:
-                # pre-render internal description (assumes markdown!)
-                comment_html = _markdown_to_html(collection_json['description'], open_links_in_new_window=True )
-            except:
-                comment_html = ''
+            version_history = api_utils.get_version_history(request, collections, collection_id, 'collection',
+                                                            limit=history_limit, offset=history_offset)
+            if include_comment_html:
+                try:
+                    # pre-render internal description (assumes markdown!)
+                    comment_html = _markdown_to_html(collection_json['description'], open_links_in_new_window=True )
+                except:
+                    comment_html = ''
         except:
             # _LOG.exception('GET failed')
             e = sys.exc_info()[0]
@@ -682,12 +990,13 @@ def collection(*args, **kwargs):
         result = {'sha': head_sha,
                  'data': collection_json,
                  'branch2sha': wip_map,
-                 'commentHTML': comment_html,
                  'external_url': external_url,
                  }
+        if include_comment_html:
+            result['commentHTML'] = comment_html
         if version_history:
             result['versionHistory'] = version_history
-        return result
+        return _stream_json(result)
 
     if request.env.request_method == 'PUT':
         if not check_not_read_only():
@@ -830,7 +1139,7 @@ def amendments(*args, **kwargs):
         amendment_list = []
         for id, props in docstore.iter_doc_objs():
             # reckon and add 'lastModified' property, based on commit history?
-            latest_commit = docstore.get_version_history_for_doc_id(id)[0]
+            latest_commit = (api_utils.get_version_history(request, docstore, id, 'amendment', limit=1) or [{}])[0]
             props.update({
                 'id': id,
                 'lastModified': {
@@ -946,6 +1255,19 @@ def amendment(*args, **kwargs):
         # _LOG.debug('parent_sha = {}'.format(parent_sha))
         # return the correct nexson of study_id, using the specified view
         amendments = api_utils.get_taxonomic_amendment_store(request)
+        # answer conditional GETs before reading the amendment
+        try:
+            known_head_sha, blob_sha = api_utils.get_doc_blob_sha(amendments, amendment_id, parent_sha)
+        except:
+            known_head_sha, blob_sha = None, None
+        jsonp_callback = kwargs.get('jsoncallback', None) or kwargs.get('callback', None)
+        history_limit, history_offset = api_utils.read_history_paging(kwargs)
+        def __etag(blob_sha, head_sha):
+            # the response also holds the head SHA and the WIP branches (branch2sha)
+            return api_utils.compose_etag('amendment', blob_sha, jsonp_callback, history_limit, history_offset,
+                                          head_sha, api_utils.get_wip_branch_shas(amendments, amendment_id))
+        if blob_sha:
+            api_utils.raise_if_not_modified(request, response, __etag(blob_sha, known_head_sha))
         try:
             r = amendments.return_doc(amendment_id, commit_sha=parent_sha, return_WIP_map=True)
         except:
@@ -953,8 +1275,16 @@ def amendment(*args, **kwargs):
             raise HTTP(404, json.dumps({"error": 1, "description": "Amendment '{}' GET failure".format(amendment_id)}))
         try:
             amendment_json, head_sha, wip_map = r
+            if head_sha != known_head_sha:
+                # master moved before the amendment was read
+                try:
+                    known_head_sha, blob_sha = api_utils.get_doc_blob_sha(amendments, amendment_id, head_sha)
+                    response.headers['ETag'] = __etag(blob_sha, known_head_sha)
+                except:
+                    response.headers.pop('ETag', None)
             ## if returning_full_study:  # TODO: offer bare vs. full output (w/ history, etc)
-            version_history = amendments.get_version_history_for_doc_id(amendment_id)
+            version_history = api_utils.get_version_history(request, amendments, amendment_id, 'amendment',
+                                                            limit=history_limit, offset=history_offset)
         except:
             # _LOG.exception('GET failed')
             e = sys.exc_info()[0]
@@ -975,7 +1305,7 @@ def amendment(*args, **kwargs):
                  }
         if version_history:
             result['versionHistory'] = version_history
-        return result
+        return _stream_json(result)
 
     if request.env.request_method == 'PUT':
         if not check_not_read_only():
@@ -1066,6 +1396,8 @@ _route_tag2func = {'index':index,
                    'include_tree_in_synth': include_tree_in_synth,
                    'exclude_tree_from_synth': exclude_tree_from_synth,
                    'study_list': study_list,
+                   'studies': studies,
+                   'jobs': jobs_status,
                    'phylesystem_config': phylesystem_config,
                    'unmerged_branches': unmerged_branches,
                    'external_url': external_url,
@@ -1082,6 +1414,51 @@ _route_tag2func = {'index':index,
                    #TODO: 'following': following,
                   }
 
+# optional parts of the full-study response -> the enrichment step that computes them
+_ENRICHMENT_STEP_FOR_FIELD = {'versionHistory': 'version_history',
+                              'commentHTML': 'comment_html',
+                              'duplicateStudyIDs': 'duplicate_study_ids',
+                              'shardName': 'shard_name', }
+
+def _start_full_study_enrichment(study_nexson, study_id, history_paging=(None, 0), steps=None):
+    """Submits the steps that add version history, comment HTML, duplicate
+    study IDs and the shard name to a full-study response (or just those in
+    `steps`). Returns a Fanout; its results() holds the values of the steps
+    that finished in time.
+    """
+    if steps is None:
+        steps = _ENRICHMENT_STEP_FOR_FIELD.values()
+    phylesystem = api_utils.get_phylesystem(request)
+    history_deadline, comment_deadline, duplicate_deadline, shard_deadline = api_utils.read_settings(request, 'enrichment')[1:]
+    fanout = Fanout(api_utils.get_enrichment_pool(request))
+    # read what the steps need now, since study_nexson is annotated in the meantime
+    nexml = study_nexson['nexml']
+    comment = nexml.get('^ot:comment')
+    try:
+        study_DOI = nexml['^ot:studyPublication']['@href']
+    except KeyError:
+        study_DOI = None
+    def __comment_html():
+        if comment is None:
+            return ''
+        try:
+            return _markdown_to_html(comment, open_links_in_new_window=True)
+        except:
+            return ''
+    history_limit, history_offset = history_paging
+    if 'version_history' in steps:
+        fanout.submit('version_history', history_deadline,
+                      api_utils.get_version_history, request, phylesystem, study_id,
+                      limit=history_limit, offset=history_offset)
+    if 'comment_html' in steps:
+        fanout.submit('comment_html', comment_deadline, __comment_html)
+    if 'duplicate_study_ids' in steps:
+        fanout.submit('duplicate_study_ids', duplicate_deadline,
+                      _fetch_duplicate_study_ids, study_DOI, study_id)
+    if 'shard_name' in steps:
+        fanout.submit('shard_name', shard_deadline, _fetch_shard_name, study_id)
+    return fanout
+
 def _fetch_shard_name(study_id):
     phylesystem = api_utils.get_phylesystem(request)
     try:
@@ -1093,35 +1470,13 @@ def _fetch_shard_name(study_id):
             return None
 
 def _fetch_duplicate_study_ids(study_DOI=None, study_ID=None):
-    # Use the oti (docstore index) service to see if there are other studies in
-    # the collection with the same DOI; return the IDs of any duplicate studies
-    # found, or an empty list if there are no dupes.
+    # Use the local index of the studies on master to see if there are other
+    # studies with the same DOI; return the IDs of any duplicate studies found,
+    # or an empty list if there are no dupes (None if the index is not ready).
     if not study_DOI:
         # if no DOI exists, there are no known duplicates
         return [ ]
-    oti_base_url = api_utils.get_oti_base_url(request)
-    fetch_url = '%s/v3/studies/find_studies' % oti_base_url
-    # _LOG = api_utils.get_logger(request, 'ot_api.default.v1')
-    try:
-        #_LOG.debug('trying with requests')
-        data = json.dumps({
-                "property": "ot:studyPublication",
-                "value": study_DOI,
-                "exact": False})
-        # _LOG.debug('data is {}'.format(data))
-        r = requests.post(url = fetch_url, data = data)
-        response_json = r.json()
-    except:
-        # _LOG.exception('fetch duplicate dois failed')
-        raise HTTP(400, traceback.format_exc())
-    duplicate_study_ids = [x['ot:studyId'] for x in response_json['matched_studies']]
-    # Remove this study's ID; any others that remain are duplicates
-    try:
-        duplicate_study_ids.remove(study_ID)
-    except ValueError:
-        # ignore error, if oti is lagging and doesn't have this study yet
-        pass
-    return duplicate_study_ids
+    return api_utils.get_study_index(request).duplicate_study_ids(study_DOI, study_ID)
 
 
 @request.restful()
@@ -1140,6 +1495,18 @@ def v1():
     #_LOG.debug('Max file size set to {}, max num trees set to {}'.format(max_filesize, max_num_trees))
     repo_nexml2json = phylesystem.repo_nexml2json
     #_LOG.debug("phylesystem created with repo_nexml2json={}".format(repo_nexml2json))
+    if request.env.request_method in ('POST', 'PUT', 'PATCH'):
+        # An upload that is too large (or has too many trees) is rejected
+        #   here, before it is validated and converted.
+        uploading_study = bool(request.args) and request.args[0] == 'study'
+        if request.args[:2] == ['studies', 'ingest']:
+            # many studies; each is checked against max_filesize as it is read
+            max_body_bytes = api_utils.read_settings(request, 'bulk_ingest')[2]
+        else:
+            max_body_bytes = int(max_filesize)
+        api_utils.check_request_body(request,
+                                     max_body_bytes,
+                                     int(max_num_trees) if uploading_study else None)
     def __validate_output_nexml2json(kwargs, resource, type_ext, content_id=None):
         msg = None
         if 'output_nexml2json' not in kwargs:
@@ -1178,19 +1545,31 @@ def v1():
                             annotation,
                             parent_sha,
                             commit_msg='',
-                            master_file_blob_included=None):
-        '''Called by PUT and POST handlers to avoid code repetition.'''
+                            master_file_blob_included=None,
+                            defer_merge=False):
+        '''Called by PUT and POST handlers to avoid code repetition.
+        With `defer_merge`, only the commit to the WIP branch is made; the
+        caller starts the merge to master (see __start_deferred_merge).'''
         # global TIMING
-        #TODO, need to make this spawn a thread to do the second commit rather than block
-        a = phylesystem.annotate_and_write(git_data, 
-                                           nexson,
-                                           resource_id,
-                                           auth_info,
-                                           adaptor,
-                                           annotation,
-                                           parent_sha,
-                                           commit_msg,
-                                           master_file_blob_included)
+        if defer_merge:
+            a = deferred_merge.commit_to_wip_branch(git_data,
+                                                    nexson,
+                                                    resource_id,
+                                                    auth_info,
+                                                    adaptor,
+                                                    annotation,
+                                                    parent_sha,
+                                                    commit_msg)
+        else:
+            a = phylesystem.annotate_and_write(git_data, 
+                                               nexson,
+                                               resource_id,
+                                               auth_info,
+                                               adaptor,
+                                               annotation,
+                                               parent_sha,
+                                               commit_msg,
+                                               master_file_blob_included)
         annotated_commit = a
         # TIMING = api_utils.log_time_diff(_LOG, 'annotated commit', TIMING)
         if annotated_commit['error'] != 0:
@@ -1199,6 +1578,30 @@ def v1():
             raise HTTP(400, json.dumps(annotated_commit))
         return annotated_commit
 
+    def __start_deferred_merge(git_data, resource_id, blob, auth_info, master_file_blob_included, job_request, auth_token):
+        '''Starts a job on the merge pool of the shard that merges the WIP
+        branch of `blob` (as returned by __finish_write_verb with defer_merge)
+        into master. Returns the job.'''
+        def __merge():
+            try:
+                merged = deferred_merge.merge_to_master(git_data,
+                                                        resource_id,
+                                                        blob['branch_name'],
+                                                        blob['sha'],
+                                                        prev_file_sha=blob.get('prev_file_sha'),
+                                                        merged_sha=master_file_blob_included)
+            except GitWorkflowError, err:
+                _raise_HTTP_from_msg(err.msg)
+            if not merged['merge_needed']:
+                api_utils.after_study_write(job_request, resource_id)
+                __deferred_push_to_gh_call(job_request, resource_id, doc_type='nexson', auth_token=auth_token)
+            return merged
+        registry = api_utils.get_job_registry(request)
+        job = registry.create('study_merge', resource_id=resource_id, sha=blob['sha'],
+                              branch_name=blob['branch_name'], login=auth_info['login'])
+        api_utils.get_merge_pool(request, git_data).submit(registry.run, job['id'], _run_as_job, __merge)
+        return job
+
     def GET(resource,
             resource_id=None,
             subresource=None,
@@ -1262,25 +1665,103 @@ def v1():
         # _LOG.debug('parent_sha = {}'.format(parent_sha))
         # return the correct nexson of study_id, using the specified view
         phylesystem = api_utils.get_phylesystem(request)
+        history_paging = api_utils.read_history_paging(kwargs)
+        # clients that never display the rendered comment can skip it
+        include_comment_html = api_utils.read_bool_arg(kwargs, 'include_comment_html', True)
+        # `fields` selects parts of a full-study response; the others are not computed
         try:
-            r = phylesystem.return_study(resource_id, commit_sha=parent_sha, return_WIP_map=True)
-        except:
-            # _LOG.exception('GET failed')
-            raise HTTP(404, json.dumps({"error": 1, "description": 'Study #%s GET failure' % resource_id}))
+            projection = nexson_projection.parse_fields(kwargs.get('fields'))
+        except nexson_projection.ProjectionError as x:
+            raise HTTP(400, json.dumps({"error": 1, "description": str(x)}))
+        if projection is not None and not (returning_full_study and out_schema.is_json()):
+            raise HTTP(400, json.dumps({"error": 1, "description": '"fields" is only supported when fetching a whole study as JSON'}))
+        enrichment_steps = []
+        for field, step in _ENRICHMENT_STEP_FOR_FIELD.items():
+            if (projection is None) or projection.wants(field):
+                if field != 'commentHTML' or include_comment_html:
+                    enrichment_steps.append(step)
+        # The blob SHA of the study (found without reading it) identifies the
+        #   response for conditional GETs and for the conversion cache.
         try:
-            study_nexson, head_sha, wip_map = r
-            if returning_full_study:
-                blob_sha = phylesystem.get_blob_sha_for_study_id(resource_id, head_sha)
-                phylesystem.add_validation_annotation(study_nexson, blob_sha)
-                version_history = phylesystem.get_version_history_for_study_id(resource_id)
-                try:
-                    comment_html = _markdown_to_html(study_nexson['nexml']['^ot:comment'], open_links_in_new_window=True )
-                except:
-                    comment_html = ''
+            known_head_sha, blob_sha = api_utils.get_doc_blob_sha(phylesystem, resource_id, parent_sha)
         except:
-            # _LOG.exception('GET failed')
-            e = sys.exc_info()[0]
-            _raise_HTTP_from_msg(e)
+            # _LOG.exception('blob SHA lookup failed')
+            known_head_sha, blob_sha = None, None
+        def __study_etag(blob_sha):
+            parts = ['study',
+                     blob_sha,
+                     return_type,
+                     content_id,
+                     out_schema.description,
+                     api_utils.conversion_options(kwargs),
+                     request.extension,
+                     jsoncallback or callback,
+                     history_paging,
+                     include_comment_html,
+                     projection and projection.description()]
+            if returning_full_study and out_schema.is_json():
+                # the wrapper also lists the study's WIP branches. Commits to
+                #   other studies do not change the ETag, so a 304 may hold an
+                #   older head SHA (still a valid starting_commit_SHA, as the
+                #   study is the same there) and older duplicate DOIs.
+                parts.append(api_utils.get_study_wip_map(phylesystem, resource_id))
+            return api_utils.compose_etag(*parts)
+        # supporting files are fetched from elsewhere, so the blob SHA does not identify them
+        using_etag = (subresource != 'file')
+        if using_etag and blob_sha:
+            api_utils.raise_if_not_modified(request, response, __study_etag(blob_sha))
+        # Converted output depends only on the blob SHA of the study and the
+        #   output schema, so it is served from the conversion cache when possible.
+        converting = (subresource != 'file') and not (out_schema.format_str == 'nexson' and out_schema.version == repo_nexml2json)
+        if converting:
+            conversion_cache = api_utils.get_conversion_cache(request)
+            if blob_sha and not (returning_full_study and out_schema.is_json()):
+                # Nothing but the converted data is returned, so a cache hit
+                #   lets us skip reading and parsing the study.
+                conversion_key = api_utils.conversion_cache_key(blob_sha, out_schema, return_type, content_id, kwargs)
+                result_data = conversion_cache.get(conversion_key)
+                if result_data is not None:
+                    return _stream_json(result_data)
+        study_nexson = None
+        if converting and blob_sha:
+            # A tree or the OTUs can be converted from just those parts of the
+            #   study file (found with its offset index), without parsing the rest.
+            study_nexson = api_utils.read_study_fragment(request, blob_sha, return_type, content_id)
+        if study_nexson is None:
+            try:
+                r = phylesystem.return_study(resource_id, commit_sha=parent_sha, return_WIP_map=True)
+            except:
+                # _LOG.exception('GET failed')
+                raise HTTP(404, json.dumps({"error": 1, "description": 'Study #%s GET failure' % resource_id}))
+            try:
+                study_nexson, head_sha, wip_map = r
+                if (head_sha != known_head_sha) or not blob_sha:
+                    # master moved (or the lookup failed) before the study was read
+                    try:
+                        blob_sha = phylesystem.get_blob_sha_for_study_id(resource_id, head_sha)
+                    except:
+                        if returning_full_study:
+                            raise
+                        blob_sha = None
+                    if blob_sha and using_etag:
+                        response.headers['ETag'] = __study_etag(blob_sha)
+                    else:
+                        response.headers.pop('ETag', None)
+                if returning_full_study:
+                    if out_schema.is_json():
+                        # These steps are independent of each other, so they run on the
+                        #   worker pool while the study is annotated and converted here.
+                        enrichment = _start_full_study_enrichment(study_nexson,
+                                                                  resource_id,
+                                                                  history_paging,
+                                                                  enrichment_steps)
+                    if (projection is None) or __projection_includes_annotation(projection, converting):
+                        # this modifies study_nexson, so it must finish before conversion
+                        api_utils.add_validation_annotation(request, phylesystem, study_nexson, blob_sha)
+            except:
+                # _LOG.exception('GET failed')
+                e = sys.exc_info()[0]
+                _raise_HTTP_from_msg(e)
         if subresource == 'file':
             m_list = extract_supporting_file_messages(study_nexson)
             if subresource_id is None:
@@ -1316,65 +1797,86 @@ def v1():
                     #TODO: should not hard-code this, I suppose... (but not doing so requires more config...)
                     if u.startswith('/curator'):
                         u = 'https://tree.opentreeoflife.org' + u
-                    response.headers['Content-Type'] = 'text/plain'
-                    fetched = requests.get(u)
-                    fetched.raise_for_status()
-                    return fetched.text
+                    # the path of a cached copy, or the content as it is fetched
+                    fetched = api_utils.open_supporting_file(request, u, subresource_id)
                 except Exception as x:
                     # _LOG.exception('file_get failed')
                     raise HTTP(404, 'Could not retrieve file. Exception: "{}"'.format(str(x)))
+                response.headers['Content-Type'] = 'text/plain'
+                if isinstance(fetched, basestring):
+                    # handles Range and If-Modified-Since requests
+                    return response.stream(fetched, request=request)
+                return fetched
+        elif (projection is not None) and not projection.wants_data():
+            # only parts of the wrapper were requested
+            result_data = None
         elif out_schema.format_str == 'nexson' and out_schema.version == repo_nexml2json:
             result_data = study_nexson
         else:
-            try:
-                serialize = not out_schema.is_json()
-                src_schema = PhyloSchema('nexson', version=repo_nexml2json)
-                result_data = out_schema.convert(study_nexson,
-                                                 serialize=serialize,
-                                                 src_schema=src_schema)
-            except:
-                msg = "Exception in coercing to the required NexSON version for validation. "
-                # _LOG.exception(msg)
-                raise HTTP(400, msg)
-        if not result_data:
+            conversion_key = None
+            result_data = None
+            if blob_sha:
+                conversion_key = api_utils.conversion_cache_key(blob_sha, out_schema, return_type, content_id, kwargs)
+                result_data = conversion_cache.get(conversion_key)
+            if result_data is None:
+                try:
+                    serialize = not out_schema.is_json()
+                    src_schema = PhyloSchema('nexson', version=repo_nexml2json)
+                    result_data = out_schema.convert(study_nexson,
+                                                     serialize=serialize,
+                                                     src_schema=src_schema)
+                except:
+                    msg = "Exception in coercing to the required NexSON version for validation. "
+                    # _LOG.exception(msg)
+                    raise HTTP(400, msg)
+                if result_data and conversion_key is not None:
+                    conversion_cache.put(conversion_key, result_data)
+        if not result_data and ((projection is None) or projection.wants_data()):
             raise HTTP(404, 'subresource "{r}/{t}" not found in study "{s}"'.format(r=subresource,
                                                                                     t=subresource_id,
                                                                                     s=resource_id))
 
         if returning_full_study and out_schema.is_json():
-            try:
-                study_DOI = study_nexson['nexml']['^ot:studyPublication']['@href']
-            except KeyError:
-                study_DOI = None
-            try:
-                duplicate_study_ids = _fetch_duplicate_study_ids(study_DOI, resource_id)
-            except:
-                # _LOG.exception('call to OTI check for duplicate DOIs failed')
-                duplicate_study_ids = None
-
-            try:
-                shard_name = _fetch_shard_name(resource_id)
-            except:
-                # _LOG.exception('check for shard name failed')
-                shard_name = None
+            # steps that fail or miss their deadlines are left out of the response
+            enriched = enrichment.results()
+            version_history = enriched.get('version_history')
+            comment_html = enriched.get('comment_html')
+            duplicate_study_ids = enriched.get('duplicate_study_ids')
+            shard_name = enriched.get('shard_name')
 
             result = {'sha': head_sha,
-                     'data': result_data,
                      'branch2sha': wip_map,
-                     'commentHTML': comment_html,
                      }
+            if projection is None:
+                result['data'] = result_data
+            elif projection.wants_data():
+                result['data'] = projection.apply(result_data)
+            if comment_html is not None:
+                result['commentHTML'] = comment_html
             if duplicate_study_ids is not None:
                 result['duplicateStudyIDs'] = duplicate_study_ids
             if shard_name:
                 result['shardName'] = shard_name
             if version_history:
                 result['versionHistory'] = version_history
-            return result
+            return _stream_json(result)
         else:
-            return result_data
+            return _stream_json(result_data)
+
+    def __projection_includes_annotation(projection, converting):
+        "True if the validation annotation would be part of the projected study"
+        if not projection.wants_data():
+            return False
+        if converting:
+            # the annotation is spread over the converted document
+            return True
+        return projection.wants_key('^ot:annotationEvents') or projection.wants_key('^ot:agents')
 
     def POST(resource, resource_id=None, _method='POST', **kwargs):
         "Open Tree API methods relating to creating (and importing) resources"
+        if resource == 'studies':
+            # batch fetches only read, so they are allowed in read-only mode
+            return studies(**kwargs)
         if not check_not_read_only():
             raise HTTP(500, "should raise from check_not_read_only")
         delegate = _route_tag2func.get(resource)
@@ -1448,6 +1950,40 @@ def v1():
             # Are they using an existing license or waiver (CC0, CC-BY, something else?)
             using_existing_license = (kwargs.get('chosen_license', '') == 'study-data-has-existing-license')
 
+            def __add_license_and_curator(new_study_nexson):
+                nexml = new_study_nexson['nexml']
+
+                if not importing_from_post_arg:
+                    # If submitter requested the CC0 waiver or other waiver/license, make sure it's here
+                    if cc0_agreement:
+                        nexml['^xhtml:license'] = {'@href': 'http://creativecommons.org/publicdomain/zero/1.0/'}
+                    elif using_existing_license:
+                        existing_license = kwargs.get('alternate_license', '')
+                        if existing_license == 'CC-0':
+                            nexml['^xhtml:license'] = {'@name': 'CC0', '@href': 'http://creativecommons.org/publicdomain/zero/1.0/'}
+                            pass
+                        elif existing_license == 'CC-BY-2.0':
+                            nexml['^xhtml:license'] = {'@name': 'CC-BY 2.0', '@href': 'http://creativecommons.org/licenses/by/2.0/'}
+                            pass
+                        elif existing_license == 'CC-BY-2.5':
+                            nexml['^xhtml:license'] = {'@name': 'CC-BY 2.5', '@href': 'http://creativecommons.org/licenses/by/2.5/'}
+                            pass
+                        elif existing_license == 'CC-BY-3.0':
+                            nexml['^xhtml:license'] = {'@name': 'CC-BY 3.0', '@href': 'http://creativecommons.org/licenses/by/3.0/'}
+                            pass
+                        # NOTE that we don't offer CC-BY 4.0, which is problematic for data
+                        elif existing_license == 'CC-BY':
+                            # default to version 3, if not specified. 
+                            nexml['^xhtml:license'] = {'@name': 'CC-BY 3.0', '@href': 'http://creativecommons.org/licenses/by/3.0/'}
+                            pass
+                        else:  # assume it's something else
+                            alt_license_name = kwargs.get('alt_license_name', '')
+                            alt_license_url = kwargs.get('alt_license_URL', '')
+                            # OK to add a name here? mainly to capture submitter's intent
+                            nexml['^xhtml:license'] = {'@name': alt_license_name, '@href': alt_license_url}
+
+                nexml['^ot:curatorName'] = auth_info.get('name', '').decode('utf-8')
+
             # any of these methods should returna parsed NexSON dict (vs. string)
             if importing_from_treebase_id:
                 # make sure the treebase ID is an integer
@@ -1460,13 +1996,9 @@ def v1():
                         "error": 1,
                         "description": "TreeBASE ID should be a simple integer, not '%s'! Details:\n%s" % (treebase_id, e.message)
                     }))
-                try:
-                    new_study_nexson = import_nexson_from_treebase(treebase_id, nexson_syntax_version=BY_ID_HONEY_BADGERFISH)
-                except Exception as e:
-                    raise HTTP(500, json.dumps({
-                        "error": 1,
-                        "description": "Unexpected error parsing the file obtained from TreeBASE. Please report this bug to the Open Tree of Life developers."
-                    }))
+                # the download and conversion can be slow, so they are done
+                #   in a background job (see GET v1/jobs/{job ID})
+                return __start_treebase_import(treebase_id, auth_info, __add_license_and_curator, kwargs)
             # elif importing_from_nexml_fetch:
             #     if not (nexml_fetch_url.startswith('http://') or nexml_fetch_url.startswith('https://')):
             #         raise HTTP(400, json.dumps({
@@ -1491,40 +2023,15 @@ def v1():
                     # submitter entered an invalid DOI (or other URL); add it now
                     new_study_nexson['nexml'][u'^ot:studyPublication'] = {'@href': publication_doi}
 
-            nexml = new_study_nexson['nexml']
-
-            if not importing_from_post_arg:
-                # If submitter requested the CC0 waiver or other waiver/license, make sure it's here
-                if cc0_agreement:
-                    nexml['^xhtml:license'] = {'@href': 'http://creativecommons.org/publicdomain/zero/1.0/'}
-                elif using_existing_license:
-                    existing_license = kwargs.get('alternate_license', '')
-                    if existing_license == 'CC-0':
-                        nexml['^xhtml:license'] = {'@name': 'CC0', '@href': 'http://creativecommons.org/publicdomain/zero/1.0/'}
-                        pass
-                    elif existing_license == 'CC-BY-2.0':
-                        nexml['^xhtml:license'] = {'@name': 'CC-BY 2.0', '@href': 'http://creativecommons.org/licenses/by/2.0/'}
-                        pass
-                    elif existing_license == 'CC-BY-2.5':
-                        nexml['^xhtml:license'] = {'@name': 'CC-BY 2.5', '@href': 'http://creativecommons.org/licenses/by/2.5/'}
-                        pass
-                    elif existing_license == 'CC-BY-3.0':
-                        nexml['^xhtml:license'] = {'@name': 'CC-BY 3.0', '@href': 'http://creativecommons.org/licenses/by/3.0/'}
-                        pass
-                    # NOTE that we don't offer CC-BY 4.0, which is problematic for data
-                    elif existing_license == 'CC-BY':
-                        # default to version 3, if not specified. 
-                        nexml['^xhtml:license'] = {'@name': 'CC-BY 3.0', '@href': 'http://creativecommons.org/licenses/by/3.0/'}
-                        pass
-                    else:  # assume it's something else
-                        alt_license_name = kwargs.get('alt_license_name', '')
-                        alt_license_url = kwargs.get('alt_license_URL', '')
-                        # OK to add a name here? mainly to capture submitter's intent
-                        nexml['^xhtml:license'] = {'@name': alt_license_name, '@href': alt_license_url}
-
-            nexml['^ot:curatorName'] = auth_info.get('name', '').decode('utf-8')
+            __add_license_and_curator(new_study_nexson)
 
-        phylesystem = api_utils.get_phylesystem(request)
+        return __ingest_new_study(new_study_nexson, new_study_id, auth_info, request, kwargs.get('auth_token'))
+
+    def __ingest_new_study(new_study_nexson, new_study_id, auth_info, write_request, auth_token):
+        """Commits a new study (created by POST) and schedules its push.
+        `write_request` is the request, or what api_utils.detach_request
+        returned for it when this runs in a background job."""
+        phylesystem = api_utils.get_phylesystem(write_request)
         try:
             r = phylesystem.ingest_new_study(new_study_nexson,
                                              repo_nexml2json,
@@ -1538,9 +2045,53 @@ def v1():
         if commit_return['error'] != 0:
             # _LOG.debug('ingest_new_study failed with error code')
             raise HTTP(400, json.dumps(commit_return))
-        __deferred_push_to_gh_call(request, new_resource_id, doc_type='nexson', **kwargs)
+        api_utils.after_study_write(write_request, new_resource_id)
+        __deferred_push_to_gh_call(write_request, new_resource_id, doc_type='nexson', auth_token=auth_token)
         return commit_return
 
+    def __start_treebase_import(treebase_id, auth_info, add_license_and_curator, kwargs):
+        """Imports a study from TreeBASE as a background job (fetching,
+        converting and committing it), and returns the 202 response that
+        points to the job's status"""
+        registry = api_utils.get_job_registry(request)
+        job = registry.create('treebase_import', treebase_id=treebase_id, login=auth_info['login'])
+        # the job runs after this request has been answered
+        job_request = api_utils.detach_request(request)
+        auth_token = kwargs.get('auth_token')
+        def __progress(stage, **details):
+            registry.progress(job['id'], stage, **details)
+        def __check_cancelled():
+            registry.check_cancelled(job['id'])
+        def __import_study():
+            try:
+                new_study_nexson = api_utils.import_treebase_study(job_request,
+                                                                   treebase_id,
+                                                                   __progress,
+                                                                   __check_cancelled)
+            except jobs.JobCancelled:
+                raise
+            except requests.RequestException as e:
+                raise HTTP(502, json.dumps({
+                    "error": 1,
+                    "description": "Could not fetch study S%s from TreeBASE: %s" % (treebase_id, e)
+                }))
+            except Exception as e:
+                raise HTTP(500, json.dumps({
+                    "error": 1,
+                    "description": "Unexpected error parsing the file obtained from TreeBASE. Please report this bug to the Open Tree of Life developers."
+                }))
+            add_license_and_curator(new_study_nexson)
+            __progress('commit')
+            return __ingest_new_study(new_study_nexson, None, auth_info, job_request, auth_token)
+        api_utils.get_import_job_pool(request).submit(registry.run, job['id'], _run_as_job, __import_study)
+        status_url = api_utils.compose_job_status_url(request, job['id'])
+        response.status = 202
+        response.headers['Location'] = status_url
+        return {'error': 0,
+                'job_id': job['id'],
+                'status': job['status'],
+                'status_url': status_url}
+
     def __coerce_nexson_format(nexson, dest_format, current_format=None):
         '''Calls convert_nexson_format but does the appropriate logging and HTTP exceptions.
         '''
@@ -1572,17 +2123,31 @@ def v1():
         return nexson
 
     def __extract_and_validate_nexson(request, repo_nexml2json, kwargs):
+        nexson = __extract_nexson_from_http_call(request, **kwargs)
+        return __validate_nexson(nexson, repo_nexml2json)
+
+    def __validate_nexson(nexson, repo_nexml2json):
+        "Returns (converted NexSON, annotation, adaptor), raising a 400 error for invalid NexSON"
         try:
-            nexson = __extract_nexson_from_http_call(request, **kwargs)
         #    from peyotl.manip import count_num_trees
         #    numtrees=count_num_trees(nexson,repo_nexml2json)
         #    _LOG = api_utils.get_logger(request, 'ot_api.default.v1')
         #    _LOG.debug('number of trees in nexson is {}, max number of trees is {}'.format(numtrees,max_num_trees))
-            bundle = validate_and_convert_nexson(nexson,
-                                                 repo_nexml2json,
-                                                 allow_invalid=False,
-                                                 max_num_trees_per_study=max_num_trees)
-            nexson, annotation, validation_log, nexson_adaptor = bundle
+            # Identical uploads (e.g. repeated autosaves of an unchanged study)
+            #   are validated and converted only once.
+            validation_cache = api_utils.get_validation_cache(request)
+            cache_key = api_utils.validation_cache_key(nexson, repo_nexml2json, max_num_trees)
+            def __validate():
+                return validate_and_convert_nexson(nexson,
+                                                   repo_nexml2json,
+                                                   allow_invalid=False,
+                                                   max_num_trees_per_study=max_num_trees)
+            nexson, annotation, nexson_adaptor = validation_cache.validate(cache_key,
+                                                                           __validate,
+                                                                           GitWorkflowError)
+            if nexson_adaptor is None:
+                # a cached outcome; adding the annotation needs no validation state
+                nexson_adaptor = NexsonAnnotationAdder()
         except GitWorkflowError, err:
             # _LOG = api_utils.get_logger(request, 'ot_api.default.v1')
             # _LOG.exception('PUT failed in validation')
@@ -1635,6 +2200,12 @@ def v1():
         if resource_id is None:
             # _LOG.debug('resource id not provided')
             raise HTTP(400, json.dumps({"error": 1, "description": 'study ID expected after "study/"'}))
+        is_patch = __is_json_patch_request()
+        if is_patch:
+            # web2py parses any application/json* body into request.vars (a
+            #   top-level array of pairs becomes arguments), so the arguments
+            #   of a patch are taken from the query string only
+            kwargs = dict(request.get_vars)
         parent_sha = kwargs.get('starting_commit_SHA')
         if parent_sha is None:
             raise HTTP(400, 'Expecting a "starting_commit_SHA" argument with the SHA of the parent')
@@ -1652,41 +2223,145 @@ def v1():
         #TIMING = api_utils.log_time_diff(_LOG)
         auth_info = api_utils.authenticate(**kwargs)
         #TIMING = api_utils.log_time_diff(_LOG, 'github authentication', TIMING)
-        
-        bundle = __extract_and_validate_nexson(request,
-                                               repo_nexml2json,
-                                               kwargs)
+        phylesystem = api_utils.get_phylesystem(request)
+        # Saves with coalesce=true are held briefly, and those made by this
+        #   curator from the same starting commit become one commit. Other
+        #   saves commit any held ones first, and are then committed as usual.
+        coalescer = api_utils.get_commit_coalescer(request)
+        coalesce_key = (auth_info['login'], resource_id)
+        coalesce = api_utils.read_bool_arg(kwargs, 'coalesce', False) and not is_patch
+        if not coalesce:
+            coalescer.flush(coalesce_key)
+        if is_patch:
+            # only the changes were sent; apply them to the study at starting_commit_SHA
+            nexson = __patched_study(phylesystem, resource_id, parent_sha)
+            bundle = __validate_nexson(nexson, repo_nexml2json)
+        else:
+            bundle = __extract_and_validate_nexson(request,
+                                                   repo_nexml2json,
+                                                   kwargs)
         nexson, annotation, nexson_adaptor = bundle
 
         #TIMING = api_utils.log_time_diff(_LOG, 'validation and normalization', TIMING)
-        phylesystem = api_utils.get_phylesystem(request)
         try:
             gd = phylesystem.create_git_action(resource_id)
         except KeyError, err:
             # _LOG.debug('PUT failed in create_git_action (probably a bad study ID)')
             _raise_HTTP_from_msg("invalid study ID, please check the URL")
-        try:
-            blob = __finish_write_verb(phylesystem,
-                                       gd,
-                                       nexson=nexson,
-                                       resource_id=resource_id,
-                                       auth_info=auth_info,
-                                       adaptor=nexson_adaptor,
-                                       annotation=annotation,
-                                       parent_sha=parent_sha, 
-                                       commit_msg=commit_msg,
-                                       master_file_blob_included=master_file_blob_included)
-        except GitWorkflowError, err:
-            # _LOG.exception('PUT failed in __finish_write_verb')
-            _raise_HTTP_from_msg(err.msg)
-        #TIMING = api_utils.log_time_diff(_LOG, 'blob creation', TIMING)
-        mn = blob.get('merge_needed')
-        if (mn is not None) and (not mn):
-            __deferred_push_to_gh_call(request, resource_id, doc_type='nexson', **kwargs)
+        # the commit may be made after this request has been answered
+        job_request = api_utils.detach_request(request)
+        auth_token = kwargs.get('auth_token')
+        def __commit(parent_sha=parent_sha, commit_msg=commit_msg, defer_merge=False):
+            try:
+                blob = __finish_write_verb(phylesystem,
+                                           gd,
+                                           nexson=nexson,
+                                           resource_id=resource_id,
+                                           auth_info=auth_info,
+                                           adaptor=nexson_adaptor,
+                                           annotation=annotation,
+                                           parent_sha=parent_sha, 
+                                           commit_msg=commit_msg,
+                                           master_file_blob_included=master_file_blob_included,
+                                           defer_merge=defer_merge)
+            except GitWorkflowError, err:
+                # _LOG.exception('PUT failed in __finish_write_verb')
+                _raise_HTTP_from_msg(err.msg)
+            #TIMING = api_utils.log_time_diff(_LOG, 'blob creation', TIMING)
+            mn = blob.get('merge_needed')
+            if (mn is not None) and (not mn):
+                api_utils.after_study_write(job_request, resource_id)
+                __deferred_push_to_gh_call(job_request, resource_id, doc_type='nexson', auth_token=auth_token)
+            return blob
+        held = None
+        if coalesce:
+            def __commit_held(parent_sha, commit_msg):
+                return _run_as_job(lambda: __commit(parent_sha=parent_sha, commit_msg=commit_msg))
+            # None if the save is not held (it starts from another commit
+            #   than the held saves, or another process holds saves too long)
+            held = coalescer.submit(coalesce_key, parent_sha, commit_msg, __commit_held,
+                                    resource_id=resource_id, login=auth_info['login'])
+        if held is not None:
+            # the outcome of the commit (with its SHA, the starting_commit_SHA
+            #   of the next save) is reported by GET v1/jobs/{job ID}
+            num_saves, job = held
+            status_url = api_utils.compose_job_status_url(request, job['id'])
+            response.status = 202
+            response.headers['Location'] = status_url
+            return {'error': 0,
+                    'resource_id': resource_id,
+                    'sha': parent_sha,
+                    'coalesced': True,
+                    'pending_saves': num_saves,
+                    'job_id': job['id'],
+                    'status': job['status'],
+                    'status_url': status_url,
+                    'description': 'Held; will be committed within {} seconds'.format(coalescer.window)}
+        if api_utils.read_bool_arg(kwargs, 'async', False):
+            # The payload has been validated; the commit is made on a worker
+            #   thread, and its outcome is reported by GET v1/jobs/{job ID}
+            registry = api_utils.get_job_registry(request)
+            job = registry.create('study_put', resource_id=resource_id, starting_commit_SHA=parent_sha,
+                                  login=auth_info['login'])
+            api_utils.get_write_job_pool(request).submit(registry.run, job['id'], _run_as_job, __commit)
+            status_url = api_utils.compose_job_status_url(request, job['id'])
+            response.status = 202
+            response.headers['Location'] = status_url
+            return {'error': 0,
+                    'job_id': job['id'],
+                    'status': job['status'],
+                    'status_url': status_url}
+        if api_utils.read_bool_arg(kwargs, 'defer_merge', False):
+            # The response follows the commit to the WIP branch; the merge to
+            #   master is made by a job (one at a time for each shard), and
+            #   its outcome is reported by GET v1/jobs/{job ID}
+            blob = __commit(defer_merge=True)
+            job = __start_deferred_merge(gd, resource_id, blob, auth_info, master_file_blob_included,
+                                         job_request, auth_token)
+            status_url = api_utils.compose_job_status_url(request, job['id'])
+            blob.pop('prev_file_sha', None)
+            blob.update({'branch2sha': {blob['branch_name']: blob['sha']},
+                         'job_id': job['id'],
+                         'status': job['status'],
+                         'status_url': status_url})
+            response.headers['Location'] = status_url
+        else:
+            blob = __commit()
         # Add updated commit history to the blob
-        blob['versionHistory'] = phylesystem.get_version_history_for_study_id(resource_id)
+        history_limit, history_offset = api_utils.read_history_paging(kwargs)
+        blob['versionHistory'] = api_utils.get_version_history(request, phylesystem, resource_id,
+                                                               limit=history_limit, offset=history_offset)
         return blob
 
+    # PATCH v1/study/{id} is a PUT with a JSON Patch body
+    PATCH = PUT
+
+    def __is_json_patch_request():
+        if request.env.request_method == 'PATCH':
+            return True
+        content_type = request.env.content_type or ''
+        return content_type.split(';')[0].strip().lower() == 'application/json-patch+json'
+
+    def __patched_study(phylesystem, resource_id, parent_sha):
+        """Returns the study as of `parent_sha` with the JSON Patch (RFC 6902)
+        in the request body applied. Paths refer to the NexSON version of the repo."""
+        try:
+            request.body.seek(0)
+            patch = json.loads(request.body.read())
+        except:
+            raise HTTP(400, json.dumps({"error": 1, "description": 'The JSON Patch must be valid JSON'}))
+        try:
+            study_nexson = phylesystem.return_study(resource_id, commit_sha=parent_sha, return_WIP_map=True)[0]
+        except:
+            # _LOG.exception('PATCH failed to read the study')
+            raise HTTP(404, json.dumps({"error": 1, "description": 'Study #%s GET failure' % resource_id}))
+        try:
+            return json_patch.apply_patch(study_nexson, patch)
+        except json_patch.PatchTestFailed as x:
+            raise HTTP(409, json.dumps({"error": 1, "description": str(x)}))
+        except json_patch.JsonPatchError as x:
+            raise HTTP(400, json.dumps({"error": 1, "description": 'Could not apply the JSON Patch: ' + str(x)}))
+
     def _new_nexson_with_crossref_metadata(doi, ref_string, include_cc0=False):
         # look for matching studies via CrossRef.org API
         # N.B. The recommended API method is very different for DOI vs.
@@ -1695,34 +2370,18 @@ def v1():
         best_match = None
         no_match_found = False
         meta_publication_reference = u''
-        try:
-            if doi:
-                # use the supplied DOI to fetch study metadata
-                lookup_response = fetch(
-                    'https://api.crossref.org/works?%s' %
-                    urlencode({'rows': 1, 'filter': 'doi:'+ doi})
-                )
-            elif ref_string:
-                # use the supplied reference text to fetch study metadata
-                lookup_response = fetch(
-                    'https://api.crossref.org/works?%s' %
-                    urlencode({'rows': 1, 'query': ref_string})
-                )
-            lookup_response = unicode(lookup_response, 'utf-8')   # make sure it's Unicode!
-            response_json = anyjson.loads(lookup_response)
-            response_status = response_json.get('status', u'')
-            if response_status == u'ok':
-                matching_records = response_json.get('message', {}).get('items', [])
-                if len(matching_records) == 0:
-                    no_match_found = True
-            else:
-                # Something went wrong (TODO: Capture and log any error message?)
-                no_match_found = True
-
-        except urllib2.URLError, e:
-            # Both calls above should return a 200 status even if there's no match.
+        # The works search and the reference text are cached by DOI (or
+        #   reference string), and fetched concurrently when we have a DOI.
+        crossref_client = api_utils.get_crossref_client(request)
+        response_json, found_doi, raw_publication_reference = crossref_client.lookup(doi=doi, ref_string=ref_string)
+        if response_json is None:
+            # Both lookups should return a 200 status even if there's no match.
             # So apparently the CrossRef service is down for some reason.
             no_match_found = True
+        else:
+            matching_records = response_json.get('message', {}).get('items', [])
+            if len(matching_records) == 0:
+                no_match_found = True
 
         if no_match_found:
             # Add a bogus reference string to signal the lack of results
@@ -1751,32 +2410,22 @@ def v1():
                     # first/only element here should be a year
                     meta_year = inner_date_parts[0]
 
-            # capture the raw DOI so we can try to retrieve a reference string below
-            doi = match.get('DOI', u'')
+            # the raw DOI, used to retrieve the reference string
+            doi = found_doi
 
-        # We need another API call to fetch a plain-text reference string.
+        # The reference text is a plain-text reference string for the DOI.
         # NB - this is probabl APA style (based on conversation with CrossRef API team)
         if doi:
-            try:
-                # use the supplied (or recovered) DOI to fetch a plain-text reference string
-                lookup_response = fetch(
-                    'https://api.crossref.org/works/%s/transform/text/x-bibliography' %
-                    quote_plus(doi)
-                )
-                # make sure it's Unicode!
-                raw_publication_reference = unicode(lookup_response, 'utf-8')
+            if raw_publication_reference:
                 # make sure it's plain text (no markup)!
                 ref_element_tree = web2pyHTMLParser(raw_publication_reference).tree
                 # root of this tree is the complete mini-DOM
                 ref_root = ref_element_tree.elements()[0]
                 # reduce this root to plain text (strip any tags)
                 meta_publication_reference = ref_root.flatten().decode('utf-8')
-
-            except urllib2.URLError, e:
+            else:
                 # Any response but 200 means no match found, or the CrossRef
                 # service is down for some reason.
-                _GLOG.debug("URLError fetching ref-text!!")
-                _GLOG.debug(e)
                 meta_publication_reference = u'No matching publication found for this DOI!'
 
         # add any found values to a fresh NexSON template
@@ -1820,6 +2469,7 @@ def v1():
         try:
             x = phylesystem.delete_study(resource_id, auth_info, parent_sha, commit_msg=commit_msg)
             if x.get('error') == 0:
+                api_utils.after_study_write(request, resource_id)
                 __deferred_push_to_gh_call(request, None, doc_type='nexson', **kwargs)
             return x
         except GitWorkflowError, err:
@@ -56,7 +56,7 @@ def v1():
         phylesystem = api_utils.get_phylesystem(request)
         gd = phylesystem.create_git_action(resource_id)
         try:
-            return merge_from_master(gd, resource_id, auth_info, starting_commit_SHA)
+            merged = merge_from_master(gd, resource_id, auth_info, starting_commit_SHA)
         except GitWorkflowError, err:
             raise HTTP(400, json.dumps({"error": 1, "description": err.msg}))
         except:
@@ -66,5 +66,8 @@ def v1():
                 "error": 1,
                 "description": "Could not merge! Details: %s" % (m)
             }))
+        # the next GETs of the merged WIP study can use its exports
+        api_utils.schedule_study_exports(request, resource_id, merged['sha'])
+        return merged
 
     return locals()
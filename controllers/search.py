@@ -3,7 +3,6 @@ import time
 import json
 import requests
 from oti_search import OTISearch
-from ConfigParser import SafeConfigParser
 import urllib2
 import sys
 import traceback
@@ -293,13 +292,7 @@ N.B. This depends on a GitHub webhook on the taxonomic-amendments docstore!
         raise HTTP(500, full_msg)
 
 def _read_from_local_config(request, section_name, key_name):
-    app_name = request.application
-    conf = SafeConfigParser(allow_no_value=True)
-    if os.path.isfile("%s/applications/%s/private/localconfig" % (os.path.abspath('.'), app_name,)):
-        conf.read("%s/applications/%s/private/localconfig" % (os.path.abspath('.'), app_name,))
-    else:
-        conf.read("%s/applications/%s/private/config" % (os.path.abspath('.'), app_name,))
-    return conf.get(section_name, key_name)
+    return api_utils.get_conf_object(request).get(section_name, key_name)
 
 def _harvest_study_ids_from_paths( path_list, target_array ):
     for path in path_list:
@@ -0,0 +1,417 @@
+"""The settings of the API (private/localconfig, or private/config) and the
+loggers that they configure.
+
+The config file is parsed into a ConfigSnapshot, which is only replaced when
+the file is replaced or its mtime changes. The settings of each cache and
+worker pool are declared in _SETTING_GROUPS (with their defaults) and read
+with read_settings(request, group name).
+"""
+from ConfigParser import SafeConfigParser, NoSectionError, NoOptionError
+import threading
+import logging
+import crossref
+import os
+
+_PATH = 'path'
+
+def _comma_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+def _export_formats(value):
+    return [f.lower() for f in _comma_list(value) if f.lower() in ('newick', 'nexus')]
+
+# The settings of each group, as (section, option, type, default). The type
+#   converts the option's value (a value that it cannot convert is replaced by
+#   the default); the default of a _PATH is relative to the private directory,
+#   and a _PATH that is set but empty is kept (it disables the cache).
+#   read_settings returns the values of a group in this order (or the value,
+#   for a group of one setting).
+_SETTING_GROUPS = {
+    # the cache of converted study outputs
+    'conversion_cache': (("cache", "conversion_cache_max_items", int, 256),
+                         ("cache", "conversion_cache_dir", _PATH, 'cache/conversions'),
+                         ("cache", "conversion_cache_max_bytes", int, 2000000000)),
+    # the persisted index of the studies on master
+    'study_index': (("cache", "study_index_path", _PATH, 'cache/study_index.json'), ),
+    # the cache of rendered Markdown (study comments, collection descriptions)
+    'markdown_cache': (("cache", "markdown_cache_max_items", int, 1024), ),
+    # the byte-offset indices of study files
+    'offset_index': (("cache", "offset_index_max_items", int, 1024),
+                     ("cache", "offset_index_dir", _PATH, 'cache/offsets')),
+    # the formats that every tree is converted to after a study is written
+    'materialized_exports': (("cache", "materialized_exports", _export_formats, ['newick']), ),
+    # the number of validated uploads kept in RAM
+    'validation_cache': (("cache", "validation_cache_max_items", int, 32), ),
+    # the cache of validation annotations
+    'annotation_cache': (("cache", "annotation_cache_max_items", int, 1024),
+                         ("cache", "annotation_cache_dir", _PATH, 'cache/annotations')),
+    # proxying supporting files
+    'supporting_file': (("cache", "supporting_file_cache_dir", _PATH, 'cache/supporting_files'),
+                        ("cache", "supporting_file_cache_max_bytes", int, 1000000000),
+                        ("cache", "supporting_file_timeout", float, 30.0)),
+    # the cache of verified GitHub tokens
+    'auth_cache': (("cache", "auth_cache_ttl", float, 300.0),
+                   ("cache", "auth_cache_invalid_ttl", float, 60.0),
+                   ("cache", "auth_cache_max_items", int, 1024)),
+    # CrossRef lookups
+    'crossref': (("cache", "crossref_cache_max_items", int, 1024),
+                 ("cache", "crossref_cache_dir", _PATH, 'cache/crossref'),
+                 ("cache", "crossref_timeout", float, crossref.DEFAULT_TIMEOUT),
+                 ("cache", "crossref_negative_ttl", float, crossref.DEFAULT_NEGATIVE_TTL)),
+    # TreeBASE imports
+    'treebase_import': (("cache", "treebase_cache_dir", _PATH, 'cache/treebase'),
+                        ("cache", "treebase_cache_max_bytes", int, 1000000000),
+                        ("workers", "treebase_timeout", float, 60.0),
+                        ("workers", "import_jobs_max_workers", int, 2)),
+    # the persisted commit-history indices (one file per docstore)
+    'history_index': (("cache", "history_index_dir", _PATH, 'cache/history'), ),
+    # the concurrent steps of a full-study GET
+    'enrichment': (("workers", "enrichment_max_workers", int, 8),
+                   ("workers", "version_history_deadline", float, 5.0),
+                   ("workers", "comment_html_deadline", float, 2.0),
+                   ("workers", "duplicate_study_ids_deadline", float, 1.0),
+                   ("workers", "shard_name_deadline", float, 1.0)),
+    # POST v1/studies/batch
+    'batch': (("workers", "batch_max_workers", int, 8),
+              ("workers", "batch_max_studies", int, 500)),
+    # POST v1/studies/ingest
+    'bulk_ingest': (("apis", "bulk_ingest_logins", _comma_list, []),
+                    ("workers", "bulk_ingest_max_workers", int, 4),
+                    ("filesize", "bulk_ingest_max_bytes", int, 2000000000),
+                    ("workers", "bulk_ingest_dir", _PATH, 'bulk_ingest')),
+    # the seconds that saves with coalesce=true are held
+    'commit_coalescing': (("workers", "commit_coalescing_window", float, 10.0), ),
+    # background jobs
+    'jobs': (("workers", "jobs_dir", _PATH, 'jobs'),
+             ("workers", "write_jobs_max_workers", int, 2)),
+}
+
+
+class ConfigSnapshot(object):
+    """An immutable view of the settings in private/localconfig (or private/config).
+
+    Options can be read with `get`, `has_option` and `sections` (as with a
+    SafeConfigParser). The settings of the docstores and the logger have
+    their own accessors, and those of each group in _SETTING_GROUPS are
+    returned by `settings`; each is computed once per snapshot.
+    """
+    def __init__(self, filepath, mtime, private_dir):
+        self.filepath = filepath
+        self.mtime = mtime
+        self.private_dir = private_dir
+        conf = SafeConfigParser(allow_no_value=True)
+        with open(filepath) as inp:
+            conf.readfp(inp)
+        sections = {}
+        for section in conf.sections():
+            opts = {}
+            for option in conf.options(section):
+                try:
+                    opts[option] = conf.get(section, option)
+                except:
+                    opts[option] = conf.get(section, option, raw=True)
+            sections[section] = opts
+        self._sections = sections
+        self._accessor_values = {}
+        self._accessor_lock = threading.Lock()
+
+    def sections(self):
+        return list(self._sections.keys())
+
+    def has_section(self, section):
+        return section in self._sections
+
+    def has_option(self, section, option):
+        return option.lower() in self._sections.get(section, {})
+
+    def get(self, section, option):
+        try:
+            opts = self._sections[section]
+        except KeyError:
+            raise NoSectionError(section)
+        try:
+            return opts[option.lower()]
+        except KeyError:
+            raise NoOptionError(option, section)
+
+    def _memoized(self, name, fn):
+        try:
+            return self._accessor_values[name]
+        except KeyError:
+            pass
+        v = fn()
+        with self._accessor_lock:
+            self._accessor_values[name] = v
+        return v
+
+    def _setting(self, section, option, convert, default):
+        if convert == _PATH:
+            try:
+                return self.get(section, option)
+            except:
+                return os.path.join(self.private_dir, *default.split('/'))
+        try:
+            return convert(self.get(section, option))
+        except:
+            return default
+
+    def settings(self, group):
+        """Returns the values of the settings of `group` (a key of
+        _SETTING_GROUPS) as a tuple, or the value of a group of one setting"""
+        def _read():
+            values = tuple(self._setting(*s) for s in _SETTING_GROUPS[group])
+            return values[0] if len(values) == 1 else values
+        return self._memoized('settings:' + group, _read)
+
+    def _git_settings(self):
+        try:
+            git_ssh     = self.get("apis", "git_ssh")
+        except:
+            git_ssh = 'ssh'
+        try:
+            pkey        = self.get("apis", "pkey")
+        except:
+            pkey = None
+        try:
+            git_hub_remote = self.get("apis", "git_hub_remote")
+        except:
+            git_hub_remote = 'git@github.com:OpenTreeOfLife'
+        return git_ssh, pkey, git_hub_remote
+
+    def phylesystem_config(self):
+        """Settings for managing the main Nexson docstore: (repo_parent, repo_remote,
+        git_ssh, pkey, git_hub_remote, max_filesize, max_num_trees, read_only).
+        Raises ValueError if the max number of trees is not an integer."""
+        return self._memoized('phylesystem', self._read_phylesystem_config)
+
+    def _read_phylesystem_config(self):
+        repo_parent   = self.get("apis","repo_parent")
+        repo_remote = self.get("apis", "repo_remote")
+        git_ssh, pkey, git_hub_remote = self._git_settings()
+        try:
+            max_filesize = self.get("filesize", "peyotl_max_file_size")
+        except:
+            max_filesize = '20000000'
+        try:
+            max_num_trees = self.get("filesize", "validation_max_num_trees")
+        except:
+            max_num_trees = 65
+        try:
+            max_num_trees = int(max_num_trees)
+        except ValueError:
+            raise ValueError('max number of trees per study in config is not an integer')
+        try:
+            read_only = self.get("apis", "read_only") == 'true'
+        except:
+            read_only = False
+        return repo_parent, repo_remote, git_ssh, pkey, git_hub_remote, max_filesize, max_num_trees, read_only
+
+    def collections_config(self):
+        """Settings for a minor repo with shared tree collections: (repo_parent,
+        repo_remote, git_ssh, pkey, git_hub_remote, max_filesize)"""
+        return self._memoized('collections', self._read_collections_config)
+
+    def _read_collections_config(self):
+        collections_repo_parent   = self.get("apis","collections_repo_parent")
+        collections_repo_remote = self.get("apis", "collections_repo_remote")
+        git_ssh, pkey, git_hub_remote = self._git_settings()
+        try:
+            max_filesize = self.get("filesize", "collections_max_file_size")
+        except:
+            max_filesize = '20000000'
+        return collections_repo_parent, collections_repo_remote, git_ssh, pkey, git_hub_remote, max_filesize
+
+    def amendments_config(self):
+        """Settings for a minor repo with shared taxonomic amendments: (repo_parent,
+        repo_remote, git_ssh, pkey, git_hub_remote, max_filesize)"""
+        return self._memoized('amendments', self._read_amendments_config)
+
+    def _read_amendments_config(self):
+        amendments_repo_parent   = self.get("apis","amendments_repo_parent")
+        amendments_repo_remote = self.get("apis", "amendments_repo_remote")
+        git_ssh, pkey, git_hub_remote = self._git_settings()
+        try:
+            max_filesize = self.get("filesize", "amendments_max_file_size")
+        except:
+            max_filesize = '20000000'
+        return amendments_repo_parent, amendments_repo_remote, git_ssh, pkey, git_hub_remote, max_filesize
+
+    def favorites_config(self):
+        """Settings for a minor repo with per-user 'favorites' information:
+        (repo_parent, repo_remote, git_ssh, pkey, git_hub_remote)"""
+        return self._memoized('favorites', self._read_favorites_config)
+
+    def _read_favorites_config(self):
+        favorites_repo_parent   = self.get("apis","favorites_repo_parent")
+        favorites_repo_remote = self.get("apis", "favorites_repo_remote")
+        git_ssh, pkey, git_hub_remote = self._git_settings()
+        return favorites_repo_parent, favorites_repo_remote, git_ssh, pkey, git_hub_remote
+
+    def logging_config(self):
+        """Settings for the request logger: (level, formatter name, filepath)"""
+        return self._memoized('logging', self._read_logging_config)
+
+    def _read_logging_config(self):
+        try:
+            level = self.get("logging", "level")
+            if not level.strip():
+                level = 'WARNING'
+        except:
+            level = 'WARNING'
+        try:
+            logging_format_name = self.get("logging", "formatter")
+            if not logging_format_name.strip():
+                logging_format_name = 'NONE'
+        except:
+            logging_format_name = 'NONE'
+        try:
+            logging_filepath = self.get("logging", "filepath")
+            if not logging_filepath.strip():
+                logging_filepath = None
+        except:
+            logging_filepath = None
+        return level, logging_format_name, logging_filepath
+
+    def base_url(self, option, scheme='https:'):
+        """Returns the URL in the "apis" section named `option`, prepending
+        `scheme` to a scheme-relative URL"""
+        def _read():
+            url = self.get("apis", option)
+            if url.startswith('//'):
+                url = scheme + url
+            return url
+        return self._memoized('url:' + option, _read)
+
+
+def get_private_dir(request):
+    app_name = request.application
+    leader = request.env.web2py_path
+    return '%s/applications/%s/private' % (leader, app_name)
+
+_CONFIG_SNAPSHOT = None
+_CONFIG_SNAPSHOT_LOCK = threading.Lock()
+def load_config_snapshot(private_dir):
+    """Returns the ConfigSnapshot of the config file in `private_dir`
+    ("localconfig", or else "config").
+
+    The file is only re-parsed when it is replaced or its mtime changes.
+    """
+    global _CONFIG_SNAPSHOT
+    filename = os.path.join(private_dir, "localconfig")
+    if not os.path.isfile(filename):
+        filename = os.path.join(private_dir, "config")
+    mtime = os.stat(filename).st_mtime
+    snapshot = _CONFIG_SNAPSHOT
+    if (snapshot is not None) and snapshot.filepath == filename and snapshot.mtime == mtime:
+        return snapshot
+    with _CONFIG_SNAPSHOT_LOCK:
+        snapshot = _CONFIG_SNAPSHOT
+        if (snapshot is None) or snapshot.filepath != filename or snapshot.mtime != mtime:
+            snapshot = ConfigSnapshot(filename, mtime, private_dir)
+            _CONFIG_SNAPSHOT = snapshot
+    return snapshot
+
+def get_conf_object(request):
+    "Returns the ConfigSnapshot for the current config file of the application"
+    return load_config_snapshot(get_private_dir(request))
+
+def read_settings(request, group):
+    "Returns the settings of `group` (see _SETTING_GROUPS)"
+    return get_conf_object(request).settings(group)
+
+def read_collections_config(request):
+    """Load settings for a minor repo with shared tree collections"""
+    return get_conf_object(request).collections_config()
+
+def read_amendments_config(request):
+    """Load settings for a minor repo with shared taxonomic amendments"""
+    return get_conf_object(request).amendments_config()
+
+def read_favorites_config(request):
+    """Load settings for a minor repo with per-user 'favorites' information"""
+    return get_conf_object(request).favorites_config()
+
+def read_logging_config(request):
+    return get_conf_object(request).logging_config()
+
+_LOGGING_LEVEL_ENVAR="OT_API_LOGGING_LEVEL"
+_LOGGING_FORMAT_ENVAR="OT_API_LOGGING_FORMAT"
+_LOGGING_FILE_PATH_ENVAR = 'OT_API_LOG_FILE_PATH'
+
+def _get_logging_level(s=None):
+    if s is None:
+        return logging.NOTSET
+    supper = s.upper()
+    if supper == "NOTSET":
+        level = logging.NOTSET
+    elif supper == "DEBUG":
+        level = logging.DEBUG
+    elif supper == "INFO":
+        level = logging.INFO
+    elif supper == "WARNING":
+        level = logging.WARNING
+    elif supper == "ERROR":
+        level = logging.ERROR
+    elif supper == "CRITICAL":
+        level = logging.CRITICAL
+    else:
+        level = logging.NOTSET
+    return level
+
+def _get_logging_formatter(s=None):
+    if s is None:
+        s == 'NONE'
+    else:
+        s = s.upper()
+    rich_formatter = logging.Formatter("[%(asctime)s] %(filename)s (%(lineno)d): %(levelname) 8s: %(message)s")
+    simple_formatter = logging.Formatter("%(levelname) 8s: %(message)s")
+    raw_formatter = logging.Formatter("%(message)s")
+    default_formatter = None
+    logging_formatter = default_formatter
+    if s == "RICH":
+        logging_formatter = rich_formatter
+    elif s == "SIMPLE":
+        logging_formatter = simple_formatter
+    else:
+        logging_formatter = None
+    if logging_formatter is not None:
+        logging_formatter.datefmt='%H:%M:%S'
+    return logging_formatter
+
+def get_logger(request, name="ot_api"):
+    """
+    Returns a logger with name set as given, and configured
+    to the level given by the environment variable _LOGGING_LEVEL_ENVAR.
+    """
+
+#     package_dir = os.path.dirname(module_path)
+#     config_filepath = os.path.join(package_dir, _LOGGING_CONFIG_FILE)
+#     if os.path.exists(config_filepath):
+#         try:
+#             logging.config.fileConfig(config_filepath)
+#             logger_set = True
+#         except:
+#             logger_set = False
+    logger = logging.getLogger(name)
+    if len(logger.handlers) == 0:
+        if request is None:
+            level = _get_logging_level(os.environ.get(_LOGGING_LEVEL_ENVAR))
+            logging_formatter = _get_logging_formatter(os.environ.get(_LOGGING_FORMAT_ENVAR))
+            logging_filepath = os.environ.get(_LOGGING_FILE_PATH_ENVAR)
+        else:
+            level_str, logging_format_name, logging_filepath = read_logging_config(request)
+            logging_formatter = _get_logging_formatter(logging_format_name)
+            level = _get_logging_level(level_str)
+
+        logger.setLevel(level)
+        if logging_filepath is not None:
+            log_dir = os.path.split(logging_filepath)[0]
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            ch = logging.FileHandler(logging_filepath)
+        else:
+            ch = logging.StreamHandler()
+        ch.setLevel(level)
+        ch.setFormatter(logging_formatter)
+        logger.addHandler(ch)
+    return logger
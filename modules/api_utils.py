@@ -1,24 +1,88 @@
-from github import Github, BadCredentialsException
-from peyotl.nexson_syntax import write_as_json
+from peyotl.nexson_syntax import write_as_json, \
+                                 PhyloSchema, \
+                                 get_ot_study_info_from_treebase_nexml, \
+                                 BY_ID_HONEY_BADGERFISH
 from peyotl.phylesystem import Phylesystem
 from peyotl.collections_store import TreeCollectionStore
 from peyotl.amendments import TaxonomicAmendmentStore
 from peyotl.utility import read_config as read_peyotl_config
-from ConfigParser import SafeConfigParser
 from datetime import datetime
+from tiered_cache import LRUCache, DiskCache, TieredCache, TTLCache
+from xml.etree import cElementTree
+from study_index import StudyIndex
+from history_index import HistoryIndex
+from shard_reader import ShardReader, find_shards
+from nexson_projection import BULK_KEYS
+from sh import git
+from gluon.storage import Storage
+# settings, caches, worker pools and request checks (re-exported for the controllers)
+from api_config import ConfigSnapshot, \
+                       get_private_dir, \
+                       get_conf_object, \
+                       read_settings, \
+                       read_collections_config, \
+                       read_amendments_config, \
+                       read_favorites_config, \
+                       read_logging_config, \
+                       get_logger
+from caches import get_conversion_cache, \
+                   conversion_cache_key, \
+                   conversion_options, \
+                   get_annotation_cache, \
+                   annotation_cache_key, \
+                   get_validation_cache, \
+                   validation_cache_key, \
+                   get_auth_cache, \
+                   auth_token_fingerprint, \
+                   get_markdown_cache, \
+                   markdown_cache_key, \
+                   get_offset_index_cache, \
+                   get_supporting_file_cache, \
+                   get_treebase_cache
+from workers import get_worker_pool, \
+                    get_enrichment_pool, \
+                    get_batch_pool, \
+                    get_import_job_pool, \
+                    get_write_job_pool, \
+                    get_merge_pool, \
+                    run_once_in_background, \
+                    get_job_registry, \
+                    compose_job_status_url, \
+                    get_commit_coalescer
+from request_guards import read_paging, \
+                           read_history_paging, \
+                           read_bool_arg, \
+                           check_request_body, \
+                           compose_etag, \
+                           etag_matches, \
+                           raise_if_not_modified
+import nexson_index
+import study_exports
+import file_proxy
+import crossref
+import bulk_ingest
+import threading
+import shutil
+import copy
 import tempfile
-import logging
 import json
 import os
+import re
 
 
 # this will be updated by config below; start safe by default
 READ_ONLY_MODE = True
 
-def get_private_dir(request):
-    app_name = request.application
-    leader = request.env.web2py_path
-    return '%s/applications/%s/private' % (leader, app_name)
+def detach_request(request):
+    """Returns a stand-in for `request` for code that runs after the request
+    has been answered (background jobs and threads). It holds only what the
+    config readers and the URL builders use (the application's name and
+    web2py path, the URL scheme and host), not the request's body, arguments
+    or headers."""
+    return Storage(application=request.application,
+                   env=Storage(web2py_path=request.env.web2py_path,
+                               wsgi_url_scheme=request.env.wsgi_url_scheme,
+                               http_host=request.env.http_host))
 
 def atomic_write_json_if_not_found(obj, dest, request):
     if os.path.exists(dest):
@@ -157,147 +221,481 @@ def get_taxonomic_amendment_store(request):
     return _TAXONOMIC_AMENDMENT_STORE
 
 
-def get_failed_push_filepath(request, doc_type=None):
-    filenames_by_content_type = {'nexson': "PUSH_FAILURE_nexson.json",
-                                 'collection': "PUSH_FAILURE_collection.json",
-                                 'amendment': "PUSH_FAILURE_amendment.json",
-                                 'favorites': "PUSH_FAILURE_favorites.json"}
-    content_type = doc_type or request.vars.get('doc_type', 'nexson')
-    failure_filename = filenames_by_content_type[content_type]
-    return os.path.join(get_private_dir(request), failure_filename)
-
-def get_conf_object(request):
-    app_name = request.application
-    conf = SafeConfigParser(allow_no_value=True)
-    localconfig_filename = os.path.join(get_private_dir(request), "localconfig")
-    if os.path.isfile(localconfig_filename):
-        conf.readfp(open(localconfig_filename))
-    else:
-        filename = os.path.join(get_private_dir(request), "config")
-        conf.readfp(open(filename))
-    return conf
+def add_validation_annotation(request, phylesystem, study_nexson, blob_sha):
+    """Adds the validation annotation to `study_nexson` (the version of a
+    study with git `blob_sha`), like phylesystem.add_validation_annotation.
 
-def read_phylesystem_config(request):
-    """Load settings for managing the main Nexson docstore"""
-    conf = get_conf_object(request)
-    repo_parent   = conf.get("apis","repo_parent")
-    repo_remote = conf.get("apis", "repo_remote")
-    try:
-        git_ssh     = conf.get("apis", "git_ssh")
-    except:
-        git_ssh = 'ssh'
-    try:
-        pkey        = conf.get("apis", "pkey")
-    except:
-        pkey = None
-    try:
-        git_hub_remote = conf.get("apis", "git_hub_remote")
-    except:
-        git_hub_remote = 'git@github.com:OpenTreeOfLife'
-    try:
-        max_filesize = conf.get("filesize", "peyotl_max_file_size")
-    except:
-        max_filesize = '20000000'
-    try:
-        max_num_trees = conf.get("filesize", "validation_max_num_trees")
-    except:
-        max_num_trees = 65
+    The annotation only changes the small properties of `nexml` (the
+    annotation events and agents), so those changes are cached by blob SHA
+    and re-applied without validating the study again.
+    """
+    nexml = study_nexson['nexml']
+    key = annotation_cache_key(blob_sha, phylesystem.repo_nexml2json)
+    cache = get_annotation_cache(request)
+    changes = cache.get(key) if blob_sha else None
+    if changes is not None:
+        for k in changes['removed']:
+            nexml.pop(k, None)
+        # the response may be modified (by conversion), but the cached value must not be
+        nexml.update(copy.deepcopy(changes['set']))
+        return
+    before = dict((k, copy.deepcopy(v)) for k, v in nexml.items() if k not in BULK_KEYS)
+    phylesystem.add_validation_annotation(study_nexson, blob_sha)
+    if not blob_sha:
+        return
+    changes = {'set': {}, 'removed': [k for k in before if k not in nexml]}
+    for k, v in nexml.items():
+        if k not in BULK_KEYS and (k not in before or before[k] != v):
+            changes['set'][k] = copy.deepcopy(v)
+    cache.put(key, changes)
+
+_CROSSREF_CLIENT = None
+def get_crossref_client(request):
+    """Returns the process-wide CrossRefClient, which caches CrossRef answers
+    in RAM and on disk (negative answers in RAM only, for crossref_negative_ttl
+    seconds) and shares the pooled HTTP session"""
+    global _CROSSREF_CLIENT
+    if _CROSSREF_CLIENT is not None:
+        return _CROSSREF_CLIENT
+    max_items, cache_dir, timeout, negative_ttl = read_settings(request, 'crossref')
+    disk = None
+    if cache_dir:
+        try:
+            disk = DiskCache(cache_dir)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create CrossRef cache dir "{}". Using RAM only.'.format(cache_dir))
+    _CROSSREF_CLIENT = crossref.CrossRefClient(get_http_session(request),
+                                               TieredCache(LRUCache(max_items), disk),
+                                               timeout=timeout,
+                                               pool=get_worker_pool('ot-crossref', 4),
+                                               negative_cache=TTLCache(max_items, negative_ttl))
+    return _CROSSREF_CLIENT
+
+_HTTP_SESSION = None
+def get_http_session(request):
+    """Returns the process-wide requests.Session (with a connection pool)
+    for fetching supporting files and TreeBASE studies, CrossRef lookups and
+    verifying GitHub tokens"""
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None:
+        _HTTP_SESSION = file_proxy.make_session()
+    return _HTTP_SESSION
+
+def open_supporting_file(request, url, message_id):
+    """Returns the path of the cached copy of the supporting file at `url`
+    (attached to the message `message_id`), or an iterator over its content
+    as it is fetched (which stores it in the cache as it goes).
+    Raises an exception if the file cannot be fetched.
+    """
+    cache = get_supporting_file_cache(request)
+    key = ['supporting-file', url, message_id]
+    if cache is not None:
+        fp = cache.get_path(key)
+        if fp is not None:
+            return fp
+    timeout = read_settings(request, 'supporting_file')[2]
+    resp = file_proxy.open_upstream(get_http_session(request), url, timeout)
+    chunks = file_proxy.iter_response(resp)
+    if cache is None:
+        return chunks
+    if request.env.http_range:
+        # a range can only be served from a complete copy
+        return cache.fill(key, chunks)
+    return cache.iter_fill(key, chunks)
+
+_TREEBASE_NEXML_URL = 'https://purl.org/phylo/treebase/phylows/study/TB2:S{}?format=nexml'
+# bytes downloaded between reports of the progress of a TreeBASE fetch
+_TREEBASE_PROGRESS_INTERVAL = 1024 * 1024
+
+def _is_nexml_file(path):
+    "Returns True if the root element of the XML file at `path` is <nexml>"
     try:
-        max_num_trees = int(max_num_trees)
-    except ValueError:
-            raise HTTP(400, json.dumps({"error": 1, "description": 'max number of trees per study in config is not an integer'}))
+        for event, element in cElementTree.iterparse(path, events=('start', )):
+            return element.tag.split('}')[-1] == 'nexml'
+    except SyntaxError:
+        pass
+    return False
+
+def import_treebase_study(request, treebase_id, progress, check_cancelled=None):
+    """Returns new study NexSON made from the NeXML of TreeBASE study
+    `treebase_id`. The NeXML is cached, so a retry does not download it
+    again. progress(stage, **details) is called at the start of each stage
+    ("fetch", "parse", "convert") and as the NeXML downloads; it may raise
+    an exception to stop the import. check_cancelled() (if given) is called
+    as each chunk of the NeXML arrives, and may raise in the same way.
+    """
+    cache = get_treebase_cache(request)
+    key = ['treebase', treebase_id]
+    path = cache.get_path(key) if cache is not None else None
+    temp_path = None
     try:
-        read_only = conf.get("apis", "read_only") == 'true'
-    except:
-        read_only = False
-    return repo_parent, repo_remote, git_ssh, pkey, git_hub_remote, max_filesize, max_num_trees, read_only
-
-def read_collections_config(request):
-    """Load settings for a minor repo with shared tree collections"""
-    conf = get_conf_object(request)
-    collections_repo_parent   = conf.get("apis","collections_repo_parent")
-    collections_repo_remote = conf.get("apis", "collections_repo_remote")
+        if path is None:
+            progress('fetch', num_bytes=0)
+            timeout = read_settings(request, 'treebase_import')[2]
+            url = _TREEBASE_NEXML_URL.format(treebase_id)
+            resp = file_proxy.open_upstream(get_http_session(request), url, timeout)
+            try:
+                def __reporting_chunks():
+                    num_bytes, reported = 0, 0
+                    for chunk in file_proxy.iter_response(resp):
+                        if check_cancelled is not None:
+                            check_cancelled()
+                        num_bytes += len(chunk)
+                        if num_bytes - reported >= _TREEBASE_PROGRESS_INTERVAL:
+                            progress('fetch', num_bytes=num_bytes)
+                            reported = num_bytes
+                        yield chunk
+                if cache is not None:
+                    path = cache.fill(key, __reporting_chunks())
+                else:
+                    handle, temp_path = tempfile.mkstemp(suffix='.xml')
+                    with os.fdopen(handle, 'wb') as outp:
+                        for chunk in __reporting_chunks():
+                            outp.write(chunk)
+                    path = temp_path
+            finally:
+                resp.close()
+        progress('parse')
+        if not _is_nexml_file(path):
+            # e.g. an error page; don't keep it
+            if cache is not None:
+                cache.discard(key)
+            raise ValueError('TreeBASE did not return NeXML for study S{}'.format(treebase_id))
+        progress('convert')
+        return get_ot_study_info_from_treebase_nexml(src=path,
+                                                     nexson_syntax_version=BY_ID_HONEY_BADGERFISH)
+    finally:
+        if temp_path is not None:
+            os.unlink(temp_path)
+
+def _start_index(request, index, shards, thread_name):
+    """Loads the persisted state of `index` and starts a background thread
+    that brings it up to date with `shards` (`ready` is False until then)."""
+    index.load()
+    request = detach_request(request)
+    def _initial_sync():
+        try:
+            index.sync(shards)
+        except:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('building the index in thread {} failed'.format(thread_name))
+    t = threading.Thread(target=_initial_sync, name=thread_name)
+    t.daemon = True
+    t.start()
+
+def _catch_up(request, index, shards, blocking):
+    "Syncs an index that has been built once with the new commits on master"
+    if not index.ready:
+        return
     try:
-        git_ssh     = conf.get("apis", "git_ssh")
+        index.sync(shards, blocking=blocking)
     except:
-        git_ssh = 'ssh'
+        _LOG = get_logger(request, 'ot_api')
+        _LOG.exception('updating an index failed')
+
+_STUDY_INDEX = None
+_STUDY_SHARDS = None
+_INDEX_LOCK = threading.Lock()
+def get_study_shards(request):
+    "Returns the ShardReaders of the phylesystem shards"
+    global _STUDY_SHARDS
+    if _STUDY_SHARDS is None:
+        repo_parent = read_phylesystem_config(request)[0]
+        _STUDY_SHARDS = [ShardReader(name, path) for name, path in find_shards(repo_parent)]
+    return _STUDY_SHARDS
+
+def get_study_index(request):
+    """Returns the process-wide StudyIndex of the studies on master.
+
+    The first call loads the persisted index (kept current by
+    warm_study_index when web2py starts) and starts a background thread
+    that brings it up to date (`ready` is False until then). Later calls
+    return at once, leaving the catch-up on new commits (which reads the
+    changed studies) to a background worker.
+    """
+    global _STUDY_INDEX
+    if _STUDY_INDEX is None:
+        with _INDEX_LOCK:
+            if _STUDY_INDEX is None:
+                index = StudyIndex(read_settings(request, 'study_index'))
+                _start_index(request, index, get_study_shards(request), 'ot-study-index')
+                _STUDY_INDEX = index
+                return index
+    if _STUDY_INDEX.ready:
+        run_once_in_background(request, 'ot-study-index', ('study_index',),
+                               _catch_up, detach_request(request), _STUDY_INDEX, get_study_shards(request), True)
+    return _STUDY_INDEX
+
+def warm_study_index(request):
+    """Brings the persisted StudyIndex up to date with master, in this
+    thread, so that a server starting afterwards only reads the studies
+    changed since. Run by the crontab when web2py starts."""
+    index = StudyIndex(read_settings(request, 'study_index'))
+    index.load()
+    index.sync(get_study_shards(request))
+    return index
+
+# doc_type -> directory of the documents in each shard of its docstore
+_DOC_DIRS = {'nexson': 'study',
+             'collection': 'collections-by-owner',
+             'amendment': 'amendments', }
+_HISTORY_INDICES = {}
+def get_history_index(request, doc_type='nexson'):
+    """Returns (HistoryIndex, shards) for the docstore of `doc_type` ("nexson",
+    "collection" or "amendment"), starting the index on first use."""
     try:
-        pkey        = conf.get("apis", "pkey")
-    except:
-        pkey = None
+        return _HISTORY_INDICES[doc_type]
+    except KeyError:
+        pass
+    with _INDEX_LOCK:
+        if doc_type not in _HISTORY_INDICES:
+            doc_dir = _DOC_DIRS[doc_type]
+            if doc_type == 'nexson':
+                repo_parent = read_phylesystem_config(request)[0]
+            elif doc_type == 'collection':
+                repo_parent = read_collections_config(request)[0]
+            else:
+                repo_parent = read_amendments_config(request)[0]
+            shards = [ShardReader(name, path, doc_dir) for name, path in find_shards(repo_parent, doc_dir)]
+            filepath = os.path.join(read_settings(request, 'history_index'), doc_type + '.json')
+            index = HistoryIndex(filepath)
+            _start_index(request, index, shards, 'ot-history-' + doc_type)
+            _HISTORY_INDICES[doc_type] = (index, shards)
+    return _HISTORY_INDICES[doc_type]
+
+def get_version_history(request, docstore, doc_id, doc_type='nexson', limit=None, offset=0):
+    """Returns the versionHistory list (newest first) of a document on master,
+    skipping the first `offset` commits and returning at most `limit`.
+
+    Uses the history index, falling back to `git log` while it is being built.
+    """
+    index, shards = get_history_index(request, doc_type)
+    _catch_up(request, index, shards, blocking=True)
+    h = index.history(doc_id, limit=limit, offset=offset)
+    if h is None:
+        if doc_type == 'nexson':
+            h = docstore.get_version_history_for_study_id(doc_id)
+        else:
+            h = docstore.get_version_history_for_doc_id(doc_id)
+        end = None if limit is None else offset + limit
+        h = h[offset:end]
+    return h
+
+def read_study_blob_ranges(request, blob_sha, ranges):
+    "Reads byte ranges of a study file (by blob SHA) from whichever shard holds it"
+    for shard in get_study_shards(request):
+        contents = shard.read_blob_ranges(blob_sha, ranges)
+        if contents is not None:
+            return contents
+    return None
+
+def build_study_offset_index(request, blob_sha, content=None):
+    """Builds and caches the offset index of a version of a study file.
+    `content` is the file, if the caller has already read it."""
+    cache = get_offset_index_cache(request)
+    key = ['offsets', blob_sha]
+    if cache.get(key) is not None:
+        return
+    if content is None:
+        content = read_study_blob_ranges(request, blob_sha, [(0, None)])[0]
+    cache.put(key, nexson_index.build_offset_index(content))
+
+def schedule_study_offset_index(request, blob_sha):
+    "Builds the offset index of a study file on a background thread"
+    request = detach_request(request)
+    run_once_in_background(request, 'ot-offset-index', ('offsets', blob_sha),
+                            build_study_offset_index, request, blob_sha)
+
+def materialize_study_exports(request, blob_sha, content=None):
+    """Converts every tree of a version of a study file to the formats listed
+    in the "materialized_exports" setting (see study_exports) and stores the
+    results in the conversion cache. Also builds the offset index of the file.
+    """
+    formats = read_settings(request, 'materialized_exports')
+    if content is None:
+        content = read_study_blob_ranges(request, blob_sha, [(0, None)])[0]
+    build_study_offset_index(request, blob_sha, content)
+    if not formats:
+        return
+    repo_nexml2json = get_phylesystem(request).repo_nexml2json
+    def _make_schema(**kwargs):
+        return PhyloSchema(repo_nexml2json=repo_nexml2json, **kwargs)
+    study_exports.materialize_tree_exports(json.loads(content),
+                                           blob_sha,
+                                           formats,
+                                           get_conversion_cache(request),
+                                           _make_schema,
+                                           PhyloSchema('nexson', version=repo_nexml2json))
+
+def schedule_study_exports(request, study_id, commit_sha=None):
+    """Materializes the exports of a study (as it is on master, or in
+    `commit_sha`) on a background thread, so that the write that created
+    this version does not wait for them."""
     try:
-        git_hub_remote = conf.get("apis", "git_hub_remote")
+        blob_sha = get_doc_blob_sha(get_phylesystem(request), study_id, commit_sha)[1]
     except:
-        git_hub_remote = 'git@github.com:OpenTreeOfLife'
+        # the study is not in that commit (it was deleted)
+        return
+    if not blob_sha:
+        return
+    request = detach_request(request)
+    run_once_in_background(request, 'ot-study-exports', ('exports', blob_sha),
+                            materialize_study_exports, request, blob_sha)
+
+def read_study_fragment(request, blob_sha, return_type, content_id):
+    """Returns a NexSON document with just the parts of a study file (by blob
+    SHA) needed for a tree, subtree, otus or otu GET, or None if the whole
+    study has to be read. A missing offset index is built in the background.
+    """
+    if return_type not in nexson_index.FRAGMENT_RETURN_TYPES:
+        return None
+    index = get_offset_index_cache(request).get(['offsets', blob_sha])
+    if index is None:
+        schedule_study_offset_index(request, blob_sha)
+        return None
     try:
-        max_filesize = conf.get("filesize", "collections_max_file_size")
+        def _read(ranges):
+            return read_study_blob_ranges(request, blob_sha, ranges)
+        return nexson_index.extract_nexson(index, return_type, content_id, _read)
     except:
-        max_filesize = '20000000'
-    return collections_repo_parent, collections_repo_remote, git_ssh, pkey, git_hub_remote, max_filesize
+        _LOG = get_logger(request, 'ot_api')
+        _LOG.exception('reading parts of blob {} failed'.format(blob_sha))
+        return None
 
-def read_amendments_config(request):
-    """Load settings for a minor repo with shared taxonomic amendments"""
-    conf = get_conf_object(request)
-    amendments_repo_parent   = conf.get("apis","amendments_repo_parent")
-    amendments_repo_remote = conf.get("apis", "amendments_repo_remote")
-    try:
-        git_ssh     = conf.get("apis", "git_ssh")
-    except:
-        git_ssh = 'ssh'
+def after_study_write(request, study_id):
+    """Called after a study has been created, updated or deleted, to bring the
+    indices of the studies on master up to date."""
     try:
-        pkey        = conf.get("apis", "pkey")
+        get_study_index(request)
+        index, shards = get_history_index(request, 'nexson')
+        _catch_up(request, index, shards, blocking=False)
+        schedule_study_exports(request, study_id)
     except:
-        pkey = None
+        # the write itself succeeded, so this must not fail the request
+        _LOG = get_logger(request, 'ot_api')
+        _LOG.exception('updating the study indices after writing study {} failed'.format(study_id))
+
+def spool_bulk_ingest(request, body):
+    """Copies the NDJSON body of a bulk ingest to a new staging directory
+    (where the ingest will put its files), and returns the directory"""
+    staging_parent = read_settings(request, 'bulk_ingest')[3]
+    if not os.path.isdir(staging_parent):
+        os.makedirs(staging_parent)
+    staging_dir = tempfile.mkdtemp(dir=staging_parent)
+    with open(os.path.join(staging_dir, 'studies.ndjson'), 'wb') as outp:
+        shutil.copyfileobj(body, outp)
+    return staging_dir
+
+def run_bulk_ingest(request, staging_dir, auth_info):
+    """Ingests the studies spooled to `staging_dir` by spool_bulk_ingest
+    (see bulk_ingest.ingest), updates the indices and removes the directory.
+    Returns (the outcome for each study, the commits made)."""
+    phylesystem = get_phylesystem(request)
+    max_filesize, max_num_trees = read_phylesystem_config(request)[5:7]
     try:
-        git_hub_remote = conf.get("apis", "git_hub_remote")
-    except:
-        git_hub_remote = 'git@github.com:OpenTreeOfLife'
-    try:
-        max_filesize = conf.get("filesize", "amendments_max_file_size")
-    except:
-        max_filesize = '20000000'
-    return amendments_repo_parent, amendments_repo_remote, git_ssh, pkey, git_hub_remote, max_filesize
+        with open(os.path.join(staging_dir, 'studies.ndjson'), 'rb') as inp:
+            documents = bulk_ingest.read_documents(inp, staging_dir, int(max_filesize))
+            outcomes, commits = bulk_ingest.ingest(phylesystem,
+                                                   documents,
+                                                   auth_info,
+                                                   phylesystem.repo_nexml2json,
+                                                   max_num_trees,
+                                                   staging_dir,
+                                                   processes=read_settings(request, 'bulk_ingest')[1])
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    for commit in commits:
+        for study_id in commit['study_ids']:
+            after_study_write(request, study_id)
+    return outcomes, commits
+
+def get_doc_blob_sha(docstore, doc_id, commit_sha=None):
+    """Returns the commit SHA (`commit_sha` or the HEAD of master) and the git
+    blob SHA of `doc_id` at that commit, without reading the document.
+    """
+    ga = docstore.create_git_action(doc_id)
+    head_sha = commit_sha or ga.get_master_sha()
+    blob_sha = ga.get_blob_sha_for_file(ga.path_for_doc(doc_id), head_sha)
+    return head_sha, blob_sha
+
+def get_wip_branch_shas(docstore, doc_id, branch_pattern=None):
+    """Returns a sorted list of [branch name, SHA] for the branches other
+    than master of the repo holding `doc_id` whose names match the regular
+    expression `branch_pattern` (all of them if it is None), without reading
+    the document. This is the state behind the branch2sha of a GET."""
+    ga = docstore.create_git_action(doc_id)
+    out = str(git('--git-dir={}'.format(os.path.join(ga.repo, '.git')),
+                  'for-each-ref', '--format=%(refname:short) %(objectname)', 'refs/heads/',
+                  _tty_out=False))
+    pattern = re.compile(branch_pattern) if branch_pattern else None
+    branches = []
+    for line in out.splitlines():
+        ref = line.split()
+        if len(ref) != 2 or ref[0] == 'master':
+            continue
+        if pattern is None or pattern.search(ref[0]):
+            branches.append(ref)
+    return sorted(branches)
+
+def get_study_wip_map(phylesystem, study_id):
+    "Returns a sorted list of [branch name, SHA] for the WIP branches of `study_id`"
+    return get_wip_branch_shas(phylesystem, study_id, r'_study_{}_[0-9]+$'.format(re.escape(study_id)))
 
-def read_favorites_config(request):
-    """Load settings for a minor repo with per-user 'favorites' information"""
-    conf = get_conf_object(request)
-    favorites_repo_parent   = conf.get("apis","favorites_repo_parent")
-    favorites_repo_remote = conf.get("apis", "favorites_repo_remote")
-    try:
-        git_ssh     = conf.get("apis", "git_ssh")
-    except:
-        git_ssh = 'ssh'
-    try:
-        pkey        = conf.get("apis", "pkey")
-    except:
-        pkey = None
-    try:
-        git_hub_remote = conf.get("apis", "git_hub_remote")
-    except:
-        git_hub_remote = 'git@github.com:OpenTreeOfLife'
-    return favorites_repo_parent, favorites_repo_remote, git_ssh, pkey, git_hub_remote
+def get_failed_push_filepath(request, doc_type=None):
+    filenames_by_content_type = {'nexson': "PUSH_FAILURE_nexson.json",
+                                 'collection': "PUSH_FAILURE_collection.json",
+                                 'amendment': "PUSH_FAILURE_amendment.json",
+                                 'favorites': "PUSH_FAILURE_favorites.json"}
+    content_type = doc_type or request.vars.get('doc_type', 'nexson')
+    failure_filename = filenames_by_content_type[content_type]
+    return os.path.join(get_private_dir(request), failure_filename)
 
-def read_logging_config(request):
-    conf = get_conf_object(request)
-    try:
-        level = conf.get("logging", "level")
-        if not level.strip():
-            level = 'WARNING'
-    except:
-        level = 'WARNING'
+def read_phylesystem_config(request):
+    """Load settings for managing the main Nexson docstore"""
     try:
-        logging_format_name = conf.get("logging", "formatter")
-        if not logging_format_name.strip():
-            logging_format_name = 'NONE'
-    except:
-        logging_format_name = 'NONE'
+        return get_conf_object(request).phylesystem_config()
+    except ValueError as x:
+        raise HTTP(400, json.dumps({"error": 1, "description": str(x)}))
+
+_GITHUB_USER_URL = 'https://api.github.com/user'
+_GITHUB_TIMEOUT = 10
+
+def _verify_github_token(request, auth_token):
+    """Returns the login, name and email of the GitHub user of `auth_token`,
+    or None if GitHub rejects the token. Verified tokens (and rejected ones)
+    are cached, so that a curator's requests don't each call GitHub."""
+    cache = get_auth_cache(request)
+    fingerprint = auth_token_fingerprint(auth_token)
+    miss = object()
+    gh_user = cache.get(fingerprint, miss)
+    if gh_user is not miss:
+        return gh_user
     try:
-        logging_filepath = conf.get("logging", "filepath")
-        if not logging_filepath.strip():
-            logging_filepath = None
-    except:
-        logging_filepath = None
-    return level, logging_format_name, logging_filepath
+        resp = get_http_session(request).get(_GITHUB_USER_URL,
+                                             headers={'Authorization': 'token {}'.format(auth_token),
+                                                      'Accept': 'application/vnd.github.v3+json'},
+                                             timeout=_GITHUB_TIMEOUT)
+    except Exception as x:
+        raise HTTP(502, json.dumps({
+            "error": 1,
+            "description": "Could not verify your authentication token with GitHub: {}".format(x)
+        }))
+    if resp.status_code == 401:
+        ttl, invalid_ttl, max_items = read_settings(request, 'auth_cache')
+        cache.put(fingerprint, None, ttl=invalid_ttl)
+        return None
+    if resp.status_code != 200:
+        raise HTTP(502, json.dumps({
+            "error": 1,
+            "description": "Could not verify your authentication token with GitHub (status {})".format(resp.status_code)
+        }))
+    user = resp.json()
+    gh_user = {'login': user['login'],
+               'name': user.get('name'),
+               'email': user.get('email'), }
+    cache.put(fingerprint, gh_user)
+    return gh_user
 
 def authenticate(**kwargs):
     """Verify that we received a valid Github authentication token
@@ -306,10 +704,11 @@ def authenticate(**kwargs):
     over-rides the author_name and author_email associated with the
     given token, if they are present.
 
-    Returns a PyGithub object, author name and author email.
+    Returns a dict with the GitHub login, author name and author email.
 
     This method will return HTTP 400 if the auth token is not present
-    or if it is not valid, i.e. if PyGithub throws a BadCredentialsException.
+    or if GitHub does not accept it. Tokens are checked against GitHub
+    at most once per auth_cache_ttl (see _verify_github_token).
 
     """
     # this is the GitHub API auth-token for a logged-in curator
@@ -320,113 +719,25 @@ def authenticate(**kwargs):
             "error": 1,
             "description":"You must provide an auth_token to authenticate to the OpenTree API"
         }))
-    gh           = Github(auth_token)
-    gh_user      = gh.get_user()
-    auth_info = {}
-    try:
-        auth_info['login'] = gh_user.login
-    except BadCredentialsException:
+    gh_user = _verify_github_token(current.request, auth_token)
+    if gh_user is None:
         raise HTTP(400,json.dumps({
             "error": 1,
             "description":"You have provided an invalid or expired authentication token"
         }))
-
+    auth_info = {}
+    auth_info['login'] = gh_user['login']
     auth_info['name'] = kwargs.get('author_name')
     auth_info['email'] = kwargs.get('author_email')
 
-    # use the Github Oauth token to get a name/email if not specified
-    # we don't provide these as default values above because they would
-    # generate API calls regardless of author_name/author_email being specifed
-
+    # use the name/email of the GitHub user if not specified
     if auth_info['name'] is None:
-        auth_info['name'] = gh_user.name
+        auth_info['name'] = gh_user['name']
     if auth_info['email'] is None:
-        auth_info['email']= gh_user.email
+        auth_info['email']= gh_user['email']
     return auth_info
 
 
-_LOGGING_LEVEL_ENVAR="OT_API_LOGGING_LEVEL"
-_LOGGING_FORMAT_ENVAR="OT_API_LOGGING_FORMAT"
-_LOGGING_FILE_PATH_ENVAR = 'OT_API_LOG_FILE_PATH'
-
-def _get_logging_level(s=None):
-    if s is None:
-        return logging.NOTSET
-    supper = s.upper()
-    if supper == "NOTSET":
-        level = logging.NOTSET
-    elif supper == "DEBUG":
-        level = logging.DEBUG
-    elif supper == "INFO":
-        level = logging.INFO
-    elif supper == "WARNING":
-        level = logging.WARNING
-    elif supper == "ERROR":
-        level = logging.ERROR
-    elif supper == "CRITICAL":
-        level = logging.CRITICAL
-    else:
-        level = logging.NOTSET
-    return level
-
-def _get_logging_formatter(s=None):
-    if s is None:
-        s == 'NONE'
-    else:
-        s = s.upper()
-    rich_formatter = logging.Formatter("[%(asctime)s] %(filename)s (%(lineno)d): %(levelname) 8s: %(message)s")
-    simple_formatter = logging.Formatter("%(levelname) 8s: %(message)s")
-    raw_formatter = logging.Formatter("%(message)s")
-    default_formatter = None
-    logging_formatter = default_formatter
-    if s == "RICH":
-        logging_formatter = rich_formatter
-    elif s == "SIMPLE":
-        logging_formatter = simple_formatter
-    else:
-        logging_formatter = None
-    if logging_formatter is not None:
-        logging_formatter.datefmt='%H:%M:%S'
-    return logging_formatter
-
-def get_logger(request, name="ot_api"):
-    """
-    Returns a logger with name set as given, and configured
-    to the level given by the environment variable _LOGGING_LEVEL_ENVAR.
-    """
-
-#     package_dir = os.path.dirname(module_path)
-#     config_filepath = os.path.join(package_dir, _LOGGING_CONFIG_FILE)
-#     if os.path.exists(config_filepath):
-#         try:
-#             logging.config.fileConfig(config_filepath)
-#             logger_set = True
-#         except:
-#             logger_set = False
-    logger = logging.getLogger(name)
-    if len(logger.handlers) == 0:
-        if request is None:
-            level = _get_logging_level(os.environ.get(_LOGGING_LEVEL_ENVAR))
-            logging_formatter = _get_logging_formatter(os.environ.get(_LOGGING_FORMAT_ENVAR))
-            logging_filepath = os.environ.get(_LOGGING_FILE_PATH_ENVAR)
-        else:
-            level_str, logging_format_name, logging_filepath = read_logging_config(request)
-            logging_formatter = _get_logging_formatter(logging_format_name)
-            level = _get_logging_level(level_str)
-
-        logger.setLevel(level)
-        if logging_filepath is not None:
-            log_dir = os.path.split(logging_filepath)[0]
-            if log_dir and not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            ch = logging.FileHandler(logging_filepath)
-        else:
-            ch = logging.StreamHandler()
-        ch.setLevel(level)
-        ch.setFormatter(logging_formatter)
-        logger.addHandler(ch)
-    return logger
-
 def log_time_diff(log_obj, operation='', prev_time=None):
     '''If prev_time is not None, logs (at debug level) to
     log_obj the difference between now and the naive datetime
@@ -453,12 +764,7 @@ def get_otindex_base_url(request):
     return otindex_base_url
 
 def get_oti_base_url(request):
-    conf = get_conf_object(request)
-    oti_base_url = conf.get("apis", "oti_base_url")
-    if oti_base_url.startswith('//'):
-        # Prepend scheme to a scheme-relative URL
-        oti_base_url = "https:" + oti_base_url
-    return oti_base_url
+    return get_conf_object(request).base_url("oti_base_url")
 
 def get_oti_domain(request):
     oti_base = get_oti_base_url(request)
@@ -467,28 +773,13 @@ def get_oti_domain(request):
     return '/'.join(s[:3])
 
 def get_collections_api_base_url(request):
-    conf = get_conf_object(request)
-    base_url = conf.get("apis", "collections_api_base_url")
-    if base_url.startswith('//'):
-        # Prepend scheme to a scheme-relative URL
-        base_url = "https:" + base_url
-    return base_url
+    return get_conf_object(request).base_url("collections_api_base_url")
 
 def get_amendments_api_base_url(request):
-    conf = get_conf_object(request)
-    base_url = conf.get("apis", "amendments_api_base_url")
-    if base_url.startswith('//'):
-        # Prepend scheme to a scheme-relative URL
-        base_url = "https:" + base_url
-    return base_url
+    return get_conf_object(request).base_url("amendments_api_base_url")
 
 def get_favorites_api_base_url(request):
-    conf = get_conf_object(request)
-    base_url = conf.get("apis", "favorites_api_base_url")
-    if base_url.startswith('//'):
-        # Prepend scheme to a scheme-relative URL
-        base_url = "http:" + base_url
-    return base_url
+    return get_conf_object(request).base_url("favorites_api_base_url", scheme='http:')
 
 def clear_matching_cache_keys(key_pattern):
     # ASSUMES we're working with RAM cache
@@ -0,0 +1,167 @@
+"""Ingest of many new studies at once (for example, a migration of
+phylografter or TreeBASE studies) in one request and one background job.
+
+The studies are sent as NDJSON: one JSON object per line, either a NexSON
+document or {"id": ..., "nexson": ...} to give the study its ID. They are
+validated and converted by a pool of worker processes (validation is
+CPU-bound Python, so threads would take turns holding the GIL), which write
+the results to a staging directory. The valid studies are then added one at
+a time with Phylesystem.ingest_new_study, the same public write path as a
+POST of a new study, which commits each one and records its ID.
+"""
+from peyotl.phylesystem.git_workflows import GitWorkflowError, \
+                                             validate_and_convert_nexson
+from peyotl.nexson_syntax import write_as_json
+import multiprocessing
+import json
+import os
+
+def read_documents(lines, staging_dir, max_doc_bytes=None):
+    """Yields (line number, requested study ID or None, path of the document
+    or None, error message or None) for each non-blank line of NDJSON. Each
+    document is written to `staging_dir`, to be read by a worker, so that
+    only one is held in memory at a time."""
+    for line_num, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if max_doc_bytes is not None and len(line) > max_doc_bytes:
+            yield line_num, None, None, 'The document is {s} bytes; the limit is {m} bytes'.format(s=len(line), m=max_doc_bytes)
+            continue
+        try:
+            doc = json.loads(line)
+            if not isinstance(doc, dict):
+                raise ValueError('not a JSON object')
+        except ValueError as x:
+            yield line_num, None, None, 'Expecting a JSON object ({})'.format(x)
+            continue
+        study_id = doc.get('id')
+        if 'nexson' in doc:
+            doc = doc['nexson']
+        elif study_id is not None:
+            yield line_num, None, None, 'A document with an "id" must hold the study in "nexson"'
+            continue
+        if not isinstance(doc, dict) or 'nexml' not in doc:
+            yield line_num, None, None, 'Expecting NexSON (an object with "nexml")'
+            continue
+        if study_id is not None:
+            study_id = str(study_id)
+            try:
+                int(study_id)
+            except ValueError:
+                pass
+            else:
+                # a bare number is a phylografter study ID, as in POST v1/study/{id}
+                study_id = 'pg_' + study_id
+        doc_path = os.path.join(staging_dir, '{}.in.json'.format(line_num))
+        with open(doc_path, 'wb') as outp:
+            outp.write(line)
+        yield line_num, study_id, doc_path, None
+
+def validate_document(task):
+    """Validates one study and converts it to the NexSON version of the repo,
+    writing the result to the staging directory. Runs in a worker process,
+    so `task` and the result hold only plain data and file paths.
+
+    `task` is (line number, study ID or None, path of the document,
+    repo_nexml2json, max_num_trees, staging_dir). Returns a dict with the
+    'line' and 'id', and the 'path' of the converted file or an 'error' message.
+    """
+    line_num, study_id, doc_path, repo_nexml2json, max_num_trees, staging_dir = task
+    result = {'line': line_num, 'id': study_id}
+    try:
+        with open(doc_path, 'rb') as inp:
+            nexson = json.load(inp)
+        os.unlink(doc_path)
+        if 'nexson' in nexson:
+            nexson = nexson['nexson']
+        if study_id is not None:
+            nexson['nexml']['^ot:studyId'] = study_id
+        bundle = validate_and_convert_nexson(nexson,
+                                             repo_nexml2json,
+                                             allow_invalid=False,
+                                             max_num_trees_per_study=max_num_trees)
+        nexson = bundle[0]
+        path = os.path.join(staging_dir, '{}.json'.format(line_num))
+        write_as_json(nexson, path)
+        result['path'] = path
+    except GitWorkflowError as x:
+        result['error'] = x.msg or 'Invalid NexSON'
+    except Exception as x:
+        result['error'] = str(x) or x.__class__.__name__
+    return result
+
+def validate_documents(tasks, processes=None):
+    """Returns the results of validate_document for `tasks`, in order,
+    running them in a pool of `processes` worker processes (in this process
+    if `processes` is None or 1). The pool lasts only as long as the call."""
+    if not processes or processes < 2 or len(tasks) < 2:
+        return [validate_document(t) for t in tasks]
+    pool = multiprocessing.Pool(min(processes, len(tasks)))
+    try:
+        return pool.map(validate_document, tasks, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+def add_study(phylesystem, path, study_id, repo_nexml2json, auth_info):
+    """Adds the converted study in `path` with Phylesystem.ingest_new_study
+    (which mints a new ID if `study_id` is None), and removes the file.
+    Returns (the study ID, the commit returned by ingest_new_study)."""
+    try:
+        with open(path, 'rb') as inp:
+            nexson = json.load(inp)
+    finally:
+        os.unlink(path)
+    study_id, commit = phylesystem.ingest_new_study(nexson, repo_nexml2json, auth_info, study_id)
+    if commit['error'] != 0:
+        raise GitWorkflowError(commit.get('description') or 'Commit of study #{} failed'.format(study_id))
+    return study_id, commit
+
+def ingest(phylesystem, documents, auth_info, repo_nexml2json, max_num_trees,
+           staging_dir, processes=None):
+    """Adds the new studies in `documents` (as yielded by read_documents,
+    with the same `staging_dir`) to `phylesystem`, validating them in
+    `processes` worker processes. Studies without an ID get a newly minted one.
+
+    Returns (a list with a dict describing the outcome for each document,
+    a list of {"shard", "sha", "study_ids"} for each shard written, where
+    "sha" is the shard's master after its last new study).
+    """
+    known_ids = set(phylesystem.get_study_ids())
+    outcomes = []
+    tasks = []
+    for line_num, study_id, doc_path, error in documents:
+        if error is None and study_id is not None:
+            if study_id in known_ids:
+                error = 'Study ID "{}" is already in use'.format(study_id)
+            else:
+                known_ids.add(study_id)
+        if error is not None:
+            if doc_path is not None:
+                os.unlink(doc_path)
+            outcomes.append({'line': line_num, 'id': study_id, 'error': error})
+            continue
+        tasks.append((line_num, study_id, doc_path, repo_nexml2json, max_num_trees, staging_dir))
+    by_shard = {}
+    for result in validate_documents(tasks, processes):
+        outcomes.append(result)
+        path = result.pop('path', None)
+        if path is None:
+            continue
+        try:
+            study_id, commit = add_study(phylesystem, path, result['id'], repo_nexml2json, auth_info)
+        except GitWorkflowError as x:
+            result['error'] = x.msg or 'Commit failed'
+            continue
+        except Exception as x:
+            result['error'] = str(x) or x.__class__.__name__
+            continue
+        result['id'] = study_id
+        shard = phylesystem.get_repo_and_path_fragment(study_id)[0]
+        if shard not in by_shard:
+            by_shard[shard] = {'shard': shard, 'sha': None, 'study_ids': []}
+        by_shard[shard]['sha'] = commit['sha']
+        by_shard[shard]['study_ids'].append(study_id)
+    outcomes.sort(key=lambda o: o['line'])
+    return outcomes, [by_shard[shard] for shard in sorted(by_shard.keys())]
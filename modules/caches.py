@@ -0,0 +1,161 @@
+"""The process-wide caches of the API, each created (from its settings in
+the config file) on first use, and the functions that make their keys.
+"""
+from tiered_cache import LRUCache, DiskCache, TieredCache, TTLCache
+from validation_cache import ValidationCache, validation_cache_key
+from api_config import read_settings, get_logger
+import file_proxy
+import hashlib
+
+_CONVERSION_CACHE = None
+def get_conversion_cache(request):
+    """Returns the process-wide cache of converted study outputs (NEXUS,
+    newick, NeXML and older NexSON versions), keyed by conversion_cache_key.
+    """
+    global _CONVERSION_CACHE
+    if _CONVERSION_CACHE is not None:
+        return _CONVERSION_CACHE
+    max_items, cache_dir, max_bytes = read_settings(request, 'conversion_cache')
+    disk = None
+    if cache_dir:
+        try:
+            disk = DiskCache(cache_dir, max_bytes=max_bytes)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create conversion cache dir "{}". Using RAM only.'.format(cache_dir))
+    _CONVERSION_CACHE = TieredCache(LRUCache(max_items), disk)
+    return _CONVERSION_CACHE
+
+# request arguments (besides the output format) that change the result of PhyloSchema.convert
+_CONVERSION_OPTION_NAMES = ('output_nexml2json',
+                            'format',
+                            'tip_label',
+                            'otu_label',
+                            'bracket_ingroup',
+                            'cull_nonmatching', )
+def conversion_cache_key(blob_sha, schema, content, content_id, kwargs):
+    """Returns the key of the converted output of the study with git `blob_sha`.
+    `kwargs` are the (normalized) request arguments used to create `schema`.
+    """
+    if isinstance(content_id, tuple):
+        content_id = list(content_id)
+    return ['conversion', blob_sha, content, content_id, schema.description, conversion_options(kwargs)]
+
+def conversion_options(kwargs):
+    "Returns the conversion-related request arguments as a list of [name, value] pairs"
+    return [[n, kwargs.get(n)] for n in _CONVERSION_OPTION_NAMES]
+
+_ANNOTATION_CACHE = None
+def get_annotation_cache(request):
+    """Returns the process-wide cache of the changes that the validation
+    annotation makes to each version of a study, keyed by annotation_cache_key."""
+    global _ANNOTATION_CACHE
+    if _ANNOTATION_CACHE is not None:
+        return _ANNOTATION_CACHE
+    max_items, cache_dir = read_settings(request, 'annotation_cache')
+    disk = None
+    if cache_dir:
+        try:
+            disk = DiskCache(cache_dir)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create annotation cache dir "{}". Using RAM only.'.format(cache_dir))
+    _ANNOTATION_CACHE = TieredCache(LRUCache(max_items), disk)
+    return _ANNOTATION_CACHE
+
+def annotation_cache_key(blob_sha, repo_nexml2json):
+    return ['annotation', blob_sha, repo_nexml2json]
+
+_VALIDATION_CACHE = None
+def get_validation_cache(request):
+    """Returns the process-wide (RAM only) ValidationCache of the outcomes of
+    validating uploaded NexSON, keyed by validation_cache_key."""
+    global _VALIDATION_CACHE
+    if _VALIDATION_CACHE is None:
+        _VALIDATION_CACHE = ValidationCache(read_settings(request, 'validation_cache'))
+    return _VALIDATION_CACHE
+
+_AUTH_CACHE = None
+def get_auth_cache(request):
+    """Returns the process-wide TTLCache of verified GitHub tokens, keyed
+    by auth_token_fingerprint. Tokens that GitHub rejected are cached (for
+    a shorter time) as None."""
+    global _AUTH_CACHE
+    if _AUTH_CACHE is None:
+        ttl, invalid_ttl, max_items = read_settings(request, 'auth_cache')
+        _AUTH_CACHE = TTLCache(max_items, ttl)
+    return _AUTH_CACHE
+
+def auth_token_fingerprint(auth_token):
+    "Returns the key of a token in the auth cache (so tokens are not held in memory)"
+    if not isinstance(auth_token, bytes):
+        auth_token = auth_token.encode('utf-8')
+    return hashlib.sha256(auth_token).hexdigest()
+
+_MARKDOWN_CACHE = None
+def get_markdown_cache(request):
+    """Returns the process-wide LRUCache of rendered (and sanitized) Markdown,
+    keyed by markdown_cache_key"""
+    global _MARKDOWN_CACHE
+    if _MARKDOWN_CACHE is None:
+        _MARKDOWN_CACHE = LRUCache(read_settings(request, 'markdown_cache'))
+    return _MARKDOWN_CACHE
+
+def markdown_cache_key(markdown_src, open_links_in_new_window):
+    if not isinstance(markdown_src, bytes):
+        markdown_src = markdown_src.encode('utf-8')
+    return (hashlib.sha1(markdown_src).hexdigest(), bool(open_links_in_new_window))
+
+_OFFSET_INDEX_CACHE = None
+def get_offset_index_cache(request):
+    """Returns the process-wide cache of the byte-offset indices of study
+    files (see nexson_index), keyed by ['offsets', blob SHA]."""
+    global _OFFSET_INDEX_CACHE
+    if _OFFSET_INDEX_CACHE is not None:
+        return _OFFSET_INDEX_CACHE
+    max_items, cache_dir = read_settings(request, 'offset_index')
+    disk = None
+    if cache_dir:
+        try:
+            disk = DiskCache(cache_dir)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create offset index dir "{}". Using RAM only.'.format(cache_dir))
+    _OFFSET_INDEX_CACHE = TieredCache(LRUCache(max_items), disk)
+    return _OFFSET_INDEX_CACHE
+
+_SUPPORTING_FILE_CACHE = None
+def get_supporting_file_cache(request):
+    """Returns the process-wide FileCache of supporting files fetched from
+    the curation site, or None if it is disabled or cannot be created."""
+    global _SUPPORTING_FILE_CACHE
+    if _SUPPORTING_FILE_CACHE is not None:
+        return _SUPPORTING_FILE_CACHE or None
+    cache_dir, max_bytes = read_settings(request, 'supporting_file')[:2]
+    cache = False
+    if cache_dir:
+        try:
+            cache = file_proxy.FileCache(cache_dir, max_bytes=max_bytes)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create supporting file cache dir "{}"'.format(cache_dir))
+    _SUPPORTING_FILE_CACHE = cache
+    return cache or None
+
+_TREEBASE_CACHE = None
+def get_treebase_cache(request):
+    """Returns the process-wide FileCache of NeXML fetched from TreeBASE
+    (keyed by TreeBASE study ID), or None if it is disabled or cannot be created."""
+    global _TREEBASE_CACHE
+    if _TREEBASE_CACHE is not None:
+        return _TREEBASE_CACHE or None
+    cache_dir, max_bytes = read_settings(request, 'treebase_import')[:2]
+    cache = False
+    if cache_dir:
+        try:
+            cache = file_proxy.FileCache(cache_dir, max_bytes=max_bytes)
+        except OSError:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('could not create TreeBASE cache dir "{}"'.format(cache_dir))
+    _TREEBASE_CACHE = cache
+    return cache or None
@@ -0,0 +1,205 @@
+"""Folds rapid successive saves of a document by one curator into a single
+commit. Each save of a study is a whole new version of it, so of the saves
+that start from the same commit only the latest content needs committing.
+
+A save that is coalesced is not committed at once: it is held for up to
+`window` seconds (counted from the first save held), during which later
+saves from the same starting commit replace its content and add their
+commit messages. The held save is then committed by calling the latest
+save's commit function, as a job of a JobRegistry; all of the saves that
+were folded into the commit report its outcome (with the SHA of the new
+commit, the starting commit of the client's next save) through that job.
+
+Only saves from the same starting commit are folded together. A save from
+another commit is not held: the held saves are committed, and the save is
+then committed at once from its own starting commit, as without coalescing
+(so that an out-of-date starting commit is detected as usual).
+
+The saves are held in the memory of one process, but a marker for each key
+with held saves (naming the process holding them and its job) is kept as a
+file in `state_dir`. A process given a save for a key that another process
+holds saves for waits for them to be committed, for at most two windows,
+and then has the save committed at once. The held saves of a process that
+has died are reported as failed by their job.
+"""
+from tiered_cache import key_digest
+import threading
+import tempfile
+import errno
+import time
+import json
+import os
+
+DEFAULT_WINDOW = 10.0
+# seconds between checks for the commit of saves held by another process
+_POLL_INTERVAL = 0.1
+
+
+def _process_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as x:
+        return x.errno == errno.EPERM
+    return True
+
+
+class CommitCoalescer(object):
+    def __init__(self, registry, state_dir, window=DEFAULT_WINDOW):
+        self.registry = registry
+        self.state_dir = state_dir
+        self.window = window
+        self._held_dir = os.path.join(state_dir, 'held')
+        if not os.path.isdir(self._held_dir):
+            try:
+                os.makedirs(self._held_dir)
+            except OSError:
+                if not os.path.isdir(self._held_dir):
+                    raise
+        self._cond = threading.Condition()
+        # key -> {'parent', 'commit_fn', 'messages', 'count', 'timer', 'job'}
+        self._pending = {}
+        # keys whose held saves are being committed
+        self._flushing = set()
+
+    def _held_path(self, key):
+        return os.path.join(self._held_dir, key_digest(key) + '.json')
+
+    def _read_json(self, path):
+        try:
+            with open(path) as inp:
+                return json.load(inp)
+        except (IOError, ValueError):
+            return None
+
+    def _write_json(self, path, obj):
+        handle, tmpfn = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        with os.fdopen(handle, 'w') as outp:
+            json.dump(obj, outp)
+        os.rename(tmpfn, path)
+
+    def _claim(self, key, parent_sha):
+        """Creates the marker of the saves held for `key` by this process
+        (with the lock held, when it holds none). Returns False if another
+        (live) process holds saves for `key`."""
+        path = self._held_path(key)
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as x:
+                if x.errno != errno.EEXIST:
+                    raise
+                held = self._read_json(path)
+                if held is not None and (held.get('pid') == os.getpid() or not _process_is_alive(held['pid'])):
+                    # left by a process that has died (perhaps one that had this process's ID)
+                    self._abandon(path, held)
+                    continue
+                return False
+            with os.fdopen(fd, 'w') as outp:
+                json.dump({'parent': parent_sha, 'pid': os.getpid()}, outp)
+            return True
+
+    def _abandon(self, path, held):
+        "Removes the marker left by a process that died with saves held"
+        try:
+            os.unlink(path)
+        except OSError:
+            return
+        if held.get('job_id'):
+            self.registry.fail(held['job_id'], 500, 'The held saves were lost when the server restarted; please save again')
+
+    def _wait_for_other_process(self, key):
+        """Waits (without the lock) until no other process holds saves for
+        `key`, or for at most two windows. Returns False if one still does."""
+        path = self._held_path(key)
+        deadline = time.time() + 2 * self.window + 1
+        while True:
+            held = self._read_json(path)
+            if held is None or held.get('pid') == os.getpid():
+                return True
+            if not _process_is_alive(held['pid']):
+                self._abandon(path, held)
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(_POLL_INTERVAL)
+
+    def _wait_for_flush(self, key):
+        "Waits (with the lock held) until no held saves for `key` are being committed"
+        while key in self._flushing:
+            self._cond.wait()
+
+    def submit(self, key, parent_sha, commit_msg, commit_fn, **job_info):
+        """Holds a save for `key` (a JSON-serializable value, for example a
+        (curator, study ID) pair) that starts from `parent_sha`.
+        commit_fn(parent_sha, commit_msg) makes the commit and returns a dict
+        with its 'sha' (or raises JobError).
+
+        Returns the number of saves now held for `key` and the dict of the
+        job (created with `job_info`) that will make the commit; or None if
+        the save is not held and must be committed at once: if the saves
+        held for `key` start from another commit (they are committed first),
+        or if another process still holds saves for `key` after the wait.
+        """
+        if not self._wait_for_other_process(key):
+            return None
+        with self._cond:
+            self._wait_for_flush(key)
+            entry = self._pending.get(key)
+            if entry is None:
+                if not self._claim(key, parent_sha):
+                    # another process started holding saves for `key` meanwhile
+                    return None
+                job = self.registry.create('study_save', starting_commit_SHA=parent_sha, **job_info)
+                self._write_json(self._held_path(key), {'parent': parent_sha,
+                                                        'pid': os.getpid(),
+                                                        'job_id': job['id']})
+                timer = threading.Timer(self.window, self.flush, args=(key, ))
+                timer.daemon = True
+                entry = {'parent': parent_sha,
+                         'messages': [],
+                         'count': 0,
+                         'timer': timer,
+                         'job': job}
+                self._pending[key] = entry
+                timer.start()
+            if entry['parent'] == parent_sha:
+                entry['commit_fn'] = commit_fn
+                entry['count'] += 1
+                if commit_msg and commit_msg not in entry['messages']:
+                    entry['messages'].append(commit_msg)
+                return entry['count'], entry['job']
+        # a save from another commit; the held saves go first
+        self.flush(key)
+        return None
+
+    def flush(self, key):
+        """Commits the saves held for `key` (if any, waiting for those held
+        by another process), and returns the dict of the job that made the
+        commit (or None)"""
+        with self._cond:
+            self._wait_for_flush(key)
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                entry['timer'].cancel()
+                self._flushing.add(key)
+        if entry is None:
+            self._wait_for_other_process(key)
+            return None
+        try:
+            commit_msg = '\n\n'.join(entry['messages']) or None
+            return self.registry.run(entry['job']['id'], entry['commit_fn'], entry['parent'], commit_msg)
+        finally:
+            try:
+                os.unlink(self._held_path(key))
+            except OSError:
+                pass
+            with self._cond:
+                self._flushing.discard(key)
+                self._cond.notify_all()
+
+    def flush_all(self):
+        "Commits all of the held saves"
+        with self._cond:
+            keys = list(self._pending.keys())
+        for key in keys:
+            self.flush(key)
@@ -0,0 +1,125 @@
+"""A client for the CrossRef REST API (https://api.crossref.org), used to
+fill in the publication metadata of new studies from a DOI or a reference
+string.
+
+Responses are cached by DOI or by normalized reference string, so creating
+several studies from the same paper (or retrying a creation) asks CrossRef
+only once. Only definite answers are cached: a failed request or an error
+status other than 404 is retried next time. A negative answer (a 404, or a
+search without matches) may change once the work is registered, so it is
+kept only in RAM, for a limited time.
+"""
+from urllib import quote
+import requests
+
+CROSSREF_API_URL = 'https://api.crossref.org'
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_NEGATIVE_TTL = 3600.0
+
+def normalize_doi(doi):
+    "DOIs are case-insensitive"
+    return doi.strip().lower()
+
+def normalize_reference(ref_string):
+    return u' '.join(ref_string.split()).lower()
+
+
+class CrossRefClient(object):
+    """Looks up works on CrossRef using a requests.Session, keeping the
+    answers in `cache` (any object with get and put, e.g. a TieredCache;
+    values are JSON-serializable) and the negative answers in
+    `negative_cache` (e.g. a TTLCache; if None, they are not kept). If a
+    WorkerPool is given as `pool`, the two requests of a lookup by DOI are
+    made concurrently."""
+    def __init__(self, session, cache=None, timeout=DEFAULT_TIMEOUT, pool=None, base_url=CROSSREF_API_URL,
+                 negative_cache=None):
+        self.session = session
+        self.cache = cache
+        self.negative_cache = negative_cache
+        self.timeout = timeout
+        self.pool = pool
+        self.base_url = base_url.rstrip('/')
+
+    def _get(self, key, url, params, parse, is_negative=None):
+        """Returns parse(response) for a GET of `url` (from the cache if it
+        is there), or None if there is no answer. A 404, or a value for
+        which is_negative(value) is true, is a negative answer, which is
+        kept in negative_cache; failed requests, other error statuses and
+        responses that parse to None are not cached."""
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached['value']
+        if self.negative_cache is not None:
+            cached = self.negative_cache.get(tuple(key))
+            if cached is not None:
+                return cached['value']
+        try:
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.RequestException:
+            return None
+        if resp.status_code == 404:
+            value = None
+        elif resp.status_code != 200:
+            return None
+        else:
+            try:
+                value = parse(resp)
+            except ValueError:
+                return None
+            if value is None:
+                return None
+        if value is None or (is_negative is not None and is_negative(value)):
+            if self.negative_cache is not None:
+                self.negative_cache.put(tuple(key), {'value': value})
+        elif self.cache is not None:
+            self.cache.put(key, {'value': value})
+        return value
+
+    def find_works(self, doi=None, ref_string=None):
+        """Returns the JSON response of the works search for a DOI (or else a
+        reference string), with at most one (the best) match, or None"""
+        if doi:
+            key = ['crossref', 'works', 'doi', normalize_doi(doi)]
+            params = {'rows': 1, 'filter': 'doi:' + doi.strip()}
+        elif ref_string:
+            key = ['crossref', 'works', 'query', normalize_reference(ref_string)]
+            params = {'rows': 1, 'query': u' '.join(ref_string.split()).encode('utf-8')}
+        else:
+            return None
+        def _parse(resp):
+            response_json = resp.json()
+            if response_json.get('status', u'') != u'ok':
+                return None
+            return response_json
+        def _no_match(response_json):
+            return not response_json.get('message', {}).get('items')
+        return self._get(key, self.base_url + '/works', params, _parse, _no_match)
+
+    def bibliography(self, doi):
+        "Returns the (unicode, possibly HTML) reference text for a DOI, or None"
+        key = ['crossref', 'bibliography', normalize_doi(doi)]
+        url = '{b}/works/{d}/transform/text/x-bibliography'.format(b=self.base_url, d=quote(doi.strip().encode('utf-8'), safe=''))
+        return self._get(key, url, None, lambda resp: resp.content.decode('utf-8'))
+
+    def lookup(self, doi=None, ref_string=None):
+        """Returns (the works response for `doi` or `ref_string`, the DOI of
+        the best match (or else `doi`), its reference text). Any of these is
+        None if CrossRef has no answer."""
+        bibliography_task = None
+        requested_doi = doi
+        if doi and self.pool is not None:
+            # most matches for a DOI are that DOI, so don't wait for the search
+            bibliography_task = self.pool.submit(self.bibliography, doi)
+        works = self.find_works(doi=doi, ref_string=ref_string)
+        items = works.get('message', {}).get('items', []) if works else []
+        match_doi = items[0].get('DOI') if items else None
+        if match_doi:
+            doi = match_doi
+        ref_text = None
+        if doi:
+            if bibliography_task is not None and normalize_doi(doi) == normalize_doi(requested_doi):
+                ref_text = bibliography_task.result()
+            else:
+                ref_text = self.bibliography(doi)
+        return works, doi, ref_text
@@ -0,0 +1,87 @@
+"""Writes of a study whose merge to master is left to a background job.
+
+Phylesystem.annotate_and_write commits the new version of a study to the
+curator's WIP branch and then (holding the shard's lock throughout) merges
+that branch into master if master's version of the study has not changed.
+Here the two steps are separate: commit_to_wip_branch makes the content
+commit, and merge_to_master (run later by a job, one shard at a time) makes
+the merge, with the same rule for when it is safe. Until then the study's
+WIP map (branch2sha) shows the branch.
+
+Both use only the public methods of the shard's git action, and hold its
+lock (a lock file in the shard) as annotate_and_write does, so they are
+serialized with every other write to the shard, in any process.
+"""
+from peyotl.phylesystem.git_workflows import GitWorkflowError
+from peyotl.git_storage.git_action import MergeException
+from peyotl.nexson_syntax import write_as_json
+import tempfile
+import os
+
+def commit_to_wip_branch(git_action, nexson, doc_id, auth_info, adaptor, annotation, parent_sha, commit_msg=''):
+    """Adds the validation annotation to `nexson` and commits it to a WIP
+    branch on `parent_sha`, as annotate_and_write does, but without the
+    merge. Returns a dict like that of annotate_and_write, with the blob SHA
+    of the study on `parent_sha` as "prev_file_sha" (for merge_to_master)."""
+    adaptor.add_or_replace_annotation(nexson,
+                                      annotation['annotationEvent'],
+                                      annotation['agent'],
+                                      add_agent_only=True)
+    fc = tempfile.NamedTemporaryFile()
+    try:
+        write_as_json(nexson, fc)
+        fc.flush()
+        max_file_size = getattr(git_action, 'max_file_size', None)
+        if max_file_size is not None and os.stat(fc.name).st_size > max_file_size:
+            raise GitWorkflowError('Study #{i} is larger than the limit of {m} bytes'.format(i=doc_id, m=max_file_size))
+        git_action.acquire_lock()
+        try:
+            try:
+                commit_info = git_action.write_doc_from_tmpfile(doc_id, fc, parent_sha, auth_info, commit_msg, 'study')
+            except Exception as e:
+                raise GitWorkflowError('Could not write to study #{i} ! Details: \n{e}'.format(i=doc_id, e=e))
+            finally:
+                git_action.checkout_master()
+        finally:
+            git_action.release_lock()
+    finally:
+        fc.close()
+    return {'error': 0,
+            'resource_id': doc_id,
+            'branch_name': commit_info['branch'],
+            'description': 'Updated study #{}'.format(doc_id),
+            'sha': commit_info['commit_sha'],
+            'prev_file_sha': commit_info.get('prev_file_sha'),
+            'merge_needed': True, }
+
+def merge_to_master(git_action, doc_id, branch_name, sha, prev_file_sha=None, merged_sha=None):
+    """Merges the WIP branch `branch_name` (to which `sha` was committed)
+    into master, unless master's version of the study has changed since the
+    commit was made on a parent holding `prev_file_sha` (and is not
+    `merged_sha`, the version a curator merged into the branch). Returns a
+    dict with the "sha" and "branch_name" that hold the study, and "merge_needed".
+    """
+    git_action.acquire_lock()
+    try:
+        git_action.checkout_master()
+        if not git_action.branch_exists(branch_name):
+            # merged already, by the job of an earlier save to the same branch
+            return {'sha': git_action.get_master_sha(), 'branch_name': 'master', 'merge_needed': False}
+        doc_filepath = git_action.path_for_doc(doc_id)
+        if os.path.exists(doc_filepath):
+            prev_master_sha = git_action.get_blob_sha_for_file(doc_filepath)
+            if merged_sha is None:
+                merged_sha = prev_master_sha
+            if prev_file_sha is None:
+                prev_file_sha = prev_master_sha
+            if prev_master_sha not in (prev_file_sha, merged_sha):
+                return {'sha': sha, 'branch_name': branch_name, 'merge_needed': True}
+        try:
+            new_sha = git_action.merge(branch_name, 'master')
+        except MergeException:
+            # the merge has been aborted; the curator must merge master into the branch
+            return {'sha': sha, 'branch_name': branch_name, 'merge_needed': True}
+        git_action.delete_branch(branch_name)
+        return {'sha': new_sha, 'branch_name': 'master', 'merge_needed': False}
+    finally:
+        git_action.release_lock()
@@ -0,0 +1,118 @@
+"""A small bounded thread pool for running independent, mostly I/O-bound
+steps (git log calls, HTTP requests to other services) while a request is
+being handled.
+
+A `Fanout` groups the steps of one request. Each step gets its own deadline
+(in seconds, counted from when it was submitted); `Fanout.results` waits for
+the steps and leaves out the ones that missed their deadline or raised.
+A step that misses its deadline keeps running in the background, so steps
+must not modify data that the caller goes on to use.
+"""
+from Queue import Queue
+import threading
+import time
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class Task(object):
+    "The pending result of a function submitted to a WorkerPool"
+    def __init__(self, fn, args, kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._value = None
+        self._exception = None
+        self.submitted = time.time()
+
+    def run(self):
+        try:
+            self._value = self._fn(*self._args, **self._kwargs)
+        except Exception as x:
+            self._exception = x
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        "Returns True if the task finished within `timeout` seconds"
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Returns the value of the function, re-raising any exception it raised.
+        Raises TaskTimeout if it has not finished within `timeout` seconds."""
+        if not self.wait(timeout):
+            raise TaskTimeout()
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class WorkerPool(object):
+    "Runs submitted functions on at most `max_workers` daemon threads"
+    def __init__(self, max_workers=8, name='ot-worker'):
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+        self._queue = Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        task = Task(fn, args, kwargs)
+        with self._lock:
+            # start another thread only if every existing one is busy
+            if self._idle == 0 and len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._work,
+                                     name='{n}-{i}'.format(n=self.name, i=len(self._threads)))
+                t.daemon = True
+                self._threads.append(t)
+                t.start()
+            else:
+                self._idle -= 1
+        self._queue.put(task)
+        return task
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task.run()
+            finally:
+                with self._lock:
+                    self._idle += 1
+
+
+class Fanout(object):
+    "Named steps, each with its own deadline, submitted to a WorkerPool"
+    def __init__(self, pool):
+        self.pool = pool
+        self._steps = []
+
+    def submit(self, name, deadline, fn, *args, **kwargs):
+        task = self.pool.submit(fn, *args, **kwargs)
+        self._steps.append((name, deadline, task))
+        return task
+
+    def results(self, on_miss=None):
+        """Returns a dict of step name -> value for the steps that finished
+        within their deadlines without raising. `on_miss(name, exception)` is
+        called for the others (`exception` is a TaskTimeout for a late step).
+        """
+        r = {}
+        for name, deadline, task in self._steps:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, task.submitted + deadline - time.time())
+            try:
+                r[name] = task.result(remaining)
+            except Exception as x:
+                if on_miss is not None:
+                    on_miss(name, x)
+        return r
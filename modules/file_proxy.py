@@ -0,0 +1,90 @@
+"""Support for serving the supporting files of studies (which are stored on
+the curation site) through this API: a pooled HTTP session for fetching
+them, and a size-bounded disk cache of the fetched files.
+"""
+import tempfile
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from tiered_cache import DiskCache, key_digest
+
+CHUNK_SIZE = 64 * 1024
+
+def make_session(pool_size=10):
+    "Returns a requests.Session that keeps up to `pool_size` connections per host open"
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def open_upstream(session, url, timeout):
+    """Starts fetching `url`, returning the response once its headers have
+    arrived (the body is not read). Raises an exception for an error status."""
+    resp = session.get(url, stream=True, timeout=timeout)
+    try:
+        resp.raise_for_status()
+    except:
+        resp.close()
+        raise
+    return resp
+
+def iter_response(resp, chunk_size=CHUNK_SIZE):
+    "Yields the body of a streamed response, releasing its connection at the end"
+    try:
+        for chunk in resp.iter_content(chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        resp.close()
+
+
+class FileCache(DiskCache):
+    """Stores files (for example, the bodies of HTTP responses) below
+    `cache_dir`, with the least-recently-used pruning of DiskCache.
+
+    An entry only appears once all of its content has been written, so a
+    fetch that fails part way through leaves nothing behind.
+    """
+    def path_for_key(self, key):
+        d = key_digest(key)
+        return os.path.join(self.cache_dir, d[:2], d + '.bin')
+
+    def get_path(self, key):
+        "Returns the path of the file stored for `key`, or None"
+        fp = self.path_for_key(key)
+        try:
+            os.utime(fp, None)
+        except OSError:
+            return None
+        return fp
+
+    def iter_fill(self, key, chunks):
+        "Yields each of `chunks` while storing them as the file for `key`"
+        fp = self.path_for_key(key)
+        par = os.path.dirname(fp)
+        if not os.path.isdir(par):
+            try:
+                os.makedirs(par)
+            except OSError:
+                if not os.path.isdir(par):
+                    raise
+        handle, tmpfn = tempfile.mkstemp(suffix='.tmp', dir=par)
+        stored = False
+        try:
+            with os.fdopen(handle, 'wb') as outp:
+                for chunk in chunks:
+                    outp.write(chunk)
+                    yield chunk
+            os.rename(tmpfn, fp)
+            stored = True
+            self._note_write()
+        finally:
+            if not stored:
+                self._remove(tmpfn)
+
+    def fill(self, key, chunks):
+        "Stores `chunks` as the file for `key` and returns its path"
+        for chunk in self.iter_fill(key, chunks):
+            pass
+        return self.path_for_key(key)
@@ -0,0 +1,10 @@
+"""Brings the persisted index of the studies on master up to date.
+
+cron/crontab runs this script in web2py's environment (which provides
+`request`) when web2py starts, so that the server loads a current index on
+its first request instead of reading every study then.
+"""
+import api_utils
+
+if 'request' in globals():
+    api_utils.warm_study_index(request)
@@ -0,0 +1,219 @@
+"""An in-process index from document ID to the commits on master that
+changed the document, so that versionHistory does not need a `git log`
+call per document.
+
+Like the StudyIndex, the index records the master SHA of each shard it
+reflects; `sync` runs a single `git log <old>..<new>` per shard that has
+moved and prepends the new commits to the affected documents. The index is
+persisted as a JSON file.
+
+History entries have the fields of peyotl's get_version_history_for_file
+("id", "author_name", "author_email", "date", "date_ISO_8601",
+"relative_date", "message_subject" and "message_body"). Renames are not
+followed. As in `git log -- <file>`, a merge commit is in the history of a
+document only if the merge differs from every parent in that document (a
+merge that resolved a conflict); otherwise the merged commits are.
+"""
+import threading
+import tempfile
+import time
+import json
+import os
+
+# bump this when the persisted format changes, so that persisted indices are rebuilt
+INDEX_VERSION = 2
+
+# fields of each stored commit, in the order of _LOG_FORMAT
+_COMMIT_FIELDS = ('author_name', 'author_email', 'date', 'date_ISO_8601', 'timestamp', 'message_subject', 'message_body')
+_LOG_FORMAT = '%x1e%H%x1f%an%x1f%ae%x1f%aD%x1f%ai%x1f%at%x1f%s%x1f%b%x1f'
+
+def parse_log(out, doc_id_from_path):
+    """Parses the output of `git log --name-only -c --format=<_LOG_FORMAT>`.
+    Returns a list (newest first) of (commit SHA, list of commit fields, list of doc IDs)."""
+    commits = []
+    for record in out.split('\x1e')[1:]:
+        fields = record.split('\x1f')
+        if len(fields) != 2 + len(_COMMIT_FIELDS):
+            continue
+        sha = fields[0].strip()
+        values = fields[1:-1]
+        values[-1] = values[-1].strip()  # the message body
+        doc_ids = []
+        for path in fields[-1].splitlines():
+            doc_id = doc_id_from_path(path.strip())
+            if doc_id and doc_id not in doc_ids:
+                doc_ids.append(doc_id)
+        commits.append((sha, values, doc_ids))
+    return commits
+
+def _plural(n, unit):
+    if n == 1:
+        return '1 {u}'.format(u=unit)
+    return '{n} {u}s'.format(n=n, u=unit)
+
+def relative_date(timestamp, now=None):
+    "Describes the age of a UNIX `timestamp` like git's %ar (e.g. \"3 weeks ago\")"
+    if now is None:
+        now = time.time()
+    diff = int(now) - int(timestamp)
+    if diff < 0:
+        return 'in the future'
+    if diff < 90:
+        return _plural(diff, 'second') + ' ago'
+    diff = (diff + 30) // 60
+    if diff < 90:
+        return _plural(diff, 'minute') + ' ago'
+    diff = (diff + 30) // 60
+    if diff < 36:
+        return _plural(diff, 'hour') + ' ago'
+    diff = (diff + 12) // 24
+    if diff < 14:
+        return _plural(diff, 'day') + ' ago'
+    if diff < 70:
+        return _plural((diff + 3) // 7, 'week') + ' ago'
+    if diff < 365:
+        return _plural((diff + 15) // 30, 'month') + ' ago'
+    if diff < 1825:
+        total_months = (diff * 12 * 2 + 365) // (365 * 2)
+        years, months = total_months // 12, total_months % 12
+        if months:
+            return '{y}, {m} ago'.format(y=_plural(years, 'year'), m=_plural(months, 'month'))
+        return _plural(years, 'year') + ' ago'
+    return _plural((diff + 183) // 365, 'year') + ' ago'
+
+
+class HistoryIndex(object):
+    """Maps document IDs to the SHAs of the commits on master that changed
+    them (newest first), for every shard of one docstore.
+
+    `ready` is False until the index reflects every shard at least once.
+    """
+    def __init__(self, filepath=None):
+        self.filepath = filepath
+        self.ready = False
+        self._shard_shas = {}
+        self._commits = {}
+        self._doc_commits = {}
+        self._doc_shard = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def load(self):
+        "Reads the persisted index; returns False if there is none (or it is stale or corrupt)"
+        if not self.filepath:
+            return False
+        try:
+            with open(self.filepath) as inp:
+                blob = json.load(inp)
+            if blob.get('index_version') != INDEX_VERSION:
+                return False
+            shard_shas = dict(blob['shard_shas'])
+            commits = dict(blob['commits'])
+            doc_commits = dict(blob['doc_commits'])
+            doc_shard = dict(blob['doc_shard'])
+        except (IOError, ValueError, KeyError, TypeError, AttributeError):
+            return False
+        with self._lock:
+            self._shard_shas = shard_shas
+            self._commits = commits
+            self._doc_commits = doc_commits
+            self._doc_shard = doc_shard
+        return True
+
+    def save(self):
+        if not self.filepath:
+            return
+        with self._lock:
+            blob = {'index_version': INDEX_VERSION,
+                    'shard_shas': dict(self._shard_shas),
+                    'commits': dict(self._commits),
+                    'doc_commits': dict((k, list(v)) for k, v in self._doc_commits.items()),
+                    'doc_shard': dict(self._doc_shard)}
+        par = os.path.dirname(self.filepath)
+        if not os.path.isdir(par):
+            os.makedirs(par)
+        handle, tmpfn = tempfile.mkstemp(suffix='.json', dir=par)
+        with os.fdopen(handle, 'w') as outp:
+            json.dump(blob, outp)
+        os.rename(tmpfn, self.filepath)
+
+    def history(self, doc_id, limit=None, offset=0):
+        """Returns a list of history entries (newest first) for `doc_id`,
+        skipping the first `offset` and returning at most `limit` of them.
+        Returns None if the index is not ready."""
+        if not self.ready:
+            return None
+        now = time.time()
+        with self._lock:
+            shas = self._doc_commits.get(doc_id, [])
+            end = None if limit is None else offset + limit
+            r = []
+            for sha in shas[offset:end]:
+                entry = dict(zip(_COMMIT_FIELDS, self._commits[sha]))
+                entry['id'] = sha
+                entry['relative_date'] = relative_date(entry.pop('timestamp'), now)
+                r.append(entry)
+        return r
+
+    def num_commits(self, doc_id):
+        with self._lock:
+            return len(self._doc_commits.get(doc_id, []))
+
+    def sync(self, shards, blocking=True):
+        """Brings the index up to date with the master branch of each of
+        `shards` (shard_reader.ShardReader objects). Returns False without
+        doing anything if another thread is syncing and `blocking` is False.
+        """
+        if not self._sync_lock.acquire(blocking):
+            return False
+        try:
+            modified = False
+            for shard in shards:
+                if self._sync_shard(shard):
+                    modified = True
+            self.ready = True
+            if modified:
+                self.save()
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def _sync_shard(self, shard):
+        new_sha = shard.master_sha()
+        if new_sha is None:
+            return False
+        with self._lock:
+            old_sha = self._shard_shas.get(shard.name)
+        if old_sha == new_sha:
+            return False
+        if old_sha is not None and not shard.is_ancestor(old_sha, new_sha):
+            # master was rewritten (or the shard re-cloned); re-read its history
+            self._forget_shard(shard.name)
+            old_sha = None
+        rev_range = new_sha if old_sha is None else '{o}..{n}'.format(o=old_sha, n=new_sha)
+        # with -c, a merge lists the files in which it differs from all of its parents
+        out = shard.git('log', '--name-only', '-c', '--no-renames', '--format=' + _LOG_FORMAT, rev_range, '--', shard.doc_dir)
+        new_commits = parse_log(out, shard.doc_id_from_path)
+        with self._lock:
+            # walk oldest to newest, so that each doc's list stays newest first
+            for sha, values, doc_ids in reversed(new_commits):
+                self._commits[sha] = values
+                for doc_id in doc_ids:
+                    self._doc_commits.setdefault(doc_id, []).insert(0, sha)
+                    self._doc_shard[doc_id] = shard.name
+            self._shard_shas[shard.name] = new_sha
+        return True
+
+    def _forget_shard(self, shard_name):
+        with self._lock:
+            for doc_id, name in list(self._doc_shard.items()):
+                if name == shard_name:
+                    del self._doc_shard[doc_id]
+                    del self._doc_commits[doc_id]
+            referenced = set()
+            for shas in self._doc_commits.values():
+                referenced.update(shas)
+            for sha in list(self._commits.keys()):
+                if sha not in referenced:
+                    del self._commits[sha]
+            self._shard_shas.pop(shard_name, None)
@@ -0,0 +1,184 @@
+"""A registry of the background jobs started by API requests (for example,
+asynchronous study writes), so that clients can poll for their outcome.
+
+Each job is a JSON file in the registry's directory, so its status can be
+read by any of the server's processes, and survives a restart (a job that
+was waiting or running when its process died stays in that state).
+
+A long job can report the stage it has reached with `progress`, which is
+also where it finds out that it has been cancelled. Changes to a job are
+made with a lock file in the registry's directory held, so that a change
+made by one process (e.g. a cancel) is not lost to another's.
+"""
+from contextlib import contextmanager
+import threading
+import fcntl
+import tempfile
+import time
+import uuid
+import json
+import os
+import re
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+# finished jobs are forgotten after this many seconds
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+_LOCK_FILENAME = '.lock'
+
+class JobError(Exception):
+    """Raised by a job function to report a failure. `status` is the HTTP
+    status that the request would have failed with, and `details` is a
+    JSON-serializable description of the error."""
+    def __init__(self, status, details):
+        Exception.__init__(self, details)
+        self.status = status
+        self.details = details
+
+
+class JobCancelled(Exception):
+    "Raised by JobRegistry.progress when the job has been cancelled"
+    pass
+
+
+class JobRegistry(object):
+    def __init__(self, jobs_dir, max_age=DEFAULT_MAX_AGE):
+        self.jobs_dir = jobs_dir
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        if not os.path.isdir(jobs_dir):
+            try:
+                os.makedirs(jobs_dir)
+            except OSError:
+                if not os.path.isdir(jobs_dir):
+                    raise
+
+    @contextmanager
+    def _locked(self):
+        """Holds the registry's lock: the thread lock keeps this process's
+        threads apart, and the lock file other processes."""
+        with self._lock:
+            with open(os.path.join(self.jobs_dir, _LOCK_FILENAME), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, job_id + '.json')
+
+    def _write(self, job):
+        handle, tmpfn = tempfile.mkstemp(suffix='.tmp', dir=self.jobs_dir)
+        with os.fdopen(handle, 'w') as outp:
+            json.dump(job, outp)
+        os.rename(tmpfn, self._path(job['id']))
+
+    def get(self, job_id):
+        "Returns the job dict for `job_id`, or None if there is no such job"
+        if not _JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id)) as inp:
+                return json.load(inp)
+        except (IOError, ValueError):
+            return None
+
+    def create(self, kind, **info):
+        """Records a new (queued) job and returns its dict. `info` is
+        included in the job's status (it must be JSON-serializable)."""
+        self.prune()
+        now = time.time()
+        job = {'id': uuid.uuid4().hex,
+               'kind': kind,
+               'status': QUEUED,
+               'created': now,
+               'updated': now,
+               'stage': None,
+               'progress': None,
+               'cancel_requested': False,
+               'result': None,
+               'error': None, }
+        job.update(info)
+        self._write(job)
+        return job
+
+    def _update(self, job_id, **changes):
+        with self._locked():
+            job = self.get(job_id)
+            job.update(changes)
+            job['updated'] = time.time()
+            self._write(job)
+        return job
+
+    def progress(self, job_id, stage, **details):
+        """Records that the job has reached `stage` (with optional details,
+        e.g. a count of bytes). Raises JobCancelled if the job has been
+        cancelled, so a job function should call this between its steps."""
+        job = self._update(job_id, stage=stage, progress=details or None)
+        if job.get('cancel_requested'):
+            raise JobCancelled()
+        return job
+
+    def check_cancelled(self, job_id):
+        """Raises JobCancelled if the job has been cancelled. Unlike
+        `progress`, this only reads the job, so it is cheap enough to call
+        often (e.g. for each chunk of a download)."""
+        job = self.get(job_id)
+        if job is not None and job.get('cancel_requested'):
+            raise JobCancelled()
+
+    def cancel(self, job_id):
+        """Asks for a job to be stopped: a queued job will not run, and a
+        running one stops at its next call to `progress`. Returns the job
+        dict, or None if there is no such job."""
+        with self._locked():
+            job = self.get(job_id)
+            if job is None or job['status'] not in (QUEUED, RUNNING):
+                return job
+            job['cancel_requested'] = True
+            job['updated'] = time.time()
+            self._write(job)
+        return job
+
+    def fail(self, job_id, status, details):
+        """Records a job that will not be run (e.g. because the process that
+        was to run it has died) as failed. Returns the job dict, or None if
+        there is no such job."""
+        with self._locked():
+            job = self.get(job_id)
+            if job is None or job['status'] not in (QUEUED, RUNNING):
+                return job
+            job.update(status=FAILED, error={'status': status, 'details': details}, updated=time.time())
+            self._write(job)
+        return job
+
+    def run(self, job_id, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) as the job `job_id`, recording its return
+        value as the job's result or the JobError (or other exception) that
+        it raised as the job's error."""
+        if self._update(job_id, status=RUNNING).get('cancel_requested'):
+            return self._update(job_id, status=CANCELLED)
+        try:
+            result = fn(*args, **kwargs)
+        except JobCancelled:
+            return self._update(job_id, status=CANCELLED)
+        except JobError as x:
+            return self._update(job_id, status=FAILED, error={'status': x.status, 'details': x.details})
+        except Exception as x:
+            return self._update(job_id, status=FAILED, error={'status': 500, 'details': str(x)})
+        return self._update(job_id, status=DONE, result=result)
+
+    def prune(self):
+        "Removes the records of jobs that have not changed in `max_age` seconds"
+        cutoff = time.time() - self.max_age
+        for fn in os.listdir(self.jobs_dir):
+            if fn == _LOCK_FILENAME:
+                continue
+            fp = os.path.join(self.jobs_dir, fn)
+            try:
+                if os.stat(fp).st_mtime < cutoff:
+                    os.unlink(fp)
+            except OSError:
+                pass
@@ -0,0 +1,158 @@
+"""JSON Patch (RFC 6902) for updates to documents that change a small part
+of a large document (e.g. one tree of a study), with JSON Pointers (RFC 6901)
+to address the values.
+
+apply_patch modifies the document in place, so a caller that needs the
+original document after a failed patch should patch a copy.
+"""
+import copy
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+class JsonPatchError(ValueError):
+    "Raised for a malformed patch, or one that does not fit the document"
+    pass
+
+
+class PatchTestFailed(JsonPatchError):
+    "Raised when a \"test\" operation finds a different value"
+    pass
+
+
+def parse_pointer(pointer):
+    "Returns the list of reference tokens of a JSON Pointer"
+    if not isinstance(pointer, basestring):
+        raise JsonPatchError('JSON Pointers must be strings')
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError('JSON Pointer "{}" must start with "/"'.format(pointer))
+    return [t.replace('~1', '/').replace('~0', '~') for t in pointer[1:].split('/')]
+
+def _list_index(container, token, pointer, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JsonPatchError('"{t}" is not an array index in "{p}"'.format(t=token, p=pointer))
+    i = int(token)
+    limit = len(container) + 1 if allow_end else len(container)
+    if i >= limit:
+        raise JsonPatchError('array index {i} is out of range in "{p}"'.format(i=i, p=pointer))
+    return i
+
+def _child(container, token, pointer):
+    if isinstance(container, dict):
+        try:
+            return container[token]
+        except KeyError:
+            raise JsonPatchError('"{p}" does not exist'.format(p=pointer))
+    if isinstance(container, list):
+        return container[_list_index(container, token, pointer)]
+    raise JsonPatchError('"{p}" does not exist'.format(p=pointer))
+
+def get_value(doc, pointer):
+    "Returns the value at `pointer` in `doc`"
+    value = doc
+    for token in parse_pointer(pointer):
+        value = _child(value, token, pointer)
+    return value
+
+def _parent(doc, pointer):
+    "Returns (container of the value at `pointer`, its last token); the pointer must not be the root"
+    tokens = parse_pointer(pointer)
+    container = doc
+    for token in tokens[:-1]:
+        container = _child(container, token, pointer)
+    if not isinstance(container, (dict, list)):
+        raise JsonPatchError('the parent of "{p}" is not an object or array'.format(p=pointer))
+    return container, tokens[-1]
+
+def _add(doc, pointer, value):
+    if pointer == '':
+        return value
+    container, token = _parent(doc, pointer)
+    if isinstance(container, dict):
+        container[token] = value
+    else:
+        container.insert(_list_index(container, token, pointer, allow_end=True), value)
+    return doc
+
+def _remove(doc, pointer):
+    "Returns (doc, the removed value)"
+    if pointer == '':
+        raise JsonPatchError('the whole document cannot be removed')
+    container, token = _parent(doc, pointer)
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError('"{p}" does not exist'.format(p=pointer))
+        return doc, container.pop(token)
+    return doc, container.pop(_list_index(container, token, pointer))
+
+def _replace(doc, pointer, value):
+    if pointer == '':
+        return value
+    container, token = _parent(doc, pointer)
+    if isinstance(container, dict):
+        if token not in container:
+            raise JsonPatchError('"{p}" does not exist'.format(p=pointer))
+        container[token] = value
+    else:
+        container[_list_index(container, token, pointer)] = value
+    return doc
+
+def json_equal(a, b):
+    "Equality of JSON values, in which (unlike in Python) true != 1"
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return set(a.keys()) == set(b.keys()) and all(json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(json_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, (dict, list)) or isinstance(b, (dict, list)):
+        return False
+    return a == b
+
+def _member(operation, name):
+    try:
+        return operation[name]
+    except KeyError:
+        raise JsonPatchError('"{o}" operation without "{n}"'.format(o=operation.get('op'), n=name))
+
+def apply_patch(doc, patch):
+    """Applies the list of operations `patch` to `doc` and returns the
+    patched document (which is `doc` itself, unless the root was replaced).
+    Raises JsonPatchError (or PatchTestFailed) if an operation fails, in
+    which case `doc` may have been partly modified.
+    """
+    if not isinstance(patch, list):
+        raise JsonPatchError('a JSON Patch must be an array of operations')
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise JsonPatchError('each operation in a JSON Patch must be an object')
+        op = operation.get('op')
+        path = _member(operation, 'path')
+        if op == 'add':
+            doc = _add(doc, path, _member(operation, 'value'))
+        elif op == 'remove':
+            doc = _remove(doc, path)[0]
+        elif op == 'replace':
+            doc = _replace(doc, path, _member(operation, 'value'))
+        elif op == 'move':
+            from_path = _member(operation, 'from')
+            if path.startswith(from_path + '/'):
+                raise JsonPatchError('"{f}" cannot be moved into itself'.format(f=from_path))
+            if from_path != path:
+                doc, value = _remove(doc, from_path)
+                doc = _add(doc, path, value)
+        elif op == 'copy':
+            value = copy.deepcopy(get_value(doc, _member(operation, 'from')))
+            doc = _add(doc, path, value)
+        elif op == 'test':
+            if not json_equal(get_value(doc, path), _member(operation, 'value')):
+                raise PatchTestFailed('the value at "{p}" is not the expected value'.format(p=path))
+        else:
+            raise JsonPatchError('unknown JSON Patch operation "{}"'.format(op))
+    return doc
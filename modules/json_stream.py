@@ -0,0 +1,79 @@
+"""Incremental JSON serialization, so that large responses (full studies can
+be tens of MB) can be handed to web2py as an iterator of chunks instead of
+being rendered into a single string.
+
+The outer containers (down to `max_depth`) are walked in Python; anything
+deeper is serialized with the (C-accelerated) json.dumps. The output is
+the same as json.dumps with its default separators.
+"""
+import json
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# deep enough that, in a full-study response, each node, edge and OTU is
+# serialized on its own
+DEFAULT_MAX_DEPTH = 8
+
+def iter_json_pieces(obj, max_depth=DEFAULT_MAX_DEPTH, default=None, _depth=0):
+    "Yields the pieces of the JSON serialization of `obj` (many of them tiny)"
+    if _depth < max_depth:
+        if isinstance(obj, dict):
+            if not obj:
+                yield '{}'
+                return
+            sep = '{'
+            for k, v in obj.items():
+                if not isinstance(k, basestring):
+                    k = json.dumps(k)
+                yield sep
+                yield json.dumps(k)
+                yield ': '
+                for piece in iter_json_pieces(v, max_depth, default, _depth + 1):
+                    yield piece
+                sep = ', '
+            yield '}'
+            return
+        if isinstance(obj, (list, tuple)):
+            if not obj:
+                yield '[]'
+                return
+            sep = '['
+            for v in obj:
+                yield sep
+                for piece in iter_json_pieces(v, max_depth, default, _depth + 1):
+                    yield piece
+                sep = ', '
+            yield ']'
+            return
+    yield json.dumps(obj, default=default)
+
+def iter_chunks(pieces, chunk_size=DEFAULT_CHUNK_SIZE):
+    "Joins an iterable of strings into chunks of about `chunk_size` characters"
+    buf = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
+
+def iter_json(obj, chunk_size=DEFAULT_CHUNK_SIZE, max_depth=DEFAULT_MAX_DEPTH, default=None):
+    "Yields the JSON serialization of `obj` in chunks of about `chunk_size` characters"
+    return iter_chunks(iter_json_pieces(obj, max_depth, default), chunk_size)
+
+def iter_jsonp(callback, obj, chunk_size=DEFAULT_CHUNK_SIZE, max_depth=DEFAULT_MAX_DEPTH, default=None):
+    "Yields `callback(<JSON of obj>)` in chunks of about `chunk_size` characters"
+    def _pieces():
+        yield '{c}('.format(c=callback)
+        for piece in iter_json_pieces(obj, max_depth, default):
+            yield piece
+        yield ')'
+    return iter_chunks(_pieces(), chunk_size)
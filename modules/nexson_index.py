@@ -0,0 +1,336 @@
+"""Byte-offset indices of NexSON 1.2 study files, so that a request for one
+tree (or the OTUs) of a study can read and parse just the parts of the file
+it needs instead of the whole document. The same scanner counts the trees in
+an uploaded document before it is parsed; TreeCounter does this for a
+document that arrives in chunks.
+
+An index is built once per version of a study file (it is stored by git blob
+SHA) and records the (start, end) byte range of:
+    * each property of `nexml` other than "otusById" and "treesById";
+    * each OTUs group in "otusById";
+    * each property of a trees group other than "treeById";
+    * each tree.
+The ranges are found by walking the outer objects of the file and letting
+the (C-accelerated) json decoder skip over everything else.
+"""
+import json
+import re
+from json.decoder import scanstring
+
+INDEX_VERSION = 1
+# return types of a study GET that can be served from the index
+FRAGMENT_RETURN_TYPES = ('tree', 'subtree', 'otus', 'otu')
+
+_WS = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+def _skip_ws(s, i):
+    return _WS.match(s, i).end()
+
+def _value_end(s, i):
+    "Returns the index just after the JSON value that starts at s[i]"
+    return _DECODER.raw_decode(s, i)[1]
+
+def _scan_object(s, i, on_member):
+    """Walks the JSON object that starts at s[i], calling on_member(key, start)
+    with the index of each value. on_member returns the index just after the
+    value, or None to have it skipped. Returns the index just after the object.
+    """
+    if s[i] != '{':
+        raise ValueError('Expecting an object at {}'.format(i))
+    i = _skip_ws(s, i + 1)
+    if s[i] == '}':
+        return i + 1
+    while True:
+        if s[i] != '"':
+            raise ValueError('Expecting a property name at {}'.format(i))
+        key, i = scanstring(s, i + 1)
+        i = _skip_ws(s, i)
+        if s[i] != ':':
+            raise ValueError('Expecting ":" at {}'.format(i))
+        i = _skip_ws(s, i + 1)
+        end = on_member(key, i)
+        if end is None:
+            end = _value_end(s, i)
+        i = _skip_ws(s, end)
+        if s[i] == '}':
+            return i + 1
+        if s[i] != ',':
+            raise ValueError('Expecting "," at {}'.format(i))
+        i = _skip_ws(s, i + 1)
+
+def _scan_array(s, i, on_element):
+    """Like _scan_object, for the JSON array that starts at s[i];
+    on_element(start) is called with the index of each element."""
+    if s[i] != '[':
+        raise ValueError('Expecting an array at {}'.format(i))
+    i = _skip_ws(s, i + 1)
+    if s[i] == ']':
+        return i + 1
+    while True:
+        end = on_element(i)
+        if end is None:
+            end = _value_end(s, i)
+        i = _skip_ws(s, end)
+        if s[i] == ']':
+            return i + 1
+        if s[i] != ',':
+            raise ValueError('Expecting "," at {}'.format(i))
+        i = _skip_ws(s, i + 1)
+
+def count_trees(content):
+    """Returns the number of trees in a serialized NexSON document (of any
+    NexSON version, optionally wrapped in {"nexson": ...}), decoding no more
+    than one tree at a time. Raises ValueError if `content` is not a JSON object.
+    """
+    count = [0]
+
+    def on_tree(*args):
+        count[0] += 1
+        return None
+
+    def on_group_member(key, start):
+        if key == 'treeById' and content[start] == '{':
+            return _scan_object(content, start, on_tree)
+        if key == 'tree':
+            if content[start] == '[':
+                return _scan_array(content, start, on_tree)
+            count[0] += 1
+        return None
+
+    def on_group(start):
+        if content[start] == '{':
+            return _scan_object(content, start, on_group_member)
+        return None
+
+    def on_nexml(key, start):
+        if key == 'treesById' and content[start] == '{':
+            return _scan_object(content, start, lambda k, st: on_group(st))
+        if key == 'trees':
+            if content[start] == '[':
+                return _scan_array(content, start, on_group)
+            return on_group(start)
+        return None
+
+    def on_top(key, start):
+        if key in ('nexml', 'nexson') and content[start] == '{':
+            return _scan_object(content, start, on_nexml if key == 'nexml' else on_top)
+        return None
+
+    try:
+        _scan_object(content, _skip_ws(content, 0), on_top)
+    except IndexError:
+        raise ValueError('Truncated JSON document')
+    return count[0]
+
+_STRUCTURAL_CHAR = re.compile(r'["{}\[\]:,]')
+_STRING_SPECIAL_CHAR = re.compile(r'["\\]')
+
+def _is_tree_path(path):
+    """True if an object found under the object keys `path` is a tree, in
+    any NexSON version (optionally wrapped in {"nexson": ...})"""
+    while path and path[0] == 'nexson':
+        path = path[1:]
+    if len(path) == 5:
+        return path[0] == 'nexml' and path[1] == 'treesById' and path[3] == 'treeById'
+    return path == ['nexml', 'trees', 'tree']
+
+class TreeCounter(object):
+    """Counts the trees in a serialized NexSON document that is fed to it in
+    chunks (as count_trees does for a whole document), holding no more than
+    the key being read. `count` is the number of trees seen so far.
+    `is_object` is None until the first character of the document is seen,
+    and False if the document is not a JSON object (e.g. a form), in which
+    case the rest of it is ignored.
+    """
+    def __init__(self):
+        self.count = 0
+        self.is_object = None
+        # [is an object, key of the container in its parent, expecting a key, last key read]
+        #   for each open container; the elements of an array take its key
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        # the parts of the key being read (None while reading a string value)
+        self._key_parts = None
+
+    def feed(self, chunk):
+        if self.is_object is False:
+            return
+        i, n = 0, len(chunk)
+        if self.is_object is None:
+            i = _skip_ws(chunk, 0)
+            if i == n:
+                return
+            self.is_object = (chunk[i] == '{')
+            if not self.is_object:
+                return
+        while i < n:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    if self._key_parts is not None:
+                        self._key_parts.append(chunk[i])
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL_CHAR.search(chunk, i)
+                end = m.start() if m else n
+                if self._key_parts is not None:
+                    self._key_parts.append(chunk[i:end])
+                if m is None:
+                    return
+                i = end + 1
+                if m.group() == '\\':
+                    self._escaped = True
+                    if self._key_parts is not None:
+                        self._key_parts.append('\\')
+                    continue
+                self._in_string = False
+                if self._key_parts is not None:
+                    self._stack[-1][3] = ''.join(self._key_parts)
+                    self._key_parts = None
+                continue
+            m = _STRUCTURAL_CHAR.search(chunk, i)
+            if m is None:
+                return
+            c = m.group()
+            i = m.end()
+            top = self._stack[-1] if self._stack else None
+            if c == '"':
+                self._in_string = True
+                if top is not None and top[0] and top[2]:
+                    self._key_parts = []
+            elif c == ':':
+                if top is not None:
+                    top[2] = False
+            elif c == ',':
+                if top is not None and top[0]:
+                    top[2] = True
+            elif c == '{' or c == '[':
+                key = None
+                if top is not None:
+                    key = top[3] if top[0] else top[1]
+                self._stack.append([c == '{', key, c == '{', None])
+                if c == '{' and top is not None:
+                    path = [f[1] for f in self._stack if f[0] and f[1] is not None]
+                    if _is_tree_path(path):
+                        self.count += 1
+            elif self._stack:
+                self._stack.pop()
+
+def build_offset_index(content):
+    """Returns the offset index (a JSON-serializable dict) of the NexSON
+    study file `content` (a byte string). Documents that do not use the
+    NexSON 1.2 layout get an index marked "unsupported".
+    Raises ValueError if `content` is not a JSON object.
+    """
+    index = {'version': INDEX_VERSION,
+             'size': len(content),
+             'nexml': {},
+             'otus': {},
+             'groups': {},
+             'trees': {}, }
+
+    def on_tree(group_id):
+        def _on_tree(tree_id, start):
+            end = _value_end(content, start)
+            index['trees'][tree_id] = [group_id, start, end]
+            return end
+        return _on_tree
+
+    def on_group(group_id, start):
+        group = {'meta': {}, 'otus': None}
+        index['groups'][group_id] = group
+        def _on_member(key, start):
+            if key == 'treeById':
+                return _scan_object(content, start, on_tree(group_id))
+            end = _value_end(content, start)
+            if key == '@otus':
+                group['otus'] = json.loads(content[start:end])
+            group['meta'][key] = [start, end]
+            return end
+        return _scan_object(content, start, _on_member)
+
+    def on_otus(otus_id, start):
+        end = _value_end(content, start)
+        index['otus'][otus_id] = [start, end]
+        return end
+
+    def on_nexml(key, start):
+        if key == 'treesById':
+            return _scan_object(content, start, on_group)
+        if key == 'otusById':
+            return _scan_object(content, start, on_otus)
+        if key in ('trees', 'otus'):
+            # an older NexSON version
+            index['unsupported'] = True
+        end = _value_end(content, start)
+        index['nexml'][key] = [start, end]
+        return end
+
+    def on_top(key, start):
+        if key == 'nexml':
+            return _scan_object(content, start, on_nexml)
+        return None
+
+    try:
+        _scan_object(content, _skip_ws(content, 0), on_top)
+    except IndexError:
+        raise ValueError('Truncated JSON document')
+    return index
+
+def extract_nexson(index, return_type, content_id, read_ranges):
+    """Returns a NexSON 1.2 document with just the parts of a study that are
+    needed to produce `return_type` ("tree", "subtree", "otus" or "otu"): the
+    `nexml` properties, plus the tree and its OTUs or all of the OTUs groups.
+    `read_ranges` is called with a list of (start, end) byte ranges of the
+    study file and must return a list of their contents.
+
+    Returns None if the index cannot be used (an unsupported document or
+    return type, or an unknown tree ID), in which case the caller should
+    read the whole study.
+    """
+    if index.get('version') != INDEX_VERSION or index.get('unsupported'):
+        return None
+    group_id, tree_id = None, None
+    if return_type in ('tree', 'subtree'):
+        tree_id = content_id[0] if return_type == 'subtree' else content_id
+        entry = index['trees'].get(tree_id)
+        if entry is None:
+            return None
+        group_id = entry[0]
+        group = index['groups'][group_id]
+        otus_ids = [i for i in (group['otus'], ) if i in index['otus']]
+    elif return_type in ('otus', 'otu'):
+        otus_ids = list(index['otus'].keys())
+    else:
+        return None
+    # (container, key, range) of each part to read
+    parts = [('nexml', k, r) for k, r in index['nexml'].items()]
+    parts.extend([('otus', i, index['otus'][i]) for i in otus_ids])
+    if tree_id is not None:
+        parts.extend([('group', k, r) for k, r in index['groups'][group_id]['meta'].items()])
+        parts.append(('tree', tree_id, index['trees'][tree_id][1:]))
+    contents = read_ranges([tuple(p[2]) for p in parts])
+    if contents is None:
+        return None
+    nexml = {}
+    otus_by_id = {}
+    group_meta = {}
+    tree_by_id = {}
+    containers = {'nexml': nexml, 'otus': otus_by_id, 'group': group_meta, 'tree': tree_by_id}
+    for (container, key, r), content in zip(parts, contents):
+        containers[container][key] = json.loads(content)
+    # the element orders may only list what the document holds
+    nexml['otusById'] = otus_by_id
+    if '^ot:otusElementOrder' in nexml:
+        nexml['^ot:otusElementOrder'] = [i for i in nexml['^ot:otusElementOrder'] if i in otus_by_id]
+    nexml['treesById'] = {}
+    if tree_id is not None:
+        group_meta['treeById'] = tree_by_id
+        if '^ot:treeElementOrder' in group_meta:
+            group_meta['^ot:treeElementOrder'] = [tree_id]
+        nexml['treesById'][group_id] = group_meta
+    if '^ot:treesElementOrder' in nexml:
+        nexml['^ot:treesElementOrder'] = [i for i in nexml['^ot:treesElementOrder'] if i in nexml['treesById']]
+    return {'nexml': nexml}
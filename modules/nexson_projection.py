@@ -0,0 +1,125 @@
+"""Support for the `fields` argument of a full-study GET, which selects the
+parts of the response that a client needs.
+
+`fields` is a comma-separated list of:
+    * "meta" - the study metadata: every `nexml` property except the OTUs
+      and trees ("otusById"/"treesById" in NexSON 1.2, "otus"/"trees" in
+      older NexSON versions);
+    * "tree:<tree ID>" - a tree, inside its trees element (may be repeated);
+    * the name of any other `nexml` property (e.g. "^ot:studyPublicationReference"
+      or "otusById");
+    * the name of an optional part of the response wrapper ("versionHistory",
+      "commentHTML", "duplicateStudyIDs" or "shardName").
+The `@`-attributes of `nexml` (which identify the NexSON version) are always
+included. The wrapper's "data" is left out if no part of `nexml` is selected.
+"""
+
+WRAPPER_FIELDS = ('versionHistory', 'commentHTML', 'duplicateStudyIDs', 'shardName')
+# the (large) properties of nexml that are left out of "meta"
+BULK_KEYS = ('otusById', 'treesById', 'otus', 'trees')
+
+class ProjectionError(ValueError):
+    pass
+
+
+class Projection(object):
+    def __init__(self, wrapper_fields=(), nexml_keys=(), tree_ids=(), meta=False):
+        self.wrapper_fields = set(wrapper_fields)
+        self.nexml_keys = set(nexml_keys)
+        self.tree_ids = set(tree_ids)
+        self.meta = meta
+
+    def wants(self, wrapper_field):
+        return wrapper_field in self.wrapper_fields
+
+    def wants_data(self):
+        return bool(self.meta or self.nexml_keys or self.tree_ids)
+
+    def wants_key(self, key):
+        "True if all of nexml[key] is selected"
+        if key.startswith('@') or key in self.nexml_keys:
+            return True
+        return self.meta and key not in BULK_KEYS
+
+    def description(self):
+        "A canonical, JSON-serializable description (for cache keys and ETags)"
+        return [sorted(self.wrapper_fields), sorted(self.nexml_keys), sorted(self.tree_ids), self.meta]
+
+    def apply(self, nexson):
+        """Returns a NexSON dict with only the selected parts of `nexson`.
+        The selected values are shared with `nexson`, not copied."""
+        nexml = nexson['nexml']
+        projected = {}
+        for key, value in nexml.items():
+            if self.wants_key(key):
+                projected[key] = value
+        if self.tree_ids:
+            for key in ('treesById', 'trees'):
+                if key in nexml and key not in projected:
+                    trees = _select_trees(nexml[key], self.tree_ids)
+                    if trees is not None:
+                        projected[key] = trees
+        return {'nexml': projected}
+
+
+def parse_fields(value):
+    """Returns a Projection for the `fields` argument, or None if `value` is
+    empty (meaning the whole response). Raises ProjectionError for a malformed value."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        # web2py gives a list when the argument is repeated
+        value = ','.join(value)
+    tokens = [t.strip() for t in value.split(',') if t.strip()]
+    if not tokens:
+        return None
+    wrapper_fields, nexml_keys, tree_ids = [], [], []
+    meta = False
+    for token in tokens:
+        if token in WRAPPER_FIELDS:
+            wrapper_fields.append(token)
+        elif token == 'meta':
+            meta = True
+        elif token.startswith('tree:'):
+            tree_id = token[len('tree:'):]
+            if not tree_id:
+                raise ProjectionError('Expecting a tree ID after "tree:" in fields')
+            tree_ids.append(tree_id)
+        elif token in ('sha', 'branch2sha', 'data'):
+            raise ProjectionError('"{}" is always included, and cannot be listed in fields'.format(token))
+        else:
+            nexml_keys.append(token)
+    return Projection(wrapper_fields, nexml_keys, tree_ids, meta)
+
+def _as_list(x):
+    if isinstance(x, list):
+        return x
+    return [x]
+
+def _select_trees(trees_container, tree_ids):
+    """Returns a copy of a trees container (treesById in NexSON 1.2, or the
+    "trees" list/object of older versions) holding only the trees in
+    `tree_ids` (or None if there are none)."""
+    if isinstance(trees_container, dict) and all(isinstance(g, dict) and 'treeById' in g
+                                                  for g in trees_container.values()):
+        # NexSON 1.2: {trees group ID: {..., "treeById": {tree ID: tree}}}
+        selected = {}
+        for group_id, group in trees_container.items():
+            by_id = dict((i, t) for i, t in group['treeById'].items() if i in tree_ids)
+            if by_id:
+                g = dict(group)
+                g['treeById'] = by_id
+                g['^ot:treeElementOrder'] = [i for i in group.get('^ot:treeElementOrder', []) if i in by_id]
+                selected[group_id] = g
+        return selected or None
+    # older versions: a trees group (or list of them) with a "tree" object or list
+    selected = []
+    for group in _as_list(trees_container):
+        if not isinstance(group, dict):
+            continue
+        trees = [t for t in _as_list(group.get('tree', [])) if isinstance(t, dict) and t.get('@id') in tree_ids]
+        if trees:
+            g = dict(group)
+            g['tree'] = trees
+            selected.append(g)
+    return selected or None
@@ -0,0 +1,109 @@
+"""Checks of incoming requests that the handlers share: reading paging and
+boolean arguments, rejecting oversized uploads before they are validated, and
+answering conditional GETs (If-None-Match) with 304s. Each raises an HTTP
+error for the request that fails it.
+"""
+from tiered_cache import key_digest
+from gluon.http import HTTP
+import nexson_index
+import json
+
+def read_paging(kwargs, limit_name='limit', offset_name='offset'):
+    """Returns (limit, offset) from the `limit_name` and `offset_name`
+    request arguments; raises a 400 error for invalid values."""
+    try:
+        limit = kwargs.get(limit_name)
+        if limit is not None:
+            limit = int(limit)
+        offset = int(kwargs.get(offset_name, 0))
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError()
+    except (ValueError, TypeError):
+        msg = '"{l}" and "{o}" must be non-negative integers'.format(l=limit_name, o=offset_name)
+        raise HTTP(400, json.dumps({"error": 1, "description": msg}))
+    return limit, offset
+
+def read_history_paging(kwargs):
+    """Returns (limit, offset) from the "history_limit" and "history_offset" request arguments"""
+    return read_paging(kwargs, 'history_limit', 'history_offset')
+
+def read_bool_arg(kwargs, name, default):
+    "Returns the boolean value of request argument `name` (\"false\", \"f\", \"no\" or \"0\" are False)"
+    v = kwargs.get(name)
+    if v is None or v == '':
+        return default
+    if isinstance(v, str) or isinstance(v, unicode):
+        return v.lower() not in ['f', 'false', 'no', '0']
+    return bool(v)
+
+_BODY_CHUNK_SIZE = 64 * 1024
+def check_request_body(request, max_bytes, max_num_trees=None):
+    """Rejects an upload before it is validated: with a 413 error if it is
+    larger than `max_bytes`, or with a 400 error if it is NexSON with more
+    than `max_num_trees` trees. A body whose Content-Length is over the limit
+    is not read at all. Otherwise (including a chunked body, which has no
+    Content-Length) the body is read in chunks, counting its bytes and its
+    trees (with nexson_index.TreeCounter) as it goes, and the check stops at
+    the first chunk that passes a limit.
+    """
+    try:
+        content_length = int(request.env.content_length or 0)
+    except ValueError:
+        content_length = 0
+    if max_bytes is not None and content_length > max_bytes:
+        raise HTTP(413, json.dumps({"error": 1,
+                                    "description": 'The request body is {c} bytes; the limit is {m} bytes'.format(c=content_length, m=max_bytes)}))
+    if max_bytes is None and max_num_trees is None:
+        return
+    counter = nexson_index.TreeCounter() if max_num_trees is not None else None
+    body = request.body
+    num_bytes = 0
+    try:
+        while True:
+            chunk = body.read(_BODY_CHUNK_SIZE)
+            if not chunk:
+                break
+            num_bytes += len(chunk)
+            if max_bytes is not None and num_bytes > max_bytes:
+                raise HTTP(413, json.dumps({"error": 1,
+                                            "description": 'The request body is larger than the limit of {m} bytes'.format(m=max_bytes)}))
+            if counter is not None:
+                counter.feed(chunk)
+                if counter.count > max_num_trees:
+                    raise HTTP(400, json.dumps({"error": 1,
+                                                "description": 'The study has more trees than the limit of {m}'.format(m=max_num_trees)}))
+                if counter.is_object is False:
+                    # not a JSON document (e.g. a form); left to the normal validation
+                    counter = None
+    finally:
+        body.seek(0)
+
+def compose_etag(*parts):
+    """Returns a strong ETag for a response that is fully determined by `parts`
+    (e.g. a document's blob SHA and the output options). `parts` must be JSON-serializable.
+    """
+    return '"{}"'.format(key_digest(list(parts)))
+
+def etag_matches(request, etag):
+    "True if the If-None-Match header of `request` lists `etag` (or is '*')"
+    if_none_match = request.env.http_if_none_match
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            # If-None-Match uses the weak comparison function
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+def raise_if_not_modified(request, response, etag):
+    """Adds `etag` to the response headers, and raises an HTTP 304 if the client
+    already has this representation.
+    """
+    response.headers['ETag'] = etag
+    if etag_matches(request, etag):
+        raise HTTP(304, **(response.headers))
@@ -0,0 +1,160 @@
+"""Read-only access to the git objects of the docstore shards (the repos in
+a docstore's repo_parent), used to keep in-process indices up to date
+without checking anything out or taking the shard locks.
+"""
+from sh import git
+import subprocess
+import os
+
+_SKIP_CHUNK_SIZE = 1024 * 1024
+
+def find_shards(repo_parent, doc_dir='study'):
+    """Returns a list of (name, path) for the shards (git repos with a
+    `doc_dir` directory) in `repo_parent`"""
+    shards = []
+    for name in sorted(os.listdir(repo_parent)):
+        path = os.path.join(repo_parent, name)
+        if os.path.isdir(os.path.join(path, '.git')) and os.path.isdir(os.path.join(path, doc_dir)):
+            shards.append((name, path))
+    return shards
+
+def read_master_sha(git_dir):
+    "Reads the SHA of the master branch from the ref files (without running git)"
+    try:
+        with open(os.path.join(git_dir, 'refs', 'heads', 'master')) as inp:
+            return inp.read().strip()
+    except IOError:
+        pass
+    try:
+        with open(os.path.join(git_dir, 'packed-refs')) as inp:
+            for line in inp:
+                ls = line.strip().split(' ')
+                if len(ls) == 2 and ls[1] == 'refs/heads/master':
+                    return ls[0]
+    except IOError:
+        pass
+    return None
+
+def doc_id_from_path(path, doc_dir='study'):
+    """Returns the document ID for a file path in a shard (or None for other files).
+
+    Studies are stored as study/<hash dir>/<id>/<id>.json, collections as
+    collections-by-owner/<owner>/<slug>.json (ID "<owner>/<slug>") and
+    amendments as amendments/<id>.json.
+    """
+    prefix = doc_dir + '/'
+    if not (path.startswith(prefix) and path.endswith('.json')):
+        return None
+    if doc_dir == 'study':
+        return os.path.splitext(os.path.basename(path))[0]
+    return path[len(prefix):-len('.json')]
+
+
+class ShardReader(object):
+    "Reads document files and history from the git objects of one shard"
+    def __init__(self, name, path, doc_dir='study'):
+        self.name = name
+        self.path = path
+        self.doc_dir = doc_dir
+        self.git_dir = os.path.join(path, '.git')
+        self._git_dir_arg = '--git-dir={}'.format(self.git_dir)
+
+    def git(self, *args):
+        "Runs a git command in this shard and returns its output"
+        return str(git(self._git_dir_arg, *args, _tty_out=False))
+
+    def master_sha(self):
+        return read_master_sha(self.git_dir)
+
+    def doc_id_from_path(self, path):
+        return doc_id_from_path(path, self.doc_dir)
+
+    def doc_paths(self, commit_sha):
+        out = self.git('ls-tree', '-r', '--name-only', commit_sha, self.doc_dir)
+        return [p for p in out.splitlines() if self.doc_id_from_path(p)]
+
+    def changed_doc_paths(self, old_sha, new_sha):
+        """Returns (paths added or modified, paths deleted) between two commits.
+        Raises an exception if either commit is unknown."""
+        out = self.git('diff', '--name-status', '--no-renames', old_sha, new_sha, '--', self.doc_dir)
+        changed, deleted = [], []
+        for line in out.splitlines():
+            ls = line.split('\t', 1)
+            if len(ls) != 2 or not self.doc_id_from_path(ls[1]):
+                continue
+            if ls[0].startswith('D'):
+                deleted.append(ls[1])
+            else:
+                changed.append(ls[1])
+        return changed, deleted
+
+    def is_ancestor(self, old_sha, new_sha):
+        "Returns True if `old_sha` is a known commit in the history of `new_sha`"
+        try:
+            self.git('merge-base', '--is-ancestor', old_sha, new_sha)
+        except Exception:
+            return False
+        return True
+
+    def iter_files(self, commit_sha, paths):
+        "Yields (path, content) for each of `paths` in `commit_sha`, using one git process"
+        proc = subprocess.Popen(['git', self._git_dir_arg, 'cat-file', '--batch'],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        try:
+            for path in paths:
+                proc.stdin.write('{s}:{p}\n'.format(s=commit_sha, p=path))
+                proc.stdin.flush()
+                header = proc.stdout.readline().split()
+                if len(header) != 3:
+                    # "<spec> missing"
+                    continue
+                content = proc.stdout.read(int(header[2]))
+                proc.stdout.read(1)  # the newline after the content
+                yield path, content
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+    def read_blob_ranges(self, blob_sha, ranges):
+        """Returns the contents of the (start, end) byte `ranges` of a blob
+        (an `end` of None means the end of the blob), or None if the blob is
+        not in this shard. The blob is streamed, not held in memory, and
+        git is stopped once the last range has been read.
+        """
+        proc = subprocess.Popen(['git', self._git_dir_arg, 'cat-file', '--batch'],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        try:
+            proc.stdin.write('{}\n'.format(blob_sha))
+            proc.stdin.close()
+            header = proc.stdout.readline().split()
+            if len(header) != 3 or header[1] != 'blob':
+                return None
+            size = int(header[2])
+            contents = [None] * len(ranges)
+            pos = 0
+            for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+                start, end = ranges[i]
+                if end is None:
+                    end = size
+                if start < pos or end > size:
+                    raise ValueError('Overlapping or out-of-bounds byte range {}'.format(ranges[i]))
+                while pos < start:
+                    skipped = len(proc.stdout.read(min(start - pos, _SKIP_CHUNK_SIZE)))
+                    if not skipped:
+                        raise ValueError('blob {} ended early'.format(blob_sha))
+                    pos += skipped
+                contents[i] = proc.stdout.read(end - start)
+                pos = end
+            return contents
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def read_blob(self, blob_sha):
+        "Returns the content of a blob, or None if it is not in this shard"
+        contents = self.read_blob_ranges(blob_sha, [(0, None)])
+        return None if contents is None else contents[0]
@@ -0,0 +1,50 @@
+"""Conversions of the trees of a new version of a study to the formats that
+tree GETs ask for most, made after the write (see
+api_utils.schedule_study_exports) and stored in the conversion cache under
+the keys that those GETs look up.
+"""
+from caches import conversion_cache_key
+
+# (file extension, format argument) of the GET requests whose output is
+#   materialized for each export format
+EXPORT_REQUEST_FORMS = {'newick': (('tre', None), (None, 'newick')),
+                        'nexus': (('nex', None), (None, 'nexus')), }
+
+def study_tree_ids(nexson):
+    "Returns the IDs of the trees of a (by-ID) NexSON study"
+    tree_ids = []
+    for group in nexson['nexml'].get('treesById', {}).values():
+        tree_ids.extend(group.get('treeById', {}).keys())
+    return tree_ids
+
+def materialize_tree_exports(nexson, blob_sha, formats, cache, make_schema, src_schema):
+    """Converts every tree of `nexson` (the version of a study file with git
+    `blob_sha`) to each of `formats` (keys of EXPORT_REQUEST_FORMS), with the
+    default labeling options, and puts the results in `cache`. A tree whose
+    exports are all in the cache is not converted again.
+    make_schema(**kwargs) returns the PhyloSchema of a GET with those
+    arguments. Returns the number of conversions made.
+    """
+    num_converted = 0
+    for fmt in formats:
+        for tree_id in study_tree_ids(nexson):
+            keys = []
+            for ext, format_arg in EXPORT_REQUEST_FORMS[fmt]:
+                # the arguments of such a GET after __validate_output_nexml2json
+                kwargs = {'output_nexml2json': '0.0.0'}
+                if format_arg:
+                    kwargs['format'] = format_arg
+                schema = make_schema(schema=format_arg,
+                                     type_ext=ext and '.' + ext,
+                                     content='tree',
+                                     content_id=tree_id,
+                                     **kwargs)
+                keys.append(conversion_cache_key(blob_sha, schema, 'tree', tree_id, kwargs))
+            if all(cache.get(k) is not None for k in keys):
+                continue
+            exported = schema.convert(nexson, serialize=True, src_schema=src_schema)
+            num_converted += 1
+            if exported:
+                for k in keys:
+                    cache.put(k, exported)
+    return num_converted
@@ -0,0 +1,246 @@
+"""An in-process index of a few facts about every study on the master branch
+of the phylesystem shards (its DOI, year, curators and numbers of trees and
+OTUs), used to find studies with the same DOI and to list studies without
+reading them.
+
+The index records the master SHA of each shard that it reflects. `sync`
+compares those with the current master SHAs (read from the ref files, so
+checking is cheap) and re-reads only the study files that git reports as
+changed. The index is persisted as a JSON file, so that a restarted server
+only has to catch up on the commits made since it was last saved.
+"""
+import threading
+import tempfile
+import json
+import os
+import re
+
+# bump this when summarize_study changes, so that persisted indices are rebuilt
+SUMMARY_VERSION = 2
+
+_DOI_PREFIX_PATTERN = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+def normalize_doi(doi):
+    "Returns the bare, lower-case form of a DOI or DOI URL (or None for an empty value)"
+    if not doi:
+        return None
+    doi = _DOI_PREFIX_PATTERN.sub('', doi.strip()).strip()
+    return doi.lower() or None
+
+def study_doi(nexson):
+    try:
+        return nexson['nexml']['^ot:studyPublication']['@href']
+    except (KeyError, TypeError):
+        return None
+
+def _as_list(x):
+    if x is None:
+        return []
+    if isinstance(x, list):
+        return x
+    return [x]
+
+def _count_children(container, by_id_key, list_key):
+    """Counts the trees (or OTUs) in the treesById (otusById) object of
+    NexSON 1.2, or in the trees (otus) group or list of groups of older versions"""
+    if isinstance(container, dict) and all(isinstance(g, dict) and by_id_key in g for g in container.values()):
+        return sum(len(g[by_id_key]) for g in container.values())
+    return sum(len(_as_list(g.get(list_key))) for g in _as_list(container) if isinstance(g, dict))
+
+def study_year(nexson):
+    try:
+        return int(nexson['nexml']['^ot:studyYear'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def study_curators(nexson):
+    try:
+        names = _as_list(nexson['nexml']['^ot:curatorName'])
+    except (KeyError, TypeError):
+        return []
+    return [n for n in names if n]
+
+def summarize_study(nexson):
+    "Returns the dict of facts about a study that the index keeps"
+    nexml = nexson.get('nexml', {})
+    return {'doi': normalize_doi(study_doi(nexson)),
+            'year': study_year(nexson),
+            'curators': study_curators(nexson),
+            'num_trees': _count_children(nexml.get('treesById', nexml.get('trees')), 'treeById', 'tree'),
+            'num_otus': _count_children(nexml.get('otusById', nexml.get('otus')), 'otuById', 'otu'), }
+
+class StudyIndex(object):
+    """Maps study IDs to the dicts made by summarize_study, and DOIs to
+    study IDs, for the studies on master in every shard.
+
+    `ready` is False until the index reflects every shard at least once.
+    """
+    def __init__(self, filepath=None):
+        self.filepath = filepath
+        self.ready = False
+        self._shard_shas = {}
+        self._summaries = {}
+        self._by_doi = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def load(self):
+        "Reads the persisted index; returns False if there is none (or it is stale or corrupt)"
+        if not self.filepath:
+            return False
+        try:
+            with open(self.filepath) as inp:
+                blob = json.load(inp)
+            if blob.get('summary_version') != SUMMARY_VERSION:
+                return False
+            shard_shas = dict(blob['shard_shas'])
+            summaries = dict(blob['studies'])
+        except (IOError, ValueError, KeyError, TypeError, AttributeError):
+            return False
+        with self._lock:
+            self._shard_shas = shard_shas
+            self._summaries = {}
+            self._by_doi = {}
+            for study_id, summary in summaries.items():
+                self._set(study_id, summary)
+        return True
+
+    def save(self):
+        if not self.filepath:
+            return
+        with self._lock:
+            blob = {'summary_version': SUMMARY_VERSION,
+                    'shard_shas': dict(self._shard_shas),
+                    'studies': dict(self._summaries)}
+        par = os.path.dirname(self.filepath)
+        if not os.path.isdir(par):
+            os.makedirs(par)
+        handle, tmpfn = tempfile.mkstemp(suffix='.json', dir=par)
+        with os.fdopen(handle, 'w') as outp:
+            json.dump(blob, outp)
+        os.rename(tmpfn, self.filepath)
+
+    def _set(self, study_id, summary):
+        "Must be called with self._lock held"
+        self._unset(study_id)
+        self._summaries[study_id] = summary
+        doi = summary.get('doi')
+        if doi:
+            self._by_doi.setdefault(doi, set()).add(study_id)
+
+    def _unset(self, study_id):
+        "Must be called with self._lock held"
+        old = self._summaries.pop(study_id, None)
+        if old and old.get('doi'):
+            ids = self._by_doi.get(old['doi'])
+            if ids is not None:
+                ids.discard(study_id)
+                if not ids:
+                    del self._by_doi[old['doi']]
+
+    def remove_study(self, study_id):
+        with self._lock:
+            self._unset(study_id)
+
+    def shard_shas(self):
+        "Returns a sorted list of [shard name, SHA of master] that the index reflects"
+        with self._lock:
+            return sorted([k, v] for k, v in self._shard_shas.items())
+
+    def get_summary(self, study_id):
+        with self._lock:
+            return self._summaries.get(study_id)
+
+    def study_ids_for_doi(self, doi):
+        "Returns a sorted list of the IDs of studies with `doi`"
+        doi = normalize_doi(doi)
+        if not doi:
+            return []
+        with self._lock:
+            return sorted(self._by_doi.get(doi, ()))
+
+    def duplicate_study_ids(self, doi, study_id):
+        "Returns the IDs of the other studies that have `doi` (or None if the index is not ready)"
+        if not self.ready:
+            return None
+        return [i for i in self.study_ids_for_doi(doi) if i != study_id]
+
+    def find_studies(self, shard=None, curator=None, year=None, has_doi=None):
+        """Returns a list of (study ID, summary) sorted by study ID, for the
+        studies that match all of the filters that are not None. `curator`
+        matches any of the curators of a study, ignoring case."""
+        if curator is not None:
+            curator = curator.lower()
+        with self._lock:
+            items = list(self._summaries.items())
+        matches = []
+        for study_id, summary in items:
+            if shard is not None and summary.get('shard') != shard:
+                continue
+            if year is not None and summary.get('year') != year:
+                continue
+            if has_doi is not None and bool(summary.get('doi')) != has_doi:
+                continue
+            if curator is not None and curator not in [c.lower() for c in summary.get('curators', [])]:
+                continue
+            matches.append((study_id, summary))
+        matches.sort()
+        return matches
+
+    def sync(self, shards, blocking=True):
+        """Brings the index up to date with the master branch of each of
+        `shards` (shard_reader.ShardReader objects), re-reading only changed study files.
+        Returns False without doing anything if another thread is syncing
+        and `blocking` is False.
+        """
+        if not self._sync_lock.acquire(blocking):
+            return False
+        try:
+            modified = False
+            for shard in shards:
+                if self._sync_shard(shard):
+                    modified = True
+            self.ready = True
+            if modified:
+                self.save()
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def _sync_shard(self, shard):
+        new_sha = shard.master_sha()
+        if new_sha is None:
+            return False
+        with self._lock:
+            old_sha = self._shard_shas.get(shard.name)
+        if old_sha == new_sha:
+            return False
+        deleted = []
+        if old_sha is None:
+            changed = shard.doc_paths(new_sha)
+        else:
+            try:
+                changed, deleted = shard.changed_doc_paths(old_sha, new_sha)
+            except Exception:
+                # the old commit is gone (e.g. the shard was re-cloned); re-read the shard
+                changed = shard.doc_paths(new_sha)
+                self._forget_shard(shard.name)
+        for path in deleted:
+            self.remove_study(shard.doc_id_from_path(path))
+        for path, content in shard.iter_files(new_sha, changed):
+            study_id = shard.doc_id_from_path(path)
+            try:
+                nexson = json.loads(content)
+            except ValueError:
+                self.remove_study(study_id)
+                continue
+            with self._lock:
+                self._set(study_id, dict(summarize_study(nexson), shard=shard.name))
+        with self._lock:
+            self._shard_shas[shard.name] = new_sha
+        return True
+
+    def _forget_shard(self, shard_name):
+        with self._lock:
+            for study_id, summary in list(self._summaries.items()):
+                if summary.get('shard') == shard_name:
+                    self._unset(study_id)
@@ -0,0 +1,66 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+import api_config
+from api_config import load_config_snapshot
+
+class TestConfigSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.private_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.private_dir)
+        api_config._CONFIG_SNAPSHOT = None
+
+    def _write(self, filename, text, mtime):
+        fp = os.path.join(self.private_dir, filename)
+        with open(fp, 'w') as outp:
+            outp.write(text)
+        os.utime(fp, (mtime, mtime))
+
+    def test_reloads_when_the_file_changes(self):
+        self._write('config', '[workers]\nbatch_max_workers = 3\n', 1000)
+        snapshot = load_config_snapshot(self.private_dir)
+        self.assertEqual(snapshot.settings('batch'), (3, 500))
+        # unchanged on disk: the same snapshot (and its computed settings)
+        self.assertTrue(load_config_snapshot(self.private_dir) is snapshot)
+        self._write('config', '[workers]\nbatch_max_workers = 5\n', 2000)
+        changed = load_config_snapshot(self.private_dir)
+        self.assertFalse(changed is snapshot)
+        self.assertEqual(changed.settings('batch'), (5, 500))
+        # a localconfig takes precedence
+        self._write('localconfig', '[workers]\nbatch_max_studies = 7\n', 2000)
+        self.assertEqual(load_config_snapshot(self.private_dir).settings('batch'), (8, 7))
+
+    def test_settings(self):
+        self._write('config', '[cache]\n'
+                              'conversion_cache_max_items = many\n'
+                              'supporting_file_cache_dir =\n'
+                              'materialized_exports = Nexus, phylip\n'
+                              '[apis]\n'
+                              'bulk_ingest_logins = alice, bob,\n', 1000)
+        snapshot = load_config_snapshot(self.private_dir)
+        # a value that is not a number is replaced by the default
+        self.assertEqual(snapshot.settings('conversion_cache'),
+                         (256, os.path.join(self.private_dir, 'cache', 'conversions'), 2000000000))
+        # an empty directory disables the cache
+        self.assertEqual(snapshot.settings('supporting_file')[0], '')
+        self.assertEqual(snapshot.settings('materialized_exports'), ['nexus'])
+        self.assertEqual(snapshot.settings('bulk_ingest')[0], ['alice', 'bob'])
+        self.assertEqual(snapshot.settings('commit_coalescing'), 10.0)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestConfigSnapshot))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,128 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os, sys
+import bulk_ingest
+from bulk_ingest import read_documents, validate_documents, ingest
+
+class _Phylesystem(object):
+    "The public methods of a peyotl Phylesystem used by ingest"
+    def __init__(self, study_ids):
+        self.study_ids = list(study_ids)
+        self.num_minted = 0
+        self.ingested = []
+    def get_study_ids(self):
+        return list(self.study_ids)
+    def ingest_new_study(self, new_study_nexson, repo_nexml2json, auth_info, new_study_id=None):
+        if new_study_id is None:
+            self.num_minted += 1
+            new_study_id = 'ot_{}'.format(self.num_minted)
+        if new_study_nexson['nexml'].get('^ot:studyYear') == 'fail':
+            raise ValueError('Study ID does not match the expected pattern')
+        self.study_ids.append(new_study_id)
+        self.ingested.append((new_study_id, new_study_nexson, auth_info['login']))
+        return new_study_id, {'error': 0, 'sha': 'sha_{}'.format(new_study_id), 'merge_needed': False}
+    def get_repo_and_path_fragment(self, study_id):
+        return ('phylesystem_0' if study_id.startswith('pg_') else 'phylesystem_1'), 'study/' + study_id
+
+
+def _validate_and_convert(nexson, repo_nexml2json, **kwargs):
+    "Accepts studies with a ^ot:studyYear, and converts them by adding ^converted"
+    if '^ot:studyYear' not in nexson['nexml']:
+        raise ValueError('no year')
+    nexson['nexml']['^converted'] = repo_nexml2json
+    return nexson, None, None, None
+
+def _write_as_json(blob, dest):
+    with open(dest, 'w') as outp:
+        json.dump(blob, outp)
+
+
+class TestBulkIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.staging_dir = os.path.join(self.tmp_dir, 'staging')
+        os.makedirs(self.staging_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_documents(self):
+        lines = ['{"nexml": {"^ot:studyYear": 2001}}\n',
+                 '\n',
+                 '{"id": 12, "nexson": {"nexml": {}}}\n',
+                 '{"id": "pg_13"}\n',
+                 '[1, 2]\n',
+                 '{"nexml": {"@about": "' + 'x' * 100 + '"}}\n']
+        docs = list(read_documents(lines, self.staging_dir, max_doc_bytes=100))
+        self.assertEqual([d[0] for d in docs], [1, 3, 4, 5, 6])
+        self.assertEqual(docs[0][1], None)
+        self.assertEqual(json.load(open(docs[0][2])), {"nexml": {"^ot:studyYear": 2001}})
+        self.assertEqual(docs[1][1], 'pg_12')
+        for d in docs[2:]:
+            self.assertEqual(d[2], None)
+            self.assertTrue(d[3])
+
+    def test_validate_documents_in_processes(self):
+        def _validate(nexson, repo_nexml2json, **kwargs):
+            # reports the process that validated the study
+            raise ValueError('{}:{}'.format(nexson['nexml']['^ot:studyId'], os.getpid()))
+        tasks = []
+        for n in range(4):
+            doc_path = os.path.join(self.staging_dir, '{}.in.json'.format(n))
+            with open(doc_path, 'w') as outp:
+                json.dump({'nexml': {}}, outp)
+            tasks.append((n, 'pg_{}'.format(n), doc_path, '1.2.1', None, self.staging_dir))
+        real_validate = bulk_ingest.validate_and_convert_nexson
+        bulk_ingest.validate_and_convert_nexson = _validate
+        try:
+            results = validate_documents(tasks, processes=2)
+        finally:
+            bulk_ingest.validate_and_convert_nexson = real_validate
+        self.assertEqual([(r['line'], r['id']) for r in results], [(n, 'pg_{}'.format(n)) for n in range(4)])
+        for r in results:
+            study_id, pid = r['error'].split(':')
+            self.assertEqual(study_id, r['id'])
+            self.assertNotEqual(int(pid), os.getpid())
+        self.assertFalse(os.listdir(self.staging_dir))
+
+    def test_ingest(self):
+        lines = ['{"nexml": {"^ot:studyYear": 2001}}\n',
+                 '{"id": "pg_2", "nexson": {"nexml": {"^ot:studyYear": 2002}}}\n',
+                 '{"id": "pg_3", "nexson": {"nexml": {"^ot:studyYear": 2003}}}\n',
+                 '{"id": "pg_4", "nexson": {"nexml": {}}}\n',
+                 '{"id": "pg_5", "nexson": {"nexml": {"^ot:studyYear": "fail"}}}\n',
+                 '{"nexml": {"^ot:studyYear": 2006}}\n']
+        phylesystem = _Phylesystem(['pg_3'])
+        documents = read_documents(lines, self.staging_dir)
+        real_functions = bulk_ingest.validate_and_convert_nexson, bulk_ingest.write_as_json
+        bulk_ingest.validate_and_convert_nexson, bulk_ingest.write_as_json = _validate_and_convert, _write_as_json
+        try:
+            outcomes, commits = ingest(phylesystem, documents, {'login': 'bob'}, '1.2.1', None, self.staging_dir)
+        finally:
+            bulk_ingest.validate_and_convert_nexson, bulk_ingest.write_as_json = real_functions
+        self.assertEqual([o['line'] for o in outcomes], [1, 2, 3, 4, 5, 6])
+        self.assertEqual([o['id'] for o in outcomes], ['ot_1', 'pg_2', 'pg_3', 'pg_4', 'pg_5', 'ot_2'])
+        self.assertEqual(['error' in o for o in outcomes], [False, False, True, True, True, False])
+        self.assertTrue('already in use' in outcomes[2]['error'])
+        # the studies are written in the repo's NexSON version, one at a time, by ingest_new_study
+        self.assertEqual([(i[0], i[1]['nexml']['^converted'], i[2]) for i in phylesystem.ingested],
+                         [('ot_1', '1.2.1', 'bob'), ('pg_2', '1.2.1', 'bob'), ('ot_2', '1.2.1', 'bob')])
+        self.assertEqual(commits, [{'shard': 'phylesystem_0', 'sha': 'sha_pg_2', 'study_ids': ['pg_2']},
+                                   {'shard': 'phylesystem_1', 'sha': 'sha_ot_2', 'study_ids': ['ot_1', 'ot_2']}])
+        self.assertFalse(os.listdir(self.staging_dir))
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestBulkIngest))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
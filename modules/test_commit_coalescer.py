@@ -0,0 +1,120 @@
+import unittest
+import subprocess
+import tempfile
+import shutil
+import json
+import os, sys
+from commit_coalescer import CommitCoalescer
+from jobs import JobRegistry, JobError, DONE, FAILED
+
+class TestCommitCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.registry = JobRegistry(os.path.join(self.tmp_dir, 'jobs'))
+        self.state_dir = os.path.join(self.tmp_dir, 'coalescing')
+        # a long window, so that the tests do the flushing
+        self.coalescer = CommitCoalescer(self.registry, self.state_dir, window=3600)
+        self.commits = []
+
+    def _commit_fn(self, content):
+        def _commit(parent_sha, commit_msg):
+            sha = 'c{}'.format(len(self.commits) + 1)
+            self.commits.append((parent_sha, commit_msg, content, sha))
+            return {'error': 0, 'sha': sha}
+        return _commit
+
+    def tearDown(self):
+        self.coalescer.flush_all()
+        shutil.rmtree(self.tmp_dir)
+
+    def _submit(self, coalescer, key, parent_sha, commit_msg, content):
+        "Returns (number of saves held, job ID), or None if the save was not held"
+        held = coalescer.submit(key, parent_sha, commit_msg, self._commit_fn(content), resource_id=key[1])
+        if held is None:
+            return None
+        return held[0], held[1]['id']
+
+    def test_saves_are_folded(self):
+        key = ('curator', 'ot_1')
+        count, job_id = self._submit(self.coalescer, key, 'p', 'first', 1)
+        self.assertEqual(count, 1)
+        self.assertEqual(self._submit(self.coalescer, key, 'p', None, 2), (2, job_id))
+        self.assertEqual(self._submit(self.coalescer, key, 'p', 'third', 3), (3, job_id))
+        self.assertEqual(self.commits, [])
+        self.assertEqual(self.registry.get(job_id)['resource_id'], 'ot_1')
+        job = self.coalescer.flush(key)
+        self.assertEqual(self.commits, [('p', 'first\n\nthird', 3, 'c1')])
+        self.assertEqual(job['status'], DONE)
+        self.assertEqual(self.registry.get(job_id)['result']['sha'], 'c1')
+        # the next saves start from the new commit
+        self.assertEqual(self._submit(self.coalescer, key, 'c1', None, 4)[0], 1)
+        self.coalescer.flush(key)
+        self.assertEqual(self.commits[-1], ('c1', None, 4, 'c2'))
+
+    def test_failed_commit_is_reported(self):
+        key = ('curator', 'ot_1')
+        def _fail(parent_sha, commit_msg):
+            raise JobError(400, {'error': 1, 'description': 'bad'})
+        count, job = self.coalescer.submit(key, 'p', None, _fail)
+        self.coalescer.flush(key)
+        job = self.registry.get(job['id'])
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['error'], {'status': 400, 'details': {'error': 1, 'description': 'bad'}})
+
+    def test_saves_held_by_a_dead_process(self):
+        key = ('curator', 'ot_1')
+        job = self.registry.create('study_save', starting_commit_SHA='p')
+        p = subprocess.Popen(['true'])
+        p.wait()
+        with open(self.coalescer._held_path(key), 'w') as outp:
+            json.dump({'parent': 'p', 'pid': p.pid, 'job_id': job['id']}, outp)
+        self.assertEqual(self._submit(self.coalescer, key, 'p', None, 1)[0], 1)
+        self.assertEqual(self.registry.get(job['id'])['status'], FAILED)
+
+    def test_saves_held_by_a_live_process(self):
+        coalescer = CommitCoalescer(self.registry, self.state_dir, window=0.1)
+        key = ('curator', 'ot_1')
+        p = subprocess.Popen(['sleep', '30'])
+        try:
+            with open(coalescer._held_path(key), 'w') as outp:
+                json.dump({'parent': 'p', 'pid': p.pid}, outp)
+            # waits for at most two windows (and a second), then is not held
+            self.assertEqual(self._submit(coalescer, key, 'p', None, 1), None)
+        finally:
+            p.kill()
+            p.wait()
+        self.assertTrue(os.path.exists(coalescer._held_path(key)))
+
+    def test_save_from_another_commit_is_not_held(self):
+        key = ('curator', 'ot_1')
+        count, job_id = self._submit(self.coalescer, key, 'p', None, 1)
+        # a save from an older (or newer) commit is committed as usual, after the held saves
+        self.assertEqual(self._submit(self.coalescer, key, 'q', None, 2), None)
+        self.assertEqual(self.commits, [('p', None, 1, 'c1')])
+        self.assertEqual(self.registry.get(job_id)['status'], DONE)
+        self.assertFalse(os.listdir(os.path.join(self.state_dir, 'held')))
+        self.assertEqual(self.coalescer.flush(key), None)
+
+    def test_window(self):
+        coalescer = CommitCoalescer(self.registry, self.state_dir, window=0.2)
+        key = ('curator', 'ot_1')
+        self._submit(coalescer, key, 'p', None, 1)
+        timer = coalescer._pending[key]['timer']
+        self._submit(coalescer, key, 'p', None, 2)
+        timer.join()
+        self.assertEqual(self.commits, [('p', None, 2, 'c1')])
+        self.assertFalse(os.listdir(os.path.join(self.state_dir, 'held')))
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestCommitCoalescer))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
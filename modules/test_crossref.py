@@ -0,0 +1,100 @@
+import unittest
+import json
+import os, sys
+import requests
+from tiered_cache import LRUCache, TieredCache, TTLCache
+from fanout import WorkerPool
+from crossref import CrossRefClient
+
+class _Response(object):
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Session(object):
+    "Answers like CrossRef for one known DOI, and records the requests"
+    def __init__(self):
+        self.requests = []
+        self.down = False
+    def get(self, url, params=None, timeout=None):
+        self.requests.append((url, params))
+        if self.down:
+            raise requests.ConnectionError('down')
+        if url.endswith('/transform/text/x-bibliography'):
+            if '10.1234%2fabc' in url.lower():
+                return _Response(200, 'Smith, J. (2001). A study. <i>J</i>.')
+            return _Response(404, 'Resource not found.')
+        items = []
+        if params.get('filter') == 'doi:10.1234/ABC' or 'smith' in params.get('query', '').lower():
+            items = [{'DOI': '10.1234/abc', 'URL': 'http://dx.doi.org/10.1234/abc'}]
+        return _Response(200, json.dumps({'status': 'ok', 'message': {'items': items}}))
+
+
+class TestCrossRefClient(unittest.TestCase):
+    def setUp(self):
+        self.session = _Session()
+        self.now = 0.0
+        self.cache = TieredCache(LRUCache(16))
+        self.client = CrossRefClient(self.session, self.cache, pool=WorkerPool(2),
+                                     negative_cache=TTLCache(16, 60.0, clock=lambda: self.now))
+
+    def test_lookup_by_doi_is_cached(self):
+        works, doi, ref_text = self.client.lookup(doi='10.1234/ABC')
+        self.assertEqual(works['message']['items'][0]['DOI'], '10.1234/abc')
+        self.assertEqual(doi, '10.1234/abc')
+        self.assertEqual(ref_text, u'Smith, J. (2001). A study. <i>J</i>.')
+        self.assertEqual(len(self.session.requests), 2)
+        self.session.down = True
+        self.assertEqual(self.client.lookup(doi='10.1234/abc '), (works, doi, ref_text))
+        self.assertEqual(len(self.session.requests), 2)
+
+    def test_lookup_by_reference(self):
+        works, doi, ref_text = self.client.lookup(ref_string='Smith  2001, A study')
+        self.assertEqual(doi, '10.1234/abc')
+        self.assertTrue(ref_text.startswith('Smith'))
+        # the same reference, differently spaced, is not looked up again
+        self.client.lookup(ref_string='smith 2001, a   study')
+        self.assertEqual(len(self.session.requests), 2)
+
+    def test_failures(self):
+        self.assertEqual(self.client.lookup(doi='10.9/none')[2], None)
+        num_requests = len(self.session.requests)
+        # a 404 is remembered for a while, but an outage is not
+        self.client.lookup(doi='10.9/none')
+        self.assertEqual(len(self.session.requests), num_requests)
+        self.now += 61.0
+        self.client.lookup(doi='10.9/none')
+        self.assertEqual(len(self.session.requests), 2 * num_requests)
+        self.session.down = True
+        self.assertEqual(self.client.lookup(ref_string='Jones'), (None, None, None))
+        self.session.down = False
+        self.assertNotEqual(self.client.lookup(ref_string='Jones')[0], None)
+
+    def test_negative_answers_stay_out_of_the_cache(self):
+        self.client.lookup(ref_string='Jones')
+        self.client.lookup(doi='10.9/none')
+        num_requests = len(self.session.requests)
+        self.client.lookup(ref_string='Jones')
+        self.assertEqual(len(self.session.requests), num_requests)
+        # only the TTLCache holds them, so nothing reaches the (disk) cache
+        self.client.negative_cache = None
+        self.client.lookup(ref_string='Jones')
+        self.client.lookup(doi='10.9/none')
+        self.assertEqual(len(self.session.requests), 2 * num_requests)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestCrossRefClient))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,136 @@
+import unittest
+import threading
+import tempfile
+import shutil
+import json
+import os, sys
+from sh import git, ErrorReturnCode
+from peyotl.git_storage.git_action import MergeException
+from deferred_merge import merge_to_master
+
+class _GitAction(object):
+    "The public methods of a peyotl git action used by merge_to_master"
+    def __init__(self, repo):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self.num_locked = 0
+    def _git(self, *args):
+        return str(git('--git-dir={}'.format(os.path.join(self.repo, '.git')), '--work-tree={}'.format(self.repo),
+                       *args, _tty_out=False)).strip()
+    def acquire_lock(self):
+        self._lock.acquire()
+        self.num_locked += 1
+    def release_lock(self):
+        self._lock.release()
+    def checkout_master(self):
+        self._git('checkout', '-q', 'master')
+    def branch_exists(self, branch):
+        try:
+            self._git('rev-parse', '--verify', 'refs/heads/' + branch)
+        except ErrorReturnCode:
+            return False
+        return True
+    def get_master_sha(self):
+        return self._git('rev-parse', 'master')
+    def path_for_doc(self, doc_id):
+        return os.path.join(self.repo, 'study', doc_id, doc_id + '.json')
+    def get_blob_sha_for_file(self, filepath, branch='HEAD'):
+        return self._git('rev-parse', '{b}:{p}'.format(b=branch, p=os.path.relpath(filepath, self.repo)))
+    def merge(self, branch, destination='master'):
+        self._git('checkout', '-q', destination)
+        try:
+            self._git('merge', '--no-edit', branch)
+        except ErrorReturnCode:
+            self._git('merge', '--abort')
+            raise MergeException()
+        return self._git('rev-parse', 'HEAD')
+    def delete_branch(self, branch):
+        self._git('branch', '-d', branch)
+
+
+class TestDeferredMerge(unittest.TestCase):
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        git('init', '-q', self.repo)
+        self.ga = _GitAction(self.repo)
+        self._git = self.ga._git
+        self._git('config', 'user.name', 'Tester')
+        self._git('config', 'user.email', 'tester@example.org')
+        self._git('checkout', '-q', '-b', 'master')
+        self._commit('pg_1', 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def _commit(self, study_id, year, branch=None):
+        "Commits a version of the study to `branch` (master if None), returning the SHA"
+        if branch is not None:
+            self._git('checkout', '-q', branch)
+        path = self.ga.path_for_doc(study_id)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as outp:
+            json.dump({'nexml': {'^ot:studyYear': year}}, outp)
+        self._git('add', path)
+        self._git('commit', '-q', '-m', 'year {}'.format(year))
+        sha = self._git('rev-parse', 'HEAD')
+        self._git('checkout', '-q', 'master')
+        return sha
+
+    def _branch(self, name):
+        self._git('branch', name, 'master')
+        return name
+
+    def _blob_sha(self, commit, study_id):
+        return self._git('rev-parse', '{c}:study/{i}/{i}.json'.format(c=commit, i=study_id))
+
+    def test_merge(self):
+        branch = self._branch('tester_study_pg_1_0')
+        first_prev = self._blob_sha('master', 'pg_1')
+        first_sha = self._commit('pg_1', 2, branch)
+        # a second save stacked on the first before its merge
+        second_prev = self._blob_sha(first_sha, 'pg_1')
+        second_sha = self._commit('pg_1', 3, branch)
+        # another study changed on master in the meantime
+        self._commit('pg_2', 1)
+        merged = merge_to_master(self.ga, 'pg_1', branch, first_sha, prev_file_sha=first_prev)
+        self.assertFalse(merged['merge_needed'])
+        self.assertEqual(merged['branch_name'], 'master')
+        self.assertEqual(merged['sha'], self._git('rev-parse', 'master'))
+        self._git('merge-base', '--is-ancestor', second_sha, 'master')
+        self.assertFalse(self.ga.branch_exists(branch))
+        # the job for the second save finds its commit merged already
+        merged_again = merge_to_master(self.ga, 'pg_1', branch, second_sha, prev_file_sha=second_prev)
+        self.assertEqual(merged_again, merged)
+        self.assertEqual(self.ga.num_locked, 2)
+
+    def test_merge_needed(self):
+        branch = self._branch('tester_study_pg_1_0')
+        prev = self._blob_sha('master', 'pg_1')
+        sha = self._commit('pg_1', 2, branch)
+        self._commit('pg_1', 4)
+        master_sha = self._git('rev-parse', 'master')
+        merged = merge_to_master(self.ga, 'pg_1', branch, sha, prev_file_sha=prev)
+        self.assertEqual(merged, {'sha': sha, 'branch_name': branch, 'merge_needed': True})
+        self.assertEqual(self._git('rev-parse', 'master'), master_sha)
+        # a merge that git cannot make is abandoned
+        merged = merge_to_master(self.ga, 'pg_1', branch, sha, prev_file_sha=prev,
+                                 merged_sha=self._blob_sha('master', 'pg_1'))
+        self.assertEqual(merged, {'sha': sha, 'branch_name': branch, 'merge_needed': True})
+        self.assertEqual(self._git('rev-parse', 'master'), master_sha)
+        self.assertEqual(self._git('status', '--porcelain'), '')
+        self.assertTrue(self.ga.branch_exists(branch))
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestDeferredMerge))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,62 @@
+import unittest
+import threading
+import time
+import sys
+from fanout import WorkerPool, Fanout, TaskTimeout
+
+class TestWorkerPool(unittest.TestCase):
+    def test_result_and_exception(self):
+        pool = WorkerPool(max_workers=2)
+        t = pool.submit(lambda x, y=1: x + y, 2, y=3)
+        self.assertEqual(t.result(5), 5)
+        def fail():
+            raise ValueError('bad')
+        t = pool.submit(fail)
+        self.assertRaises(ValueError, t.result, 5)
+
+    def test_bounded(self):
+        pool = WorkerPool(max_workers=2)
+        release = threading.Event()
+        tasks = [pool.submit(release.wait, 5) for i in range(5)]
+        time.sleep(0.05)
+        self.assertEqual(len(pool._threads), 2)
+        release.set()
+        for t in tasks:
+            self.assertTrue(t.wait(5))
+
+    def test_timeout(self):
+        pool = WorkerPool(max_workers=1)
+        release = threading.Event()
+        t = pool.submit(release.wait, 5)
+        self.assertRaises(TaskTimeout, t.result, 0.01)
+        release.set()
+        t.result(5)
+
+class TestFanout(unittest.TestCase):
+    def test_late_and_failing_steps_are_omitted(self):
+        pool = WorkerPool(max_workers=4)
+        release = threading.Event()
+        f = Fanout(pool)
+        f.submit('fast', 5, lambda: 'a')
+        f.submit('slow', 0.05, release.wait, 5)
+        f.submit('broken', 5, lambda: {}['x'])
+        missed = []
+        r = f.results(on_miss=lambda name, x: missed.append(name))
+        release.set()
+        self.assertEqual(r, {'fast': 'a'})
+        self.assertEqual(sorted(missed), ['broken', 'slow'])
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    for tc in (TestWorkerPool, TestFanout):
+        testsuite.addTests(loader.loadTestsFromTestCase(tc))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
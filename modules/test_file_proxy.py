@@ -0,0 +1,56 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from file_proxy import FileCache
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_fill_while_streaming(self):
+        cache = FileCache(self.cache_dir)
+        key = ['supporting-file', 'https://example.org/f', 'm1']
+        self.assertEqual(cache.get_path(key), None)
+        it = cache.iter_fill(key, iter(['ab', 'cd']))
+        self.assertEqual(next(it), 'ab')
+        # nothing is visible until the whole file has been written
+        self.assertEqual(cache.get_path(key), None)
+        self.assertEqual(list(it), ['cd'])
+        with open(cache.get_path(key), 'rb') as inp:
+            self.assertEqual(inp.read(), 'abcd')
+
+    def test_failed_fetch_leaves_nothing(self):
+        cache = FileCache(self.cache_dir)
+        def _chunks():
+            yield 'ab'
+            raise IOError('connection reset')
+        self.assertRaises(IOError, cache.fill, ['k'], _chunks())
+        self.assertEqual(cache.get_path(['k']), None)
+        leftovers = [fn for d, dns, fns in os.walk(self.cache_dir) for fn in fns]
+        self.assertEqual(leftovers, [])
+
+    def test_pruning(self):
+        cache = FileCache(self.cache_dir, max_bytes=10, prune_interval=1)
+        cache.fill(['a'], ['x' * 8])
+        cache.fill(['b'], ['y' * 8])
+        self.assertEqual(cache.get_path(['a']), None)
+        self.assertTrue(cache.get_path(['b']) is not None)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestFileCache))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,124 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from sh import git
+from history_index import HistoryIndex, relative_date
+from shard_reader import ShardReader, find_shards
+
+class TestRelativeDate(unittest.TestCase):
+    def test_matches_git_wording(self):
+        self.assertEqual(relative_date(1000, 1001), '1 second ago')
+        self.assertEqual(relative_date(0, 3 * 3600), '3 hours ago')
+        self.assertEqual(relative_date(0, 20 * 86400), '3 weeks ago')
+        self.assertEqual(relative_date(0, 400 * 86400), '1 year, 1 month ago')
+        self.assertEqual(relative_date(0, 3000 * 86400), '8 years ago')
+
+class TestHistoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.par = tempfile.mkdtemp()
+        self.shard_path = os.path.join(self.par, 'collections-1')
+        os.makedirs(os.path.join(self.shard_path, 'collections-by-owner', 'jo'))
+        self.git = git.bake('-C', self.shard_path)
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.org')
+        self.git('config', 'user.name', 'Test Curator')
+        self.git('checkout', '-q', '-b', 'master')
+        self.index_path = os.path.join(self.par, 'cache', 'collection.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.par)
+
+    def _commit(self, slug, content, msg):
+        with open(os.path.join(self.shard_path, 'collections-by-owner', 'jo', slug + '.json'), 'w') as outp:
+            outp.write(content)
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', msg)
+        return self.git('rev-parse', 'HEAD').strip()
+
+    def _shards(self):
+        return [ShardReader(name, path, 'collections-by-owner')
+                for name, path in find_shards(self.par, 'collections-by-owner')]
+
+    def test_incremental_history_and_paging(self):
+        a1 = self._commit('a', '{}', 'first a')
+        b1 = self._commit('b', '{}', 'first b')
+        index = HistoryIndex(self.index_path)
+        self.assertEqual(index.history('jo/a'), None)
+        index.sync(self._shards())
+        h = index.history('jo/a')
+        self.assertEqual([e['id'] for e in h], [a1])
+        self.assertEqual(h[0]['author_name'], 'Test Curator')
+        self.assertEqual(h[0]['message_subject'], 'first a')
+        self.assertTrue(h[0]['relative_date'].endswith('ago'))
+
+        a2 = self._commit('a', '{"x": 1}', 'second a')
+        a3 = self._commit('a', '{"x": 2}', 'third a')
+        index.sync(self._shards())
+        self.assertEqual([e['id'] for e in index.history('jo/a')], [a3, a2, a1])
+        self.assertEqual([e['id'] for e in index.history('jo/a', limit=1, offset=1)], [a2])
+        self.assertEqual([e['id'] for e in index.history('jo/b')], [b1])
+
+        reloaded = HistoryIndex(self.index_path)
+        self.assertTrue(reloaded.load())
+        reloaded.ready = True
+        self.assertEqual(reloaded.num_commits('jo/a'), 3)
+
+    def test_merge_commits(self):
+        a1 = self._commit('a', '{}', 'first a')
+        b1 = self._commit('b', '{}', 'first b')
+        self.git('checkout', '-q', '-b', 'wip')
+        a2 = self._commit('a', '{"x": 1}', 'second a')
+        self.git('checkout', '-q', 'master')
+        b2 = self._commit('b', '{"x": 1}', 'second b')
+        self.git('merge', '-q', '--no-edit', 'wip')
+        merge = self.git('rev-parse', 'HEAD').strip()
+        index = HistoryIndex()
+        index.sync(self._shards())
+        # a clean merge is in no history; the merged commit is
+        self.assertEqual([e['id'] for e in index.history('jo/a')], [a2, a1])
+        self.assertEqual([e['id'] for e in index.history('jo/b')], [b2, b1])
+        self.assertFalse(merge in [e['id'] for e in index.history('jo/a') + index.history('jo/b')])
+        # a merge that resolved a conflict is in the history of the document
+        self.git('checkout', '-q', '-b', 'wip2')
+        a3 = self._commit('a', '{"x": 2}', 'third a')
+        self.git('checkout', '-q', 'master')
+        a4 = self._commit('a', '{"x": 3}', 'fourth a')
+        try:
+            self.git('merge', '-q', '--no-edit', 'wip2')
+        except Exception:
+            pass
+        resolved = self._commit('a', '{"x": 4}', 'resolved a')
+        index.sync(self._shards())
+        h = [e['id'] for e in index.history('jo/a')]
+        self.assertEqual(h[0], resolved)
+        self.assertEqual(sorted(h[1:3]), sorted([a3, a4]))
+        self.assertEqual(h[3:], [a2, a1])
+        self.assertEqual(len(self.git('rev-list', '--parents', '-n', '1', resolved).split()), 3)
+        self.assertEqual([e['id'] for e in index.history('jo/b')], [b2, b1])
+
+    def test_rewritten_master_is_reread(self):
+        self._commit('a', '{}', 'first a')
+        index = HistoryIndex()
+        index.sync(self._shards())
+        self.git('commit', '-q', '--amend', '-m', 'reworded')
+        index.sync(self._shards())
+        h = index.history('jo/a')
+        self.assertEqual(len(h), 1)
+        self.assertEqual(h[0]['message_subject'], 'reworded')
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    for tc in (TestRelativeDate, TestHistoryIndex):
+        testsuite.addTests(loader.loadTestsFromTestCase(tc))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,119 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from jobs import JobRegistry, JobError, QUEUED, DONE, FAILED, CANCELLED
+
+class TestJobRegistry(unittest.TestCase):
+    def setUp(self):
+        self.jobs_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.jobs_dir)
+
+    def test_lifecycle(self):
+        registry = JobRegistry(self.jobs_dir)
+        job = registry.create('study_put', resource_id='ot_1')
+        self.assertEqual(job['status'], QUEUED)
+        self.assertEqual(registry.get(job['id'])['resource_id'], 'ot_1')
+        registry.run(job['id'], lambda x: {'sha': x}, 'abc')
+        # another registry (e.g. in another process) sees the outcome
+        finished = JobRegistry(self.jobs_dir).get(job['id'])
+        self.assertEqual(finished['status'], DONE)
+        self.assertEqual(finished['result'], {'sha': 'abc'})
+        self.assertEqual(registry.get('../' + job['id']), None)
+        self.assertEqual(registry.get('0' * 32), None)
+
+    def test_failures(self):
+        registry = JobRegistry(self.jobs_dir)
+        def _conflict():
+            raise JobError(409, {'description': 'conflict'})
+        job = registry.run(registry.create('study_put')['id'], _conflict)
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['error'], {'status': 409, 'details': {'description': 'conflict'}})
+        job = registry.run(registry.create('study_put')['id'], lambda: 1 / 0)
+        self.assertEqual(job['error']['status'], 500)
+
+    def test_cancel(self):
+        registry = JobRegistry(self.jobs_dir)
+        job_id = registry.create('treebase_import')['id']
+        stages = []
+        def _import():
+            registry.progress(job_id, 'fetch', num_bytes=10)
+            stages.append(registry.get(job_id)['stage'])
+            registry.cancel(job_id)
+            registry.progress(job_id, 'convert')
+            stages.append('convert')
+        job = registry.run(job_id, _import)
+        self.assertEqual(job['status'], CANCELLED)
+        self.assertEqual(stages, ['fetch'])
+        # a job can also check for cancellation without recording progress
+        job_id = registry.create('treebase_import')['id']
+        chunks = []
+        def _download():
+            for chunk in range(10):
+                registry.check_cancelled(job_id)
+                chunks.append(chunk)
+                if chunk == 2:
+                    JobRegistry(self.jobs_dir).cancel(job_id)
+        self.assertEqual(registry.run(job_id, _download)['status'], CANCELLED)
+        self.assertEqual(chunks, [0, 1, 2])
+        # a cancelled queued job does not run
+        job_id = registry.create('treebase_import')['id']
+        registry.cancel(job_id)
+        self.assertEqual(registry.run(job_id, lambda: 1 / 0)['status'], CANCELLED)
+        # a finished job cannot be cancelled
+        job_id = registry.create('treebase_import')['id']
+        registry.run(job_id, lambda: 1)
+        self.assertEqual(registry.cancel(job_id)['status'], DONE)
+
+    def test_updates_from_other_processes(self):
+        registry = JobRegistry(self.jobs_dir)
+        job_id = registry.create('treebase_import')['id']
+        children = []
+        for i in range(4):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    # each process sets its own field; none may be lost
+                    child_registry = JobRegistry(self.jobs_dir)
+                    for n in range(200):
+                        child_registry._update(job_id, **{'count_{}'.format(i): n})
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        registry.cancel(job_id)
+        for pid in children:
+            os.waitpid(pid, 0)
+        job = registry.get(job_id)
+        self.assertTrue(job['cancel_requested'])
+        for i in range(4):
+            self.assertEqual(job['count_{}'.format(i)], 199)
+
+    def test_prune(self):
+        registry = JobRegistry(self.jobs_dir, max_age=60)
+        job = registry.create('study_put')
+        registry.cancel(job['id'])
+        fp = os.path.join(self.jobs_dir, job['id'] + '.json')
+        os.utime(fp, (0, 0))
+        # the lock file is never removed
+        lock_path = os.path.join(self.jobs_dir, '.lock')
+        os.utime(lock_path, (0, 0))
+        registry.create('study_put')
+        self.assertEqual(registry.get(job['id']), None)
+        self.assertTrue(os.path.exists(lock_path))
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestJobRegistry))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
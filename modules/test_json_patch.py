@@ -0,0 +1,61 @@
+import unittest
+import sys
+from json_patch import apply_patch, get_value, parse_pointer, JsonPatchError, PatchTestFailed
+
+class TestJsonPatch(unittest.TestCase):
+    def setUp(self):
+        self.doc = {'nexml': {'^ot:studyYear': 2014,
+                              'treesById': {'trees1': {'treeById': {'tree1': {'^ot:branchLengthMode': 'ot:other'}},
+                                                       '^ot:treeElementOrder': ['tree1']}},
+                              'a/b': {'m~n': 1}}}
+
+    def test_pointers(self):
+        self.assertEqual(parse_pointer(''), [])
+        self.assertEqual(parse_pointer('/a~1b/m~0n'), ['a/b', 'm~n'])
+        self.assertEqual(get_value(self.doc, '/nexml/a~1b/m~0n'), 1)
+        self.assertRaises(JsonPatchError, parse_pointer, 'nexml')
+
+    def test_rfc_operations(self):
+        patch = [{'op': 'replace', 'path': '/nexml/^ot:studyYear', 'value': 2015},
+                 {'op': 'add', 'path': '/nexml/treesById/trees1/^ot:treeElementOrder/-', 'value': 'tree2'},
+                 {'op': 'copy', 'from': '/nexml/treesById/trees1/treeById/tree1',
+                  'path': '/nexml/treesById/trees1/treeById/tree2'},
+                 {'op': 'add', 'path': '/nexml/treesById/trees1/treeById/tree2/^ot:branchLengthMode', 'value': 'ot:time'},
+                 {'op': 'move', 'from': '/nexml/a~1b', 'path': '/nexml/c'},
+                 {'op': 'remove', 'path': '/nexml/c/m~0n'},
+                 {'op': 'test', 'path': '/nexml/treesById/trees1/^ot:treeElementOrder', 'value': ['tree1', 'tree2']}]
+        doc = apply_patch(self.doc, patch)
+        nexml = doc['nexml']
+        self.assertEqual(nexml['^ot:studyYear'], 2015)
+        self.assertEqual(nexml['c'], {})
+        self.assertFalse('a/b' in nexml)
+        trees = nexml['treesById']['trees1']['treeById']
+        self.assertEqual(trees['tree1']['^ot:branchLengthMode'], 'ot:other')
+        self.assertEqual(trees['tree2']['^ot:branchLengthMode'], 'ot:time')
+
+    def test_failures(self):
+        self.assertRaises(PatchTestFailed, apply_patch, self.doc,
+                          [{'op': 'test', 'path': '/nexml/^ot:studyYear', 'value': 2013}])
+        # true is not 1 in JSON
+        self.assertRaises(PatchTestFailed, apply_patch, {'a': 1}, [{'op': 'test', 'path': '/a', 'value': True}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, [{'op': 'remove', 'path': '/nexml/nope'}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, [{'op': 'replace', 'path': '/x/y', 'value': 1}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, [{'op': 'add', 'path': '/nexml'}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, [{'op': 'move', 'from': '/nexml', 'path': '/nexml/x'}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, [{'op': 'frobnicate', 'path': ''}])
+        self.assertRaises(JsonPatchError, apply_patch, self.doc, {'op': 'remove', 'path': '/nexml'})
+        self.assertRaises(JsonPatchError, apply_patch, [1], [{'op': 'add', 'path': '/01', 'value': 2}])
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestJsonPatch))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
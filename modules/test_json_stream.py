@@ -0,0 +1,44 @@
+import unittest
+import json
+import sys
+from json_stream import iter_json, iter_jsonp
+
+class TestJSONStream(unittest.TestCase):
+    def setUp(self):
+        nodes = dict(('node{}'.format(i), {'@otu': 'otu{}'.format(i), '^ot:isLeaf': True}) for i in range(200))
+        self.doc = {'sha': 'abc',
+                    'data': {'nexml': {'treesById': {'trees1': {'treeById': {'tree1': {'nodeById': nodes}}}},
+                                       '^ot:comment': u'caf\xe9\u2028 ',
+                                       'empty': {},
+                                       'list': [1, 2.5, None, [], {'a': [False]}]}},
+                    'branch2sha': {},
+                    }
+
+    def test_same_as_dumps(self):
+        chunks = list(iter_json(self.doc, chunk_size=1024))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(json.loads(''.join(chunks)), self.doc)
+        self.assertEqual(''.join(iter_json(self.doc, max_depth=0)), json.dumps(self.doc))
+        self.assertEqual(len(''.join(chunks)), len(json.dumps(self.doc)))
+
+    def test_jsonp(self):
+        s = ''.join(iter_jsonp('cb', self.doc, chunk_size=100))
+        self.assertTrue(s.startswith('cb('))
+        self.assertTrue(s.endswith(')'))
+        self.assertEqual(json.loads(s[3:-1]), self.doc)
+        # line separators must be escaped for JSONP
+        self.assertFalse(u'\u2028' in s)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestJSONStream))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
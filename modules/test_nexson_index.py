@@ -0,0 +1,135 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+from sh import git
+from nexson_index import build_offset_index, extract_nexson, count_trees, TreeCounter
+from shard_reader import ShardReader
+
+STUDY = {'nexml': {'@nexml2json': '1.2.1',
+                   '^ot:studyYear': 2014,
+                   '^ot:comment': u'caf\xe9 "quoted" {not an object}',
+                   '^ot:otusElementOrder': ['otus1', 'otus2'],
+                   'otusById': {'otus1': {'otuById': {'otu1': {'^ot:originalLabel': 'A'}}},
+                                'otus2': {'otuById': {'otu2': {'^ot:originalLabel': 'B'}}}},
+                   '^ot:treesElementOrder': ['trees1', 'trees2'],
+                   'treesById': {'trees1': {'@otus': 'otus1',
+                                            '^ot:treeElementOrder': ['tree1', 'tree2'],
+                                            'treeById': {'tree1': {'nodeById': {'node1': {'@otu': 'otu1'}}},
+                                                         'tree2': {'nodeById': {}}}},
+                                 'trees2': {'@otus': 'otus2',
+                                            'treeById': {'tree3': {'nodeById': {}}}}}}}
+
+def _read_from(content):
+    return lambda ranges: [content[s:e] for s, e in ranges]
+
+class TestOffsetIndex(unittest.TestCase):
+    def test_ranges(self):
+        for indent in (None, 1):
+            content = json.dumps(STUDY, indent=indent, sort_keys=True)
+            index = build_offset_index(content)
+            group_id, start, end = index['trees']['tree1']
+            self.assertEqual(group_id, 'trees1')
+            self.assertEqual(json.loads(content[start:end]), STUDY['nexml']['treesById']['trees1']['treeById']['tree1'])
+            self.assertEqual(index['groups']['trees2']['otus'], 'otus2')
+            self.assertEqual(sorted(index['otus'].keys()), ['otus1', 'otus2'])
+            start, end = index['nexml']['^ot:comment']
+            self.assertEqual(json.loads(content[start:end]), STUDY['nexml']['^ot:comment'])
+
+    def test_extract_tree(self):
+        content = json.dumps(STUDY)
+        doc = extract_nexson(build_offset_index(content), 'subtree', ('tree1', 'node1'), _read_from(content))
+        nexml = doc['nexml']
+        self.assertEqual(nexml['^ot:studyYear'], 2014)
+        self.assertEqual(list(nexml['otusById'].keys()), ['otus1'])
+        self.assertEqual(nexml['^ot:otusElementOrder'], ['otus1'])
+        self.assertEqual(nexml['^ot:treesElementOrder'], ['trees1'])
+        group = nexml['treesById']['trees1']
+        self.assertEqual(group['treeById'], {'tree1': {'nodeById': {'node1': {'@otu': 'otu1'}}}})
+        self.assertEqual(group['^ot:treeElementOrder'], ['tree1'])
+
+    def test_extract_otus_and_misses(self):
+        content = json.dumps(STUDY)
+        index = build_offset_index(content)
+        doc = extract_nexson(index, 'otu', 'otu2', _read_from(content))
+        self.assertEqual(doc['nexml']['otusById'], STUDY['nexml']['otusById'])
+        self.assertEqual(doc['nexml']['treesById'], {})
+        self.assertEqual(extract_nexson(index, 'tree', 'nope', _read_from(content)), None)
+        self.assertEqual(extract_nexson(index, 'meta', None, _read_from(content)), None)
+        old = json.dumps({'nexml': {'trees': [], 'otus': []}})
+        self.assertEqual(extract_nexson(build_offset_index(old), 'otus', None, _read_from(old)), None)
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, build_offset_index, '{"nexml": {"a": ')
+        self.assertRaises(ValueError, build_offset_index, '[]')
+
+class TestCountTrees(unittest.TestCase):
+    def test_versions(self):
+        self.assertEqual(count_trees(json.dumps(STUDY)), 3)
+        self.assertEqual(count_trees(json.dumps({'nexson': STUDY})), 3)
+        old = {'nexml': {'trees': [{'tree': [{'@id': 't1'}, {'@id': 't2'}]}, {'tree': {'@id': 't3'}}]}}
+        self.assertEqual(count_trees(json.dumps(old, indent=2)), 3)
+        self.assertEqual(count_trees('{"nexml": {"trees": {"tree": []}}}'), 0)
+        self.assertEqual(count_trees('{"nexml": {}}'), 0)
+        self.assertRaises(ValueError, count_trees, 'nexson=%7B%7D')
+        self.assertRaises(ValueError, count_trees, '{"nexml": {"treesById": {"g": {"treeById": {"t1": ')
+
+class TestTreeCounter(unittest.TestCase):
+    def _count(self, content, chunk_size):
+        counter = TreeCounter()
+        for i in range(0, len(content), chunk_size):
+            counter.feed(content[i:i + chunk_size])
+        return counter
+
+    def test_chunks(self):
+        old = {'nexml': {'trees': [{'tree': [{'@id': 't1'}, {'@id': 't2'}]}, {'tree': {'@id': 't3'}}]}}
+        escaped = {'nexml': {'^ot:comment': 'a \\"treeById\\": {', 'treesById': {'g': {'treeById': {'t\\"1': {}}}}}}
+        for doc, num_trees in ((STUDY, 3), ({'nexson': STUDY}, 3), (old, 3), (escaped, 1), ({'nexml': {}}, 0)):
+            content = json.dumps(doc, indent=1)
+            for chunk_size in (1, 2, 7, len(content)):
+                counter = self._count(content, chunk_size)
+                self.assertTrue(counter.is_object)
+                self.assertEqual(counter.count, num_trees)
+
+    def test_not_an_object(self):
+        for content in ('nexson=%7B%7D', '  [{"nexml": {}}]'):
+            counter = self._count(content, 3)
+            self.assertEqual(counter.is_object, False)
+            self.assertEqual(counter.count, 0)
+
+class TestBlobRanges(unittest.TestCase):
+    def setUp(self):
+        self.par = tempfile.mkdtemp()
+        self.git = git.bake('-C', self.par)
+        self.git('init', '-q')
+
+    def tearDown(self):
+        shutil.rmtree(self.par)
+
+    def test_read_blob_ranges(self):
+        fp = os.path.join(self.par, 'x.json')
+        content = 'x' * 3000000 + 'abc' + 'y' * 10
+        with open(fp, 'w') as outp:
+            outp.write(content)
+        blob_sha = self.git('hash-object', '-w', fp, _tty_out=False).strip()
+        shard = ShardReader('x', self.par)
+        self.assertEqual(shard.read_blob_ranges(blob_sha, [(3000003, 3000005), (3000000, 3000002)]), ['yy', 'ab'])
+        self.assertEqual(shard.read_blob(blob_sha), content)
+        self.assertEqual(shard.read_blob('0' * 40), None)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    for tc in (TestOffsetIndex, TestCountTrees, TestTreeCounter, TestBlobRanges):
+        testsuite.addTests(loader.loadTestsFromTestCase(tc))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
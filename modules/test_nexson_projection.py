@@ -0,0 +1,69 @@
+import unittest
+import sys
+from nexson_projection import parse_fields, ProjectionError
+
+STUDY = {'nexml': {'@nexml2json': '1.2.1',
+                   '^ot:studyPublicationReference': 'Doe 2014',
+                   '^ot:studyYear': 2014,
+                   'otusById': {'otus1': {'otuById': {}}},
+                   'treesById': {'trees1': {'@otus': 'otus1',
+                                            '^ot:treeElementOrder': ['tree1', 'tree2'],
+                                            'treeById': {'tree1': {'nodeById': {}},
+                                                         'tree2': {'nodeById': {}}}}},
+                   '^ot:treesElementOrder': ['trees1']}}
+
+class TestProjection(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(parse_fields(None), None)
+        self.assertEqual(parse_fields(' , '), None)
+
+    def test_meta(self):
+        p = parse_fields('meta,versionHistory')
+        self.assertTrue(p.wants('versionHistory'))
+        self.assertFalse(p.wants('commentHTML'))
+        nexml = p.apply(STUDY)['nexml']
+        self.assertEqual(sorted(nexml.keys()), ['@nexml2json', '^ot:studyPublicationReference',
+                                                '^ot:studyYear', '^ot:treesElementOrder'])
+
+    def test_keys_and_trees(self):
+        p = parse_fields(['^ot:studyYear', 'tree:tree2'])
+        self.assertFalse(p.wants('versionHistory'))
+        nexml = p.apply(STUDY)['nexml']
+        self.assertEqual(nexml['^ot:studyYear'], 2014)
+        group = nexml['treesById']['trees1']
+        self.assertEqual(list(group['treeById'].keys()), ['tree2'])
+        self.assertEqual(group['^ot:treeElementOrder'], ['tree2'])
+        self.assertEqual(group['@otus'], 'otus1')
+        self.assertFalse('otusById' in nexml)
+        # the source document is not modified
+        self.assertEqual(len(STUDY['nexml']['treesById']['trees1']['treeById']), 2)
+
+    def test_older_nexson_trees(self):
+        doc = {'nexml': {'@about': '#study',
+                         'trees': {'@otus': 'o1', 'tree': [{'@id': 't1'}, {'@id': 't2'}]},
+                         'otus': {'@id': 'o1'}}}
+        nexml = parse_fields('tree:t1,meta').apply(doc)['nexml']
+        self.assertEqual(nexml['trees'], [{'@otus': 'o1', 'tree': [{'@id': 't1'}]}])
+        self.assertFalse('otus' in nexml)
+
+    def test_wrapper_only(self):
+        p = parse_fields('duplicateStudyIDs')
+        self.assertFalse(p.wants_data())
+
+    def test_errors(self):
+        self.assertRaises(ProjectionError, parse_fields, 'tree:')
+        self.assertRaises(ProjectionError, parse_fields, 'sha')
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestProjection))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
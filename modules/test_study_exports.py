@@ -0,0 +1,53 @@
+import unittest
+import os, sys
+from tiered_cache import LRUCache, TieredCache
+from caches import conversion_cache_key
+from study_exports import materialize_tree_exports, study_tree_ids
+
+class _FakeSchema(object):
+    "Stands in for PhyloSchema; its output names the tree and the format"
+    def __init__(self, schema=None, type_ext=None, content=None, content_id=None, **kwargs):
+        self.format = schema or {'.tre': 'newick', '.nex': 'nexus'}[type_ext]
+        self.content_id = content_id
+        self.description = [self.format, content, content_id]
+
+    def convert(self, nexson, serialize=True, src_schema=None):
+        return '{} of {}'.format(self.format, self.content_id)
+
+_STUDY = {'nexml': {'treesById': {'trees1': {'treeById': {'tree1': {}, 'tree2': {}}},
+                                  'trees2': {'treeById': {'tree3': {}}}}}}
+
+class TestStudyExports(unittest.TestCase):
+    def test_tree_ids(self):
+        self.assertEqual(sorted(study_tree_ids(_STUDY)), ['tree1', 'tree2', 'tree3'])
+        self.assertEqual(study_tree_ids({'nexml': {}}), [])
+
+    def test_materialize(self):
+        cache = TieredCache(LRUCache(100), None)
+        n = materialize_tree_exports(_STUDY, 'abc', ['newick'], cache, _FakeSchema, None)
+        self.assertEqual(n, 3)
+        # stored under the keys of both forms of the GET (.tre and format=newick)
+        for kwargs, ext in (({'output_nexml2json': '0.0.0'}, '.tre'),
+                            ({'output_nexml2json': '0.0.0', 'format': 'newick'}, None)):
+            schema = _FakeSchema(schema=kwargs.get('format'), type_ext=ext, content='tree', content_id='tree2')
+            key = conversion_cache_key('abc', schema, 'tree', 'tree2', kwargs)
+            self.assertEqual(cache.get(key), 'newick of tree2')
+        # already cached; only the new format is converted
+        n = materialize_tree_exports(_STUDY, 'abc', ['newick', 'nexus'], cache, _FakeSchema, None)
+        self.assertEqual(n, 3)
+        self.assertEqual(len(cache.memory), 12)
+        self.assertEqual(materialize_tree_exports(_STUDY, 'abc', ['newick', 'nexus'], cache, _FakeSchema, None), 0)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestStudyExports))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,107 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+from sh import git
+from study_index import StudyIndex, normalize_doi
+from shard_reader import ShardReader, find_shards
+
+def _study(doi):
+    return {'nexml': {'^ot:studyPublication': {'@href': doi}}}
+
+class TestStudyIndex(unittest.TestCase):
+    def setUp(self):
+        self.par = tempfile.mkdtemp()
+        self.shard_path = os.path.join(self.par, 'phylesystem_1')
+        os.makedirs(os.path.join(self.shard_path, 'study'))
+        self.git = git.bake('-C', self.shard_path)
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.org')
+        self.git('config', 'user.name', 'test')
+        self.git('checkout', '-q', '-b', 'master')
+        self.index_path = os.path.join(self.par, 'cache', 'study_index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.par)
+
+    def _write(self, study_id, nexson):
+        d = os.path.join(self.shard_path, 'study', study_id)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        with open(os.path.join(d, study_id + '.json'), 'w') as outp:
+            json.dump(nexson, outp)
+
+    def _commit(self):
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'update')
+
+    def _shards(self):
+        return [ShardReader(name, path) for name, path in find_shards(self.par)]
+
+    def test_normalize_doi(self):
+        self.assertEqual(normalize_doi('http://dx.doi.org/10.1/ABC'), '10.1/abc')
+        self.assertEqual(normalize_doi('https://doi.org/10.1/abc '), '10.1/abc')
+        self.assertEqual(normalize_doi('doi: 10.1/abc'), '10.1/abc')
+        self.assertEqual(normalize_doi(''), None)
+
+    def test_incremental_sync_and_persistence(self):
+        self._write('ot_1', _study('http://dx.doi.org/10.1/a'))
+        self._write('ot_2', _study('https://doi.org/10.1/A'))
+        self._write('ot_3', _study('http://dx.doi.org/10.1/b'))
+        self._commit()
+        index = StudyIndex(self.index_path)
+        self.assertEqual(index.duplicate_study_ids('10.1/a', 'ot_1'), None)
+        index.sync(self._shards())
+        self.assertEqual(index.duplicate_study_ids('10.1/a', 'ot_1'), ['ot_2'])
+        self.assertEqual(index.study_ids_for_doi('doi:10.1/b'), ['ot_3'])
+
+        self._write('ot_3', _study('http://dx.doi.org/10.1/a'))
+        os.unlink(os.path.join(self.shard_path, 'study', 'ot_2', 'ot_2.json'))
+        self._commit()
+        index.sync(self._shards())
+        self.assertEqual(index.study_ids_for_doi('10.1/a'), ['ot_1', 'ot_3'])
+        self.assertEqual(index.study_ids_for_doi('10.1/b'), [])
+        self.assertEqual(index.get_summary('ot_2'), None)
+
+        reloaded = StudyIndex(self.index_path)
+        self.assertTrue(reloaded.load())
+        self.assertEqual(reloaded.study_ids_for_doi('10.1/a'), ['ot_1', 'ot_3'])
+
+    def test_summaries_and_filters(self):
+        ot_1 = _study('http://dx.doi.org/10.1/a')
+        ot_1['nexml'].update({'^ot:studyYear': 2014,
+                              '^ot:curatorName': ['Jo Curator', 'Sam'],
+                              'otusById': {'otus1': {'otuById': {'otu1': {}, 'otu2': {}}}},
+                              'treesById': {'trees1': {'treeById': {'tree1': {}, 'tree2': {}}}}})
+        ot_2 = {'nexml': {'^ot:studyYear': '2015', '^ot:curatorName': 'jo curator',
+                          'trees': [{'tree': {'@id': 't1'}}]}}
+        self._write('ot_1', ot_1)
+        self._write('ot_2', ot_2)
+        self._commit()
+        index = StudyIndex()
+        index.sync(self._shards())
+        summary = index.get_summary('ot_1')
+        self.assertEqual((summary['year'], summary['num_trees'], summary['num_otus']), (2014, 2, 2))
+        self.assertEqual(summary['shard'], 'phylesystem_1')
+        summary = index.get_summary('ot_2')
+        self.assertEqual((summary['year'], summary['num_trees'], summary['num_otus']), (2015, 1, 0))
+        self.assertEqual([i for i, s in index.find_studies(curator='JO CURATOR')], ['ot_1', 'ot_2'])
+        self.assertEqual([i for i, s in index.find_studies(year=2015)], ['ot_2'])
+        self.assertEqual([i for i, s in index.find_studies(has_doi=True)], ['ot_1'])
+        self.assertEqual(index.find_studies(shard='other'), [])
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestStudyIndex))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
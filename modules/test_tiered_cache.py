@@ -0,0 +1,112 @@
+import unittest
+import tempfile
+import shutil
+import os, sys
+from tiered_cache import LRUCache, DiskCache, TieredCache, TTLCache, key_digest
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(max_items=2)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)
+        self.assertTrue('a' in c)
+        self.assertFalse('b' in c)
+        self.assertTrue('c' in c)
+        self.assertEqual(len(c), 2)
+
+    def test_disabled(self):
+        c = LRUCache(max_items=0)
+        c.put('a', 1)
+        self.assertEqual(c.get('a', 'missing'), 'missing')
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_round_trip(self):
+        c = DiskCache(self.cache_dir)
+        key = ('conversion', 'abc123', 'tree', 'tree1')
+        self.assertEqual(c.get(key), None)
+        c.put(key, {'newick': u'(a,b);'})
+        self.assertEqual(c.get(key), {'newick': u'(a,b);'})
+        # a fresh instance sees the stored entry
+        self.assertEqual(DiskCache(self.cache_dir).get(key), {'newick': u'(a,b);'})
+        c.discard(key)
+        self.assertEqual(c.get(key), None)
+
+    def test_corrupt_entry_is_a_miss(self):
+        c = DiskCache(self.cache_dir)
+        c.put('k', 'v')
+        with open(c.path_for_key('k'), 'w') as outp:
+            outp.write('{"trunc')
+        self.assertEqual(c.get('k'), None)
+        self.assertFalse(os.path.exists(c.path_for_key('k')))
+
+    def test_prune(self):
+        c = DiskCache(self.cache_dir, max_bytes=50, prune_interval=1000)
+        for i in range(10):
+            c.put(i, 'x' * 20)
+        c.prune()
+        remaining = [i for i in range(10) if c.get(i) is not None]
+        self.assertTrue(0 < len(remaining) < 10)
+
+class TestTieredCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_disk_hit_is_promoted(self):
+        disk = DiskCache(self.cache_dir)
+        disk.put('k', [1, 2])
+        c = TieredCache(LRUCache(4), disk)
+        self.assertEqual(c.get('k'), [1, 2])
+        self.assertTrue(key_digest('k') in c.memory)
+
+    def test_memory_only(self):
+        c = TieredCache(LRUCache(4))
+        c.put('k', 'v')
+        self.assertEqual(c.get('k'), 'v')
+        c.discard('k')
+        self.assertEqual(c.get('k'), None)
+
+    def test_list_keys(self):
+        c = TieredCache(LRUCache(4), DiskCache(self.cache_dir))
+        key = ['conversion', 'abc123', 'tree', ['tree1', 'node1'], [['format', None]]]
+        c.put(key, 'v')
+        self.assertEqual(c.get(list(key)), 'v')
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.now = [1000.0]
+        self.cache = TTLCache(4, ttl=60, clock=lambda: self.now[0])
+
+    def test_expiry(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2, ttl=10)
+        self.now[0] += 30
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('b'), None)
+        self.now[0] += 30
+        self.assertEqual(self.cache.get('a', 'gone'), 'gone')
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    for tc in (TestLRUCache, TestDiskCache, TestTieredCache, TestTTLCache):
+        testsuite.addTests(loader.loadTestsFromTestCase(tc))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,69 @@
+import unittest
+import os, sys
+from validation_cache import ValidationCache, validation_cache_key
+
+class _InvalidNexson(Exception):
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ValidationCache(max_items=4)
+        self.calls = []
+        self.adaptor = object()
+
+    def _validate(self):
+        self.calls.append(1)
+        nexson = {'nexml': {'@nexml2json': '1.2.1', '^ot:studyId': 'xy_1'}}
+        annotation = {'annotationEvent': {'@passedChecks': True}, 'agent': {'@name': 'peyotl'}}
+        return nexson, annotation, ['log'], self.adaptor
+
+    def _fail(self):
+        self.calls.append(1)
+        raise _InvalidNexson('Too many trees')
+
+    def test_key_ignores_serialization(self):
+        a = validation_cache_key({'a': 1, 'b': [1, 2]}, '1.2.1', 65)
+        b = validation_cache_key({'b': [1, 2], 'a': 1}, '1.2.1', 65)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, validation_cache_key({'a': 1, 'b': [1, 2]}, '0.0.0', 65))
+
+    def test_hit_skips_validation(self):
+        nexson, annotation, adaptor = self.cache.validate('k', self._validate, _InvalidNexson)
+        self.assertTrue(adaptor is self.adaptor)
+        nexson['nexml']['^ot:studyId'] = 'changed by the write'
+        annotation['agent']['@name'] = 'changed by the write'
+        cached = self.cache.validate('k', self._validate, _InvalidNexson)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(cached, self._validate()[:2] + (None, ))
+
+    def test_hit_returns_copies(self):
+        self.cache.validate('k', self._validate, _InvalidNexson)
+        first = self.cache.validate('k', self._validate, _InvalidNexson)
+        first[1]['annotationEvent']['@passedChecks'] = False
+        second = self.cache.validate('k', self._validate, _InvalidNexson)
+        self.assertEqual(second[1]['annotationEvent']['@passedChecks'], True)
+
+    def test_error_is_cached(self):
+        for i in range(2):
+            try:
+                self.cache.validate('k', self._fail, _InvalidNexson)
+                self.fail('no error raised')
+            except _InvalidNexson as x:
+                self.assertEqual(x.msg, 'Too many trees')
+        self.assertEqual(len(self.calls), 1)
+
+def suite():
+    loader = unittest.TestLoader()
+    testsuite = unittest.TestSuite()
+    testsuite.addTests(loader.loadTestsFromTestCase(TestValidationCache))
+    return testsuite
+
+def test_main():
+    testsuite = suite()
+    runner = unittest.TextTestRunner(sys.stdout, verbosity=2)
+    result = runner.run(testsuite)
+
+if __name__ == "__main__":
+    test_main()
@@ -0,0 +1,236 @@
+"""Simple caches for results that depend only on immutable inputs (for
+example, the output of converting the document with a given git blob SHA).
+
+Values handed back by these caches are shared between callers, so they
+must be treated as read-only.
+"""
+from collections import OrderedDict
+import threading
+import tempfile
+import hashlib
+import time
+import json
+import os
+
+
+class LRUCache(object):
+    "A thread-safe mapping holding at most `max_items` of the most recently used entries"
+    def __init__(self, max_items=128):
+        self.max_items = max_items
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._store.pop(key)
+            except KeyError:
+                return default
+            # re-insert to mark this as the most recently used entry
+            self._store[key] = value
+            return value
+
+    def put(self, key, value):
+        if self.max_items < 1:
+            return
+        with self._lock:
+            self._store.pop(key, None)
+            self._store[key] = value
+            while len(self._store) > self.max_items:
+                self._store.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._store.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._store
+
+    def __len__(self):
+        with self._lock:
+            return len(self._store)
+
+
+class TTLCache(object):
+    """A thread-safe mapping holding at most `max_items` entries, each of
+    which expires `ttl` seconds (or its own `ttl`) after it was stored"""
+    def __init__(self, max_items=1024, ttl=300.0, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = LRUCache(max_items)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if self._clock() >= expires:
+            self._entries.discard(key)
+            return default
+        return value
+
+    def put(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        self._entries.put(key, (self._clock() + ttl, value))
+
+    def discard(self, key):
+        self._entries.discard(key)
+
+
+def key_digest(key):
+    "Returns a hex digest that identifies a JSON-serializable `key`"
+    s = json.dumps(key, sort_keys=True)
+    if not isinstance(s, bytes):
+        s = s.encode('utf-8')
+    return hashlib.sha1(s).hexdigest()
+
+
+class DiskCache(object):
+    """Stores JSON-serializable values as files below `cache_dir`.
+
+    Each entry is written atomically to a file named by the digest of its key.
+    If `max_bytes` is given, the least recently used files are removed once
+    the directory grows past that size (checked every `prune_interval` writes).
+    """
+    def __init__(self, cache_dir, max_bytes=None, prune_interval=100):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another process may have created it first
+                if not os.path.isdir(cache_dir):
+                    raise
+
+    def path_for_key(self, key):
+        d = key_digest(key)
+        return os.path.join(self.cache_dir, d[:2], d + '.json')
+
+    def get(self, key, default=None):
+        fp = self.path_for_key(key)
+        try:
+            with open(fp, 'rb') as inp:
+                value = json.loads(inp.read().decode('utf-8'))
+        except (IOError, OSError):
+            return default
+        except ValueError:
+            # truncated or corrupted entry; drop it and treat as a miss
+            self._remove(fp)
+            return default
+        try:
+            # touch the file, so that pruning removes the least recently used entries
+            os.utime(fp, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        fp = self.path_for_key(key)
+        par = os.path.dirname(fp)
+        if not os.path.isdir(par):
+            try:
+                os.makedirs(par)
+            except OSError:
+                if not os.path.isdir(par):
+                    raise
+        content = json.dumps(value)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        handle, tmpfn = tempfile.mkstemp(suffix='.tmp', dir=par)
+        try:
+            os.write(handle, content)
+        finally:
+            os.close(handle)
+        os.rename(tmpfn, fp)
+        self._note_write()
+
+    def discard(self, key):
+        self._remove(self.path_for_key(key))
+
+    def _remove(self, fp):
+        try:
+            os.unlink(fp)
+        except OSError:
+            pass
+
+    def _note_write(self):
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            self._writes_since_prune += 1
+            if self._writes_since_prune < self.prune_interval:
+                return
+            self._writes_since_prune = 0
+        self.prune()
+
+    def prune(self):
+        "Removes the least recently used entries until the cache fits in `max_bytes`"
+        if self.max_bytes is None:
+            return
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for fn in filenames:
+                fp = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fp))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for mtime, size, fp in entries:
+            self._remove(fp)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class TieredCache(object):
+    """An LRUCache in front of an (optional) DiskCache.
+
+    Disk hits are promoted to the memory tier; writes go to both tiers.
+    Keys may be any JSON-serializable value (including lists); the memory
+    tier is keyed by their key_digest.
+    """
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        digest = key_digest(key)
+        value = self.memory.get(digest)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(digest, value)
+                return value
+        return default
+
+    def put(self, key, value):
+        self.memory.put(key_digest(key), value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except (IOError, OSError):
+                # a full or unwritable disk tier should not break the caller
+                pass
+
+    def discard(self, key):
+        self.memory.discard(key_digest(key))
+        if self.disk is not None:
+            self.disk.discard(key)
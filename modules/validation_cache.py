@@ -0,0 +1,47 @@
+"""Remembers the outcome of validating (and converting) uploaded NexSON, so
+that re-submitting identical content (e.g. repeated autosaves of an
+unchanged study) is validated only once.
+
+Only immutable results are kept: the converted NexSON (serialized, since a
+write modifies it) and the annotation, or the message of the validation
+error. Each hit returns new copies of them.
+"""
+from tiered_cache import LRUCache
+import hashlib
+import json
+
+
+def validation_cache_key(nexson, repo_nexml2json, max_num_trees):
+    """Returns the key of the validation of `nexson` (before it is validated
+    or converted), which is the same for any serialization of the same content."""
+    canonical = json.dumps(nexson, sort_keys=True, separators=(',', ':'))
+    if not isinstance(canonical, bytes):
+        canonical = canonical.encode('utf-8')
+    return ('validation', hashlib.sha1(canonical).hexdigest(), repo_nexml2json, max_num_trees)
+
+
+class ValidationCache(object):
+    "A thread-safe cache of the outcomes of validation, holding at most `max_items` of them"
+    def __init__(self, max_items=32):
+        self._cache = LRUCache(max_items)
+
+    def validate(self, key, validate_fn, error_class):
+        """Returns (converted NexSON, annotation, adaptor) for the upload with
+        `key`, calling validate_fn() only if its outcome is not cached.
+        validate_fn returns (converted NexSON, annotation, validation log,
+        adaptor) or raises `error_class`, which has the message of the error
+        as its `msg` (and is raised again, with the same message, on a hit).
+        The adaptor is None when the outcome was cached."""
+        cached = self._cache.get(key)
+        if cached is None:
+            try:
+                nexson, annotation, validation_log, adaptor = validate_fn()
+            except error_class as err:
+                self._cache.put(key, {'error': err.msg})
+                raise
+            self._cache.put(key, {'nexson': json.dumps(nexson),
+                                  'annotation': json.dumps(annotation)})
+            return nexson, annotation, adaptor
+        if 'error' in cached:
+            raise error_class(cached['error'])
+        return json.loads(cached['nexson']), json.loads(cached['annotation']), None
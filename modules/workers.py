@@ -0,0 +1,94 @@
+"""The process-wide worker pools of the API and the registry of the
+background jobs that run on them (see jobs and fanout), each created (from
+its settings in the config file) on first use.
+"""
+from fanout import WorkerPool
+from jobs import JobRegistry
+from commit_coalescer import CommitCoalescer
+from api_config import read_settings, get_logger
+import threading
+import os
+
+_WORKER_POOLS = {}
+_WORKER_POOLS_LOCK = threading.Lock()
+def get_worker_pool(name, max_workers):
+    "Returns the process-wide WorkerPool called `name`, creating it on first use"
+    try:
+        return _WORKER_POOLS[name]
+    except KeyError:
+        pass
+    with _WORKER_POOLS_LOCK:
+        if name not in _WORKER_POOLS:
+            _WORKER_POOLS[name] = WorkerPool(max_workers, name=name)
+    return _WORKER_POOLS[name]
+
+def get_enrichment_pool(request):
+    """Returns the process-wide WorkerPool used to run the independent steps
+    of a full-study GET (version history, comment HTML, duplicate DOI lookup,
+    shard name) concurrently.
+    """
+    return get_worker_pool('ot-study-get', read_settings(request, 'enrichment')[0])
+
+def get_batch_pool(request):
+    "Returns the process-wide WorkerPool that reads the studies of batch fetches"
+    return get_worker_pool('ot-study-batch', read_settings(request, 'batch')[0])
+
+def get_import_job_pool(request):
+    "Returns the process-wide WorkerPool that runs TreeBASE imports"
+    return get_worker_pool('ot-import-jobs', read_settings(request, 'treebase_import')[3])
+
+def get_write_job_pool(request):
+    "Returns the process-wide WorkerPool that commits asynchronous writes"
+    return get_worker_pool('ot-write-jobs', read_settings(request, 'jobs')[1])
+
+def get_merge_pool(request, git_action):
+    """Returns the process-wide single-thread WorkerPool that makes the
+    deferred merges to master (PUTs with defer_merge=true) of the shard of
+    `git_action`, so that they are made one at a time and in order"""
+    return get_worker_pool('ot-merge-{}'.format(os.path.basename(git_action.repo)), 1)
+
+_BACKGROUND_PENDING = set()
+_BACKGROUND_PENDING_LOCK = threading.Lock()
+def run_once_in_background(request, pool_name, key, fn, *args):
+    """Runs fn(*args) on the WorkerPool `pool_name`, unless a job with the
+    same `key` is already waiting or running. Failures are logged."""
+    with _BACKGROUND_PENDING_LOCK:
+        if key in _BACKGROUND_PENDING:
+            return
+        _BACKGROUND_PENDING.add(key)
+    def _run():
+        try:
+            fn(*args)
+        except:
+            _LOG = get_logger(request, 'ot_api')
+            _LOG.exception('background job {} failed'.format(key))
+        finally:
+            with _BACKGROUND_PENDING_LOCK:
+                _BACKGROUND_PENDING.discard(key)
+    get_worker_pool(pool_name, 2).submit(_run)
+
+_JOB_REGISTRY = None
+def get_job_registry(request):
+    "Returns the JobRegistry of the background jobs started by requests (e.g. asynchronous writes)"
+    global _JOB_REGISTRY
+    if _JOB_REGISTRY is None:
+        _JOB_REGISTRY = JobRegistry(read_settings(request, 'jobs')[0])
+    return _JOB_REGISTRY
+
+def compose_job_status_url(request, job_id):
+    return '{p}://{d}/{a}/v1/jobs/{j}'.format(p=request.env.wsgi_url_scheme,
+                                               d=request.env.http_host,
+                                               a=request.application,
+                                               j=job_id)
+
+_COMMIT_COALESCER = None
+def get_commit_coalescer(request):
+    """Returns the process-wide CommitCoalescer that folds rapid successive
+    saves of a study by one curator (PUTs with coalesce=true) into one commit"""
+    global _COMMIT_COALESCER
+    if _COMMIT_COALESCER is None:
+        jobs_dir = read_settings(request, 'jobs')[0]
+        _COMMIT_COALESCER = CommitCoalescer(get_job_registry(request),
+                                            os.path.join(jobs_dir, 'coalescing'),
+                                            read_settings(request, 'commit_coalescing'))
+    return _COMMIT_COALESCER
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+import sys, os
+import json
+import requests
+from opentreetesting import test_http_json_method, config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/studies/batch'
+data = {'studies': ['10',
+                    {'id': '10', 'tree': 'tree3', 'format': 'newick'},
+                    'bogus_study_id_999999']}
+r = requests.post(SUBMIT_URI,
+                  data=json.dumps(data),
+                  headers={'content-type': 'application/json'})
+if r.status_code != 200:
+    sys.stderr.write('POST "{}" returned {}\n'.format(SUBMIT_URI, r.status_code))
+    sys.exit(1)
+if not r.headers.get('content-type', '').startswith('application/x-ndjson'):
+    sys.stderr.write('Expected NDJSON, got "{}"\n'.format(r.headers.get('content-type')))
+    sys.exit(1)
+lines = [json.loads(line) for line in r.text.split('\n') if line.strip()]
+if len(lines) != 3:
+    sys.stderr.write('Expected 3 lines, got {}\n'.format(len(lines)))
+    sys.exit(1)
+study, tree, missing = lines
+# the items are returned in the order requested
+if study['id'] != '10' or study.get('tree') is not None or 'nexml' not in study.get('data', {}):
+    sys.stderr.write('Unexpected first line: {}\n'.format(str(study)[:200]))
+    sys.exit(1)
+if tree['id'] != '10' or tree['tree'] != 'tree3' or not tree.get('data', '').startswith('('):
+    sys.stderr.write('Unexpected second line: {}\n'.format(str(tree)[:200]))
+    sys.exit(1)
+# a failed item has an error instead of data, and does not fail the others
+if 'error' not in missing or 'data' in missing:
+    sys.stderr.write('Unexpected third line: {}\n'.format(str(missing)[:200]))
+    sys.exit(1)
+# the body must be a list of IDs or of objects with an "id"
+r = test_http_json_method(SUBMIT_URI, 'POST', data={'studies': [{'tree': 'tree3'}]}, expected_status=400)
+if not r:
+    sys.exit(1)
+r = test_http_json_method(SUBMIT_URI, 'GET', expected_status=405)
+if not r:
+    sys.exit(1)
+sys.exit(0)
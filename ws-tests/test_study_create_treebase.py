@@ -5,6 +5,7 @@ import codecs
 import json
 import sys
 import os
+import time
 DOMAIN, auth_token = writable_api_host_and_oauth_or_exit(__file__)
 SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/'
 # refresh a timestamp so that the test generates a commit
@@ -20,9 +21,20 @@ data = { 'import_method' : 'import-method-TREEBASE_ID',
 r = test_http_json_method(SUBMIT_URI,
                          'POST',
                          data=data,
-                         expected_status=200,
+                         expected_status=202,
                          return_bool_data=True)
 if not r[0]:
     sys.exit(1)
 resp = r[1]
-print resp
+# the import runs as a background job; wait for it to finish
+for attempt in range(60):
+    r = test_http_json_method(resp['status_url'], 'GET', expected_status=200, return_bool_data=True)
+    if not r[0]:
+        sys.exit(1)
+    job = r[1]
+    if job['status'] not in ('queued', 'running'):
+        break
+    time.sleep(5)
+print job
+if job['status'] != 'done':
+    sys.exit(1)
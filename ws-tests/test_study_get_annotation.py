@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+import sys, os
+from opentreetesting import test_http_json_method, config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/10'
+r = test_http_json_method(DOMAIN + '/phylesystem/v1/repo_nexson_format', 'GET', expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+data = {'output_nexml2json': r[1]['nexml2json']}
+BULK_KEYS = ('otusById', 'treesById', 'otus', 'trees')
+def study_properties(data):
+    "The non-bulk nexml properties of study 10, which hold the validation annotation"
+    r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+    if not r[0]:
+        sys.exit(1)
+    nexml = r[1]['data']['nexml']
+    return dict((k, v) for k, v in nexml.items() if k not in BULK_KEYS)
+first = study_properties(data)
+if '^ot:annotationEvents' not in first:
+    sys.stderr.write('No validation annotation in the nexml keys {}\n'.format(first.keys()))
+    sys.exit(1)
+# the annotation of the same version of the study (from the annotation cache) is the same
+data['include_comment_html'] = 'false'
+second = study_properties(data)
+if first != second:
+    for k in set(first.keys()) | set(second.keys()):
+        if first.get(k) != second.get(k):
+            sys.stderr.write('"{}" differs between two GETs of "{}"\n'.format(k, SUBMIT_URI))
+    sys.exit(1)
+sys.exit(0)
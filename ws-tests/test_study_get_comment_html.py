@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+import sys, os
+from opentreetesting import test_http_json_method, config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/10'
+data = {'output_nexml2json':'1.2'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+comment_html = r[1].get('commentHTML')
+if comment_html is None:
+    sys.stderr.write('No commentHTML in the response to GET "{}"\n'.format(SUBMIT_URI))
+    sys.exit(1)
+# a second rendering (from the Markdown cache) is the same
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+if r[1].get('commentHTML') != comment_html:
+    sys.stderr.write('commentHTML changed between two GETs of "{}"\n'.format(SUBMIT_URI))
+    sys.exit(1)
+# the rendered comment can be skipped
+data['include_comment_html'] = 'false'
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+if 'commentHTML' in r[1] or 'data' not in r[1]:
+    sys.stderr.write('include_comment_html=false returned the keys {}\n'.format(r[1].keys()))
+    sys.exit(1)
+sys.exit(0)
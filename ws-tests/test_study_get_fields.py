@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+import sys, os
+from opentreetesting import test_http_json_method, config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/10'
+# the metadata, without the OTUs and trees
+data = {'output_nexml2json':'1.2', 'fields': 'meta,commentHTML'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+resp = r[1]
+nexml = resp['data']['nexml']
+if 'otusById' in nexml or 'treesById' in nexml or '^ot:studyId' not in nexml:
+    sys.stderr.write('fields=meta returned the nexml keys {}\n'.format(nexml.keys()))
+    sys.exit(1)
+if 'commentHTML' not in resp or 'versionHistory' in resp:
+    sys.stderr.write('fields=meta,commentHTML returned the keys {}\n'.format(resp.keys()))
+    sys.exit(1)
+# one tree
+data = {'output_nexml2json':'1.2', 'fields': 'tree:tree3'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+trees_by_id = r[1]['data']['nexml']['treesById']
+tree_ids = [t for tg in trees_by_id.values() for t in tg['treeById'].keys()]
+if tree_ids != ['tree3']:
+    sys.stderr.write('fields=tree:tree3 returned the trees {}\n'.format(tree_ids))
+    sys.exit(1)
+# only part of the wrapper: no data
+data = {'fields': 'versionHistory'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+if 'data' in r[1] or 'versionHistory' not in r[1]:
+    sys.stderr.write('fields=versionHistory returned the keys {}\n'.format(r[1].keys()))
+    sys.exit(1)
+# only whole studies (as JSON) can be projected
+r = test_http_json_method(SUBMIT_URI + '/tree/tree3', 'GET', data={'fields': 'meta'}, expected_status=400)
+if not r:
+    sys.exit(1)
+r = test_http_json_method(SUBMIT_URI, 'GET', data={'fields': 'meta', 'format': 'nexus'}, expected_status=400)
+if not r:
+    sys.exit(1)
+sys.exit(0)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+import sys, os
+import requests
+from opentreetesting import config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/10'
+data = {'output_nexml2json':'1.2'}
+r = requests.get(SUBMIT_URI, params=data)
+if r.status_code != 200:
+    sys.stderr.write('GET "{}" returned {}\n'.format(SUBMIT_URI, r.status_code))
+    sys.exit(1)
+etag = r.headers.get('ETag')
+if not etag:
+    sys.stderr.write('No ETag in the response to GET "{}"\n'.format(SUBMIT_URI))
+    sys.exit(1)
+# the same representation: 304, with no body
+r = requests.get(SUBMIT_URI, params=data, headers={'If-None-Match': etag})
+if r.status_code != 304 or r.content:
+    sys.stderr.write('Expected an empty 304 for If-None-Match: {}, got {}\n'.format(etag, r.status_code))
+    sys.exit(1)
+if r.headers.get('ETag') != etag:
+    sys.stderr.write('The 304 response has the ETag {}, not {}\n'.format(r.headers.get('ETag'), etag))
+    sys.exit(1)
+# another output format is another representation
+r = requests.get(SUBMIT_URI, params={'output_nexml2json':'0.0.0'}, headers={'If-None-Match': etag})
+if r.status_code != 200 or r.headers.get('ETag') == etag:
+    sys.stderr.write('Expected a 200 with a new ETag for another NexSON version, got {}\n'.format(r.status_code))
+    sys.exit(1)
+# a tree in another format
+TREE_URI = SUBMIT_URI + '/tree/tree3.tre'
+r = requests.get(TREE_URI)
+tree_etag = r.headers.get('ETag')
+if r.status_code != 200 or not tree_etag or tree_etag == etag:
+    sys.stderr.write('Expected a 200 with its own ETag for GET "{}", got {}\n'.format(TREE_URI, r.status_code))
+    sys.exit(1)
+r = requests.get(TREE_URI, headers={'If-None-Match': 'W/{}, "bogus"'.format(tree_etag)})
+if r.status_code != 304:
+    sys.stderr.write('Expected a 304 for a weak If-None-Match in a list, got {}\n'.format(r.status_code))
+    sys.exit(1)
+sys.exit(0)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import sys, os
+import time
+import requests
+from opentreetesting import test_http_json_method, config
+DOMAIN = config('host', 'apihost')
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study_list'
+data = {'limit': 2, 'include_summary': 'true'}
+# the first paged request may have to wait for the study index to be built
+for attempt in range(10):
+    r = requests.get(SUBMIT_URI, params=data)
+    if r.status_code != 503:
+        break
+    if 'Retry-After' not in r.headers:
+        sys.stderr.write('A 503 from "{}" without Retry-After\n'.format(SUBMIT_URI))
+        sys.exit(1)
+    time.sleep(10)
+if r.status_code != 200:
+    sys.stderr.write('GET "{}" returned {}\n'.format(SUBMIT_URI, r.status_code))
+    sys.exit(1)
+page = r.json()
+if page['offset'] != 0 or len(page['studies']) > 2 or page['total'] < len(page['studies']):
+    sys.stderr.write('Unexpected page: {}\n'.format(page))
+    sys.exit(1)
+for entry in page['studies']:
+    for key in ('id', 'shard', 'doi', 'year', 'curators', 'num_trees', 'num_otus', 'last_commit'):
+        if key not in entry:
+            sys.stderr.write('No "{}" in the summary {}\n'.format(key, entry))
+            sys.exit(1)
+# the next page starts where this one ended
+if page['total'] > 2:
+    if page['next_offset'] != 2:
+        sys.stderr.write('Expected next_offset 2, got {}\n'.format(page['next_offset']))
+        sys.exit(1)
+    r = test_http_json_method(SUBMIT_URI, 'GET', data={'limit': 2, 'offset': 2}, expected_status=200, return_bool_data=True)
+    if not r[0]:
+        sys.exit(1)
+    first_ids = [entry['id'] for entry in page['studies']]
+    if r[1]['offset'] != 2 or set(first_ids) & set(r[1]['studies']):
+        sys.stderr.write('The second page overlaps the first: {}\n'.format(r[1]))
+        sys.exit(1)
+elif page['next_offset'] is not None:
+    sys.stderr.write('Expected no next_offset, got {}\n'.format(page['next_offset']))
+    sys.exit(1)
+# without arguments, the list of every study ID
+r = test_http_json_method(SUBMIT_URI, 'GET', expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+if not isinstance(r[1], list) or len(r[1]) != page['total']:
+    sys.stderr.write('Expected a list of {} study IDs\n'.format(page['total']))
+    sys.exit(1)
+# bad paging and filter arguments
+for bad in ({'limit': -1}, {'offset': 'x'}, {'year': 'x'}):
+    r = test_http_json_method(SUBMIT_URI, 'GET', data=bad, expected_status=400)
+    if not r:
+        sys.exit(1)
+sys.exit(0)
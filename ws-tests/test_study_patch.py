@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+from opentreetesting import test_http_json_method, writable_api_host_and_oauth_or_exit
+import datetime
+import requests
+import json
+import sys
+import os
+DOMAIN, auth_token = writable_api_host_and_oauth_or_exit(__file__)
+study_id = '10'
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/' + study_id
+data = {'output_nexml2json':'1.0.0'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+starting_commit_SHA = r[1]['sha']
+params = {'auth_token': auth_token,
+          'starting_commit_SHA': starting_commit_SHA}
+PATCH_HEADERS = {'content-type': 'application/json-patch+json'}
+def put_patch(patch):
+    return requests.put(SUBMIT_URI, params=params, data=json.dumps(patch), headers=PATCH_HEADERS)
+# refresh a timestamp so that the test generates a commit
+timestamp = datetime.datetime.utcnow().isoformat()
+r = put_patch([{'op': 'add', 'path': '/nexml/^bogus_timestamp', 'value': timestamp}])
+if r.status_code != 200:
+    sys.stderr.write('PUT of a JSON Patch returned {}: {}\n'.format(r.status_code, r.text))
+    sys.exit(1)
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+if r[1]['data']['nexml'].get('^bogus_timestamp') != timestamp:
+    sys.stderr.write('The patched property was not saved\n')
+    sys.exit(1)
+# a patch that cannot be applied, or is not a patch at all
+for bad_patch in ([{'op': 'remove', 'path': '/nexml/^no_such_property'}],
+                  [{'op': 'frobnicate', 'path': '/nexml/^bogus_timestamp'}],
+                  {'op': 'add'}):
+    r = put_patch(bad_patch)
+    if r.status_code != 400:
+        sys.stderr.write('Expected 400 for the patch {}, got {}\n'.format(bad_patch, r.status_code))
+        sys.exit(1)
+# a failed "test" operation
+r = put_patch([{'op': 'test', 'path': '/nexml/^bogus_timestamp', 'value': 'not ' + timestamp}])
+if r.status_code != 409:
+    sys.stderr.write('Expected 409 for a failed test operation, got {}\n'.format(r.status_code))
+    sys.exit(1)
+sys.exit(0)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from opentreetesting import test_http_json_method, writable_api_host_and_oauth_or_exit
+import datetime
+import requests
+import json
+import sys
+import os
+DOMAIN, auth_token = writable_api_host_and_oauth_or_exit(__file__)
+study_id = '10'
+SUBMIT_URI = DOMAIN + '/phylesystem/v1/study/' + study_id
+data = {'output_nexml2json':'1.0.0'}
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+starting_commit_SHA = r[1]['sha']
+params = {'auth_token': auth_token,
+          'starting_commit_SHA': starting_commit_SHA}
+PATCH_HEADERS = {'content-type': 'application/json-patch+json'}
+def patch(body):
+    return requests.patch(SUBMIT_URI, params=params, data=json.dumps(body), headers=PATCH_HEADERS)
+# web2py parses application/json* bodies into request.vars; a top-level array
+#   of pairs would replace the query string arguments if they were read from
+#   there. This is not a valid patch, so it must fail to apply (400), not fail
+#   on the bogus starting_commit_SHA or auth_token.
+r = patch([['starting_commit_SHA', '0' * 40], ['auth_token', 'bogus']])
+if r.status_code != 400 or 'Could not apply the JSON Patch' not in r.text:
+    sys.stderr.write('Expected the body to be read as a patch only, got {}: {}\n'.format(r.status_code, r.text))
+    sys.exit(1)
+# a real PATCH with a two-member operation (which also looks like a pair);
+#   the refreshed timestamp makes it generate a commit
+timestamp = datetime.datetime.utcnow().isoformat()
+r = patch([{'op': 'add', 'path': '/nexml/^bogus_timestamp', 'value': timestamp},
+           {'op': 'add', 'path': '/nexml/^bogus_scratch', 'value': timestamp},
+           {'op': 'remove', 'path': '/nexml/^bogus_scratch'}])
+if r.status_code != 200:
+    sys.stderr.write('PATCH returned {}: {}\n'.format(r.status_code, r.text))
+    sys.exit(1)
+r = test_http_json_method(SUBMIT_URI, 'GET', data=data, expected_status=200, return_bool_data=True)
+if not r[0]:
+    sys.exit(1)
+nexml = r[1]['data']['nexml']
+if nexml.get('^bogus_timestamp') != timestamp or '^bogus_scratch' in nexml:
+    sys.stderr.write('The PATCH was not applied\n')
+    sys.exit(1)
+sys.exit(0)